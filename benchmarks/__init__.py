@@ -0,0 +1,11 @@
+"""
+Benchmarks for the Shoply API.
+
+Each module is a standalone script that runs against a throwaway test
+database created from the configured ``DATABASES`` setting, e.g.::
+
+    python -m benchmarks.checkout
+
+``benchmarks.suite`` runs the main API flows together under concurrent load
+and saves the results as JSON for comparing commits.
+"""
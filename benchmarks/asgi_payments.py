@@ -0,0 +1,234 @@
+"""
+Concurrent in-flight payments one process sustains under WSGI and ASGI.
+
+Pays ``--payments`` orders through ``order-payment`` at each
+``--concurrency`` level (clients that each wait for their response before
+sending the next), with a payment processor that answers after
+``--latency`` ms. Requests go straight into Django's own handlers, each
+setup in a process of its own as it would be deployed:
+
+- ``wsgi``: ``WSGIHandler`` on ``--threads`` threads, like a gunicorn
+  gthread worker, serving the sync ``PaymentView``
+- ``asgi-sync``: ``ASGIHandler`` on one event loop with the sync views
+- ``asgi``: ``ASGIHandler`` with ``AsyncPaymentView`` (``ASYNC_VIEWS``)
+
+::
+
+    python -m benchmarks.asgi_payments --concurrency 8 32 64 --payments 256 --latency 200 --threads 8
+
+Besides throughput and latency it reports the most charges waiting on the
+processor at once and the most threads alive. Under ASGI the sync parts of
+each request run on a thread of the request's own, which holds a database
+connection until the response is sent, so keep ``--concurrency`` below the
+database's connection limit. Run against PostgreSQL; SQLite serialises the
+order updates.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.util import setup_testing_defaults
+
+from benchmarks.utils import benchmark_database, percentile, print_table, setup_django
+
+SETUPS = {'wsgi': 'False', 'asgi-sync': 'False', 'asgi': 'True'}  # setup -> ASYNC_VIEWS
+
+
+class SlowPaymentClient:
+    """Payment client that answers after ``latency`` seconds and tracks the charges waiting on it."""
+    latency = 0.2
+    in_flight = peak_in_flight = peak_threads = 0
+    _lock = threading.Lock()
+
+    @classmethod
+    def reset(cls):
+        cls.in_flight = cls.peak_in_flight = cls.peak_threads = 0
+
+    @classmethod
+    def started(cls):
+        with cls._lock:
+            cls.in_flight += 1
+            cls.peak_in_flight = max(cls.peak_in_flight, cls.in_flight)
+            cls.peak_threads = max(cls.peak_threads, threading.active_count())
+
+    @classmethod
+    def finished(cls):
+        with cls._lock:
+            cls.in_flight -= 1
+
+    def charge(self, amount, description, source, idempotency_key=None):
+        self.started()
+        try:
+            time.sleep(self.latency)
+        finally:
+            self.finished()
+        return f'ch_bench_{uuid.uuid4().hex[:16]}'
+
+    async def acharge(self, amount, description, source, idempotency_key=None):
+        self.started()
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.finished()
+        return f'ch_bench_{uuid.uuid4().hex[:16]}'
+
+
+def call_wsgi(app, path, body, headers):
+    environ = {
+        'REQUEST_METHOD': 'POST',
+        'PATH_INFO': path,
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+        **{'CONTENT_TYPE' if name == 'Content-Type' else f'HTTP_{name.upper().replace("-", "_")}': value
+           for name, value in headers.items()},
+    }
+    setup_testing_defaults(environ)
+    statuses = []
+    result = app(environ, lambda status, response_headers, exc_info=None: statuses.append(int(status[:3])))
+    try:
+        b''.join(result)
+    finally:
+        result.close()  # request_finished closes this thread's connection
+    return statuses[0]
+
+
+async def call_asgi(app, path, body, headers):
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+        'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+        + [(b'content-length', str(len(body)).encode())],
+        'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+    pending = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = asyncio.Event()
+    statuses = []
+
+    async def receive():
+        if pending:
+            return pending.pop()
+        await sent.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            statuses.append(message['status'])
+        elif not message.get('more_body'):
+            sent.set()
+
+    await app(scope, receive, send)
+    return statuses[0]
+
+
+async def drive(call, order_ids, concurrency):
+    """Pay ``order_ids`` from ``concurrency`` clients; return latencies (ms), errors and seconds taken."""
+    remaining = iter(order_ids)
+    samples, errors = [], []
+
+    async def client():
+        for order_id in remaining:
+            started = time.perf_counter()
+            status = await call(json.dumps({'order_id': order_id, 'token': 'tok_visa'}).encode())
+            if status == 200:
+                samples.append((time.perf_counter() - started) * 1000)
+            else:
+                errors.append(status)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return samples, errors, time.perf_counter() - started
+
+
+def run_setup(setup, levels, payments, threads):
+    """Run every concurrency level against one handler and return a result row per level."""
+    from django.conf import settings
+    from django.contrib.auth import get_user_model
+    from django.core.asgi import get_asgi_application
+    from django.core.wsgi import get_wsgi_application
+    from django.urls import reverse
+    from orders.models import Order
+    from users.authentication import ClaimsRefreshToken
+
+    settings.PAYMENT_CLIENT = f'{__name__}.SlowPaymentClient'
+    user = get_user_model().objects.create_user(username='payer', email='payer@example.com', password='payer')
+    path = reverse('order-payment')
+    headers = {'Host': 'testserver', 'Content-Type': 'application/json',
+               'Authorization': f'Bearer {ClaimsRefreshToken.for_user(user).access_token}'}
+
+    if setup == 'wsgi':
+        app, server = get_wsgi_application(), ThreadPoolExecutor(max_workers=threads)
+
+        async def call(body):
+            return await asyncio.get_running_loop().run_in_executor(server, call_wsgi, app, path, body, headers)
+    else:
+        app = get_asgi_application()
+
+        async def call(body):
+            return await call_asgi(app, path, body, headers)
+
+    rows = []
+    for concurrency in [1] + levels:  # The first round warms up
+        order_ids = [order.pk for order in Order.objects.bulk_create(
+            [Order(user=user, total_price=10) for _ in range(payments if concurrency > 1 else threads)]
+        )]
+        SlowPaymentClient.reset()
+        samples, errors, elapsed = asyncio.run(drive(call, order_ids, concurrency))
+        paid = Order.objects.filter(pk__in=order_ids, is_paid=True).count()
+        assert paid == len(samples), (paid, len(samples))
+        if concurrency > 1:
+            rows.append({
+                'setup': setup, 'clients': concurrency, 'paid': len(samples), 'errors': len(errors),
+                'seconds': elapsed, 'payments_per_second': len(samples) / elapsed if elapsed else 0.0,
+                'p50_ms': percentile(samples, 50) if samples else 0.0,
+                'p95_ms': percentile(samples, 95) if samples else 0.0,
+                'peak_in_flight': SlowPaymentClient.peak_in_flight, 'peak_threads': SlowPaymentClient.peak_threads,
+            })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[8, 32, 64])
+    parser.add_argument('--payments', type=int, default=256, help="Payments per concurrency level.")
+    parser.add_argument('--latency', type=float, default=200, help="Payment processor latency in ms.")
+    parser.add_argument('--threads', type=int, default=8, help="WSGI worker threads.")
+    parser.add_argument('--setups', nargs='+', choices=SETUPS, default=list(SETUPS))
+    parser.add_argument('--setup', choices=SETUPS, help=argparse.SUPPRESS)  # Run one setup in this process
+    args = parser.parse_args()
+
+    if args.setup:
+        SlowPaymentClient.latency = args.latency / 1000
+        setup_django()
+        with benchmark_database():
+            rows = run_setup(args.setup, args.concurrency, args.payments, args.threads)
+        print(json.dumps(rows))
+        return
+
+    rows = []
+    for setup in args.setups:
+        command = [sys.executable, '-m', 'benchmarks.asgi_payments', '--setup', setup,
+                   '--concurrency', *map(str, args.concurrency), '--payments', str(args.payments),
+                   '--latency', str(args.latency), '--threads', str(args.threads)]
+        result = subprocess.run(command, env={**os.environ, 'ASYNC_VIEWS': SETUPS[setup]},
+                                stdout=subprocess.PIPE, text=True, check=True)
+        rows.extend(json.loads(result.stdout.splitlines()[-1]))
+
+    print(f"{args.payments} payments per level, processor latency {args.latency:g} ms, "
+          f"{args.threads} WSGI threads")
+    print_table(
+        ['setup', 'clients', 'paid', 'errors', 'total s', 'payments/s', 'p50 ms', 'p95 ms', 'peak in flight',
+         'peak threads'],
+        [(row['setup'], row['clients'], row['paid'], row['errors'], row['seconds'], row['payments_per_second'],
+          row['p50_ms'], row['p95_ms'], row['peak_in_flight'], row['peak_threads']) for row in rows],
+    )
+
+
+if __name__ == '__main__':
+    main()
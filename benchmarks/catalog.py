@@ -0,0 +1,107 @@
+"""
+Catalog listing latency on a large synthetic catalog.
+
+Seeds ``--rows`` products (1M by default) and measures ``ProductListView``
+with caching disabled for each supported filter and sort, on the first page
+and after following ``--depth`` next links::
+
+    python -m benchmarks.catalog --rows 1000000 --depth 50
+"""
+import argparse
+import random
+from datetime import timedelta
+
+from benchmarks.utils import benchmark_database, explicit_timestamps, measure, print_table, setup_django
+
+WORDS = ['wireless', 'gaming', 'laptop', 'mouse', 'keyboard', 'monitor', 'usb', 'cable', 'stand',
+         'headset', 'speaker', 'charger', 'camera', 'phone', 'case', 'adapter', 'ssd', 'router']
+
+SCENARIOS = [
+    ('newest', {}),
+    ('price asc', {'ordering': 'price'}),
+    ('name asc', {'ordering': 'name'}),
+    ('price range', {'min_price': '100', 'max_price': '200', 'ordering': 'price'}),
+    ('in stock', {'in_stock': 'true'}),
+    ('created window', {'created_after': '-30', 'created_before': '-10'}),
+]
+
+
+def seed(rows, batch_size=10000):
+    from django.utils import timezone
+    from products.models import Product
+
+    rng = random.Random(42)
+    now = timezone.now()
+    with explicit_timestamps(Product, 'created_at', 'updated_at'):
+        for start in range(0, rows, batch_size):
+            batch = []
+            for n in range(start, min(start + batch_size, rows)):
+                created = now - timedelta(minutes=rng.randrange(365 * 24 * 60))
+                batch.append(Product(
+                    name=' '.join(rng.sample(WORDS, 3)).title(),
+                    price=rng.randrange(100, 100000) / 100,
+                    stock=rng.choice([0, 0, rng.randrange(1, 500)]),
+                    created_at=created,
+                    updated_at=created,
+                ))
+            Product.objects.bulk_create(batch)
+    return now
+
+
+def run(rows, depth, repeat):
+    from django.test import override_settings
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    now = seed(rows)
+    client = APIClient()
+    url = reverse('product-list')
+
+    def resolve(params):
+        # Relative day offsets keep the created_at window inside the seeded range
+        resolved = dict(params)
+        for key in ('created_after', 'created_before'):
+            if key in resolved:
+                resolved[key] = (now + timedelta(days=int(resolved[key]))).isoformat()
+        return resolved
+
+    def fetch(target, params=None):
+        response = client.get(target, params)
+        assert response.status_code == 200, response.data
+        return response
+
+    results = []
+    with override_settings(CATALOG_CACHE_TIMEOUT=0):
+        for name, params in SCENARIOS:
+            params = resolve(params)
+            first = measure(lambda: fetch(url, params), repeat)
+
+            # Walk to the requested depth, then time that page
+            next_url = None
+            response = fetch(url, params)
+            for _ in range(depth):
+                if not response.data['next']:
+                    break
+                next_url = response.data['next']
+                response = fetch(next_url)
+            deep = measure(lambda: fetch(next_url), repeat) if next_url else first
+
+            results.append((name, first['p50_ms'], first['p95_ms'], deep['p50_ms'], deep['p95_ms']))
+
+    print_table(['scenario', 'page 1 p50 ms', 'page 1 p95 ms', f'page {depth + 1} p50 ms', f'page {depth + 1} p95 ms'], results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--depth', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        run(args.rows, args.depth, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Checkout latency for carts of different sizes.
+
+Posts orders with 1, 10 and 100 lines through ``OrderCreateView`` and reports
+latency and the number of SQL queries per checkout::
+
+    python -m benchmarks.checkout --repeat 50
+"""
+import argparse
+
+from benchmarks.utils import benchmark_database, measure, print_table, setup_django
+
+
+def run(cart_sizes, repeat):
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+    from products.models import Product
+
+    user = get_user_model().objects.create_user(username='bench', email='bench@example.com', password='bench')
+    products = Product.objects.bulk_create([
+        Product(name=f'Product {i}', price=10, stock=10 ** 9) for i in range(max(cart_sizes))
+    ])
+    client = APIClient()
+    client.force_authenticate(user=user)
+    url = reverse('order-create')
+
+    rows = []
+    for size in cart_sizes:
+        payload = {'items': [{'product': p.id, 'quantity': 1, 'price': '10.00'} for p in products[:size]]}
+
+        def checkout():
+            response = client.post(url, payload, format='json')
+            assert response.status_code == 201, response.data
+
+        with CaptureQueriesContext(connection) as ctx:
+            checkout()
+        # Read the count now: every request resets the connection's query log.
+        queries = len(ctx.captured_queries)
+        stats = measure(checkout, repeat)
+        rows.append((size, repeat, stats['mean_ms'], stats['p50_ms'], stats['p95_ms'], queries))
+
+    print_table(['lines', 'runs', 'mean ms', 'p50 ms', 'p95 ms', 'queries'], rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        run(args.sizes, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
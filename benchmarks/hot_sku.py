@@ -0,0 +1,102 @@
+"""
+Checkout throughput on a single hot SKU.
+
+Runs concurrent checkouts of one product from a pool of threads, each with
+its own test client and database connection, first with the stock on the
+product row and then with the product sharded across ``--shards`` counters::
+
+    python -m benchmarks.hot_sku --threads 16 --checkouts 50 --shards 8
+
+Row locks only contend on a database with row-level locking, so run it
+against PostgreSQL; SQLite locks the whole database on every write.
+"""
+import argparse
+import threading
+import time
+
+from benchmarks.utils import benchmark_database, percentile, print_table, setup_django
+
+
+def run_checkouts(product, users, checkouts):
+    """Have every user check out ``product`` ``checkouts`` times in parallel."""
+    from django.db import DatabaseError, connection
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    url = reverse('order-create')
+    payload = {'items': [{'product': product.id, 'quantity': 1, 'price': str(product.price)}]}
+    samples, errors = [], []
+    start_line = threading.Barrier(len(users))
+
+    def worker(user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        start_line.wait()
+        try:
+            for _ in range(checkouts):
+                started = time.perf_counter()
+                try:
+                    response = client.post(url, payload, format='json')
+                except DatabaseError as e:
+                    errors.append(e)
+                    continue
+                if response.status_code == 201:
+                    samples.append((time.perf_counter() - started) * 1000)
+                else:
+                    errors.append(response.status_code)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(user,)) for user in users]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, errors, time.perf_counter() - started
+
+
+def run(threads, checkouts, shards):
+    from django.contrib.auth import get_user_model
+    from products.inventory import shard_product
+    from products.models import Product
+
+    users = [
+        get_user_model().objects.create_user(username=f'bench{i}', email=f'bench{i}@example.com', password='bench')
+        for i in range(threads)
+    ]
+    stock = threads * checkouts
+
+    rows = []
+    for mode in ('row lock', f'{shards} shards'):
+        product = Product.objects.create(name=f'Hot SKU ({mode})', price=10, stock=stock)
+        if mode != 'row lock':
+            product = shard_product(product, shards)
+
+        samples, errors, elapsed = run_checkouts(product, users, checkouts)
+        remaining = Product.objects.with_available_stock().get(pk=product.pk).available_stock
+        assert remaining == stock - len(samples), (remaining, stock, len(samples))
+        rows.append((
+            mode, threads, len(samples), len(errors), elapsed * 1000,
+            len(samples) / elapsed if elapsed else 0.0,
+            percentile(samples, 50) if samples else 0.0,
+            percentile(samples, 95) if samples else 0.0,
+        ))
+
+    print_table(['stock', 'threads', 'orders', 'errors', 'total ms', 'orders/s', 'p50 ms', 'p95 ms'], rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--checkouts', type=int, default=25, help="Checkouts per thread.")
+    parser.add_argument('--shards', type=int, default=8)
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        run(args.threads, args.checkouts, args.shards)
+
+
+if __name__ == '__main__':
+    main()
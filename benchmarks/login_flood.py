@@ -0,0 +1,125 @@
+"""
+Login throughput under a credential-stuffing flood.
+
+Legitimate clients log in with the right password, each user from its own
+IP, while attacker threads spray wrong passwords at random usernames from a
+handful of IPs. Each phase runs for ``--seconds``: no attack, the attack
+with throttling disabled, and the attack with the configured limits::
+
+    python -m benchmarks.login_flood --clients 4 --attackers 8 --seconds 10
+
+Throttled attempts are refused before ``authenticate()`` hashes anything,
+so legitimate throughput recovers most of what the unthrottled flood costs;
+the 429s themselves still take CPU, as clients and server share a process.
+``--iterations`` sets the PBKDF2 cost for the run. Login writes an
+outstanding-token row, so use PostgreSQL; SQLite serialises the writes.
+"""
+import argparse
+import itertools
+import logging
+import random
+import threading
+import time
+
+from benchmarks.utils import benchmark_database, percentile, print_table, setup_django
+
+
+def run_phase(users, clients, attackers, attacker_ips, seconds):
+    """Run legitimate and attacking threads for ``seconds``; return per-side stats."""
+    from django.db import connection
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    url = reverse('login')
+    legit, attack = [], []
+    next_user = itertools.cycle(range(len(users))).__next__
+    user_lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def legit_worker():
+        client = APIClient()
+        try:
+            while time.perf_counter() < deadline:
+                with user_lock:
+                    n = next_user()
+                started = time.perf_counter()
+                response = client.post(url, {'username': users[n], 'password': 'flood-Pass1!'},
+                                       REMOTE_ADDR=f'10.1.{n // 250}.{n % 250}')
+                legit.append((response.status_code, (time.perf_counter() - started) * 1000))
+        finally:
+            connection.close()
+
+    def attack_worker(n):
+        client = APIClient()
+        ip = f'10.9.9.{n % attacker_ips}'
+        try:
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                response = client.post(url, {'username': f'victim{random.randrange(10 ** 6)}', 'password': 'guess'},
+                                       REMOTE_ADDR=ip)
+                attack.append((response.status_code, (time.perf_counter() - started) * 1000))
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=legit_worker) for _ in range(clients)]
+    threads += [threading.Thread(target=attack_worker, args=(n,)) for n in range(attackers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return legit, attack
+
+
+def run(clients, attackers, attacker_ips, seconds, iterations, user_count):
+    from django.conf import settings
+    from django.contrib.auth import get_user_model
+    from django.test import override_settings
+    from users.throttling import get_throttle_backend
+
+    hash_params = {**settings.PASSWORD_HASHER_PARAMS, 'pbkdf2_sha256': {'iterations': iterations}}
+    unthrottled = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}}
+    with override_settings(PASSWORD_HASHER_PARAMS=hash_params):
+        User = get_user_model()
+        template = User(is_verified=True)
+        template.set_password('flood-Pass1!')
+        User.objects.bulk_create([
+            User(username=f'flood{n}', email=f'flood{n}@example.com', is_verified=True, password=template.password)
+            for n in range(user_count)
+        ])
+        users = [f'flood{n}' for n in range(user_count)]
+
+        rows = []
+        for phase, attacking, rates in (('no attack', 0, None), ('attack, unthrottled', attackers, unthrottled),
+                                        ('attack, throttled', attackers, None)):
+            get_throttle_backend().clear()
+            with override_settings(**({'REST_FRAMEWORK': rates} if rates else {})):
+                legit, attack = run_phase(users, clients, attacking, attacker_ips, seconds)
+            ok = [ms for code, ms in legit if code == 200]
+            rows.append((
+                phase, len(ok) / seconds,
+                percentile(ok, 50) if ok else 0.0, percentile(ok, 95) if ok else 0.0,
+                len(legit) - len(ok), len(attack), sum(1 for code, _ in attack if code == 429),
+            ))
+
+    print(f"PBKDF2 {iterations} iterations, {clients} clients, {attackers} attackers on {attacker_ips} IPs")
+    print_table(['phase', 'logins/s', 'p50 ms', 'p95 ms', 'failed logins', 'attack reqs', 'attack 429s'], rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=4, help="Threads logging in legitimately.")
+    parser.add_argument('--attackers', type=int, default=8, help="Threads spraying bad passwords.")
+    parser.add_argument('--attacker-ips', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10, help="Length of each phase.")
+    parser.add_argument('--iterations', type=int, default=100000, help="PBKDF2 iterations for the run.")
+    parser.add_argument('--users', type=int, default=1000, help="Accounts the legitimate clients cycle through.")
+    args = parser.parse_args()
+
+    setup_django()
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)  # one 400/429 warning per attack request
+    with benchmark_database():
+        run(args.clients, args.attackers, args.attacker_ips, args.seconds, args.iterations, args.users)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Deep-page latency of order history: page numbers versus keyset cursors.
+
+Seeds one heavy buyer and fetches the same pages through ``OrderListView``
+with ``?page=N`` (LIMIT/OFFSET) and with ``?pagination=cursor`` (keyset on
+``(created_at, id)``)::
+
+    python -m benchmarks.order_history --orders 20000 --pages 1 10 100 1000
+"""
+import argparse
+from datetime import timedelta
+
+from benchmarks.utils import benchmark_database, explicit_timestamps, measure, print_table, setup_django
+
+PAGE_SIZE = 10
+
+
+def seed(orders):
+    from django.contrib.auth import get_user_model
+    from django.utils import timezone
+    from orders.models import Order
+
+    user = get_user_model().objects.create_user(username='buyer', email='buyer@example.com', password='buyer')
+    now = timezone.now()
+    with explicit_timestamps(Order, 'created_at'):
+        for start in range(0, orders, 5000):
+            Order.objects.bulk_create([
+                Order(user=user, created_at=now - timedelta(minutes=n), total_price=10)
+                for n in range(start, min(start + 5000, orders))
+            ])
+    return user
+
+
+def cursor_for_page(page):
+    """Build the cursor a client would hold after walking to ``page``."""
+    from rest_framework.pagination import Cursor
+    from orders.models import Order
+    from orders.views import OrderCursorPagination
+
+    paginator = OrderCursorPagination()
+    boundary = Order.objects.order_by(*paginator.ordering)[(page - 1) * PAGE_SIZE - 1]
+    paginator.base_url = ''
+    position = paginator._get_position_from_instance(boundary, paginator.ordering)
+    return paginator.encode_cursor(Cursor(offset=0, reverse=False, position=position)).split('cursor=')[1]
+
+
+def run(orders, pages, repeat):
+    from urllib.parse import unquote
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    client = APIClient()
+    client.force_authenticate(user=seed(orders))
+    url = reverse('order-list')
+
+    def fetch(params):
+        response = client.get(url, params)
+        assert response.status_code == 200 and len(response.data['results']) == PAGE_SIZE, response.data
+
+    rows = []
+    for page in pages:
+        if page * PAGE_SIZE > orders:
+            continue
+        offset_params = {'page': page, 'page_size': PAGE_SIZE}
+        cursor_params = {'pagination': 'cursor', 'page_size': PAGE_SIZE}
+        if page > 1:
+            cursor_params['cursor'] = unquote(cursor_for_page(page))
+
+        offset_stats = measure(lambda: fetch(offset_params), repeat)
+        cursor_stats = measure(lambda: fetch(cursor_params), repeat)
+        rows.append((page, offset_stats['p50_ms'], offset_stats['p95_ms'], cursor_stats['p50_ms'], cursor_stats['p95_ms']))
+
+    print_table(['page', 'offset p50 ms', 'offset p95 ms', 'cursor p50 ms', 'cursor p95 ms'], rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 10, 100, 1000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        run(args.orders, args.pages, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
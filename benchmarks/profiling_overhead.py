@@ -0,0 +1,87 @@
+"""
+Cost of the request profiling middleware.
+
+Fetches one buyer's order history through ``OrderListView`` with the
+middleware removed, installed but off, and sampling at each ``--rates``
+value. Requests rotate between the setups so drift hits them all alike::
+
+    python -m benchmarks.profiling_overhead --orders 200 --requests 500 --rates 0.01 0.1 1
+
+Sampled requests write their log lines to a temporary file.
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.utils import benchmark_database, percentile, print_table, setup_django
+
+PROFILER = 'shoply.profiling.RequestProfilingMiddleware'
+
+
+def seed(orders):
+    from django.contrib.auth import get_user_model
+    from orders.models import Order, OrderItem
+    from products.models import Product
+
+    user = get_user_model().objects.create_user(username='buyer', email='buyer@example.com', password='buyer')
+    products = Product.objects.bulk_create([Product(name=f'Product {n}', price=10, stock=10 ** 6) for n in range(10)])
+    placed = Order.objects.bulk_create([Order(user=user, total_price=20) for _ in range(orders)])
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product=products[(n + k) % len(products)], quantity=1, price=10)
+        for n, order in enumerate(placed) for k in range(2)
+    ])
+    return user
+
+
+def run(orders, requests, rates):
+    from django.conf import settings
+    from django.test import override_settings
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    user = seed(orders)
+    url = reverse('order-list')
+    setups = [('no middleware', None), ('sample rate 0', 0.0)] + [(f'sample rate {rate:g}', rate) for rate in rates]
+    clients = {}
+    for name, rate in setups:
+        client = clients[name] = APIClient()
+        client.force_authenticate(user=user)
+        middleware = [m for m in settings.MIDDLEWARE if m != PROFILER] if rate is None else settings.MIDDLEWARE
+        with override_settings(MIDDLEWARE=middleware):
+            client.get(url)  # Builds the client's middleware chain under this setting
+
+    samples = {name: [] for name, _ in setups}
+    for _ in range(requests):
+        for name, rate in setups:
+            settings.PROFILE_SAMPLE_RATE = rate or 0.0
+            started = time.perf_counter()
+            clients[name].get(url)
+            samples[name].append((time.perf_counter() - started) * 1000)
+
+    baseline = statistics.mean(samples['no middleware'])
+    rows = []
+    for name, _ in setups:
+        mean = statistics.mean(samples[name])
+        rows.append((name, mean, percentile(samples[name], 50), percentile(samples[name], 95),
+                     f'{(mean / baseline - 1) * 100:+.1f}%'))
+    print(f"GET {url}: {orders} orders, {requests} requests per setup")
+    print_table(['setup', 'mean ms', 'p50 ms', 'p95 ms', 'overhead'], rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=500, help="Requests per setup.")
+    parser.add_argument('--rates', type=float, nargs='+', default=[0.01, 0.1, 1.0])
+    args = parser.parse_args()
+
+    os.environ['PROFILE_LOG_FILE'] = os.path.join(tempfile.mkdtemp(), 'request_profile.log')
+    setup_django()
+    with benchmark_database():
+        run(args.orders, args.requests, args.rates)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Product search latency: ``/api/products/search/`` versus an ``icontains`` scan.
+
+Seeds ``--rows`` products with generated names and descriptions, then times
+the search endpoint (full-text on PostgreSQL, the in-process index
+elsewhere) against the ``name``/``description`` ``icontains`` query the
+admin used to run::
+
+    python -m benchmarks.search --rows 200000
+"""
+import argparse
+import random
+
+from benchmarks.utils import benchmark_database, measure, print_table, setup_django
+
+WORDS = ['wireless', 'gaming', 'laptop', 'mouse', 'keyboard', 'monitor', 'usb', 'cable', 'stand',
+         'headset', 'speaker', 'charger', 'camera', 'phone', 'case', 'adapter', 'ssd', 'router',
+         'portable', 'ergonomic', 'mechanical', 'bluetooth', 'waterproof', 'compact', 'premium']
+
+QUERIES = ['laptop', 'wireless mouse', 'mechanical keyboard', 'waterproof bluetooth speaker', 'keybord']
+
+
+def seed(rows, batch_size=10000):
+    from products.models import Product
+
+    rng = random.Random(7)
+    for start in range(0, rows, batch_size):
+        Product.objects.bulk_create([
+            Product(
+                name=' '.join(rng.sample(WORDS, 3)).title(),
+                description=' '.join(rng.choices(WORDS, k=20)),
+                price=rng.randrange(100, 100000) / 100,
+                stock=rng.randrange(0, 100),
+            )
+            for _ in range(start, min(start + batch_size, rows))
+        ])
+
+
+def run(rows, repeat):
+    from django.db.models import Q
+    from django.test import override_settings
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+    from products.models import Product
+    from products.search import get_inverted_index
+    from products.serializers import ProductSerializer
+
+    seed(rows)
+    get_inverted_index()  # Build the fallback index outside the timed section
+    client = APIClient()
+    url = reverse('product-search')
+
+    def search(query):
+        response = client.get(url, {'q': query})
+        assert response.status_code == 200, response.data
+
+    def icontains(query):
+        condition = Q()
+        for term in query.split():
+            condition &= Q(name__icontains=term) | Q(description__icontains=term)
+        ProductSerializer(Product.objects.filter(condition).order_by('-id')[:20], many=True).data
+
+    results = []
+    with override_settings(CATALOG_CACHE_TIMEOUT=0):
+        for query in QUERIES:
+            endpoint = measure(lambda: search(query), repeat)
+            baseline = measure(lambda: icontains(query), repeat)
+            results.append((query, endpoint['p50_ms'], endpoint['p95_ms'], baseline['p50_ms'], baseline['p95_ms']))
+
+    print_table(['query', 'search p50 ms', 'search p95 ms', 'icontains p50 ms', 'icontains p95 ms'], results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    setup_django()
+    with benchmark_database():
+        run(args.rows, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
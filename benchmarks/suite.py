@@ -0,0 +1,404 @@
+"""
+End-to-end load test of the API, with results saved as JSON for diffing.
+
+``run`` seeds users, products and orders at ``--scale`` with bulk inserts,
+then drives each scenario through the real URLconf with ``--clients``
+concurrent test clients, each its own thread, database connection and JWT.
+For every scenario it reports throughput, p50/p95/p99 latency and SQL
+queries per request::
+
+    python -m benchmarks.suite run --scale small --clients 8 --requests 100 --output before.json
+    python -m benchmarks.suite compare before.json after.json --threshold 10
+
+``compare`` prints the change in every number and exits with status 1 when
+latency or throughput moved the wrong way by more than ``--threshold``
+percent, or a scenario issues half a query more per request on average
+(cache hits vary a little between runs, so counts are not exact).
+
+Payments go through ``FakePaymentClient`` instead of Stripe, and the login
+rate limits are lifted so they don't turn the login runs into 429s. Run
+against PostgreSQL for concurrent numbers; SQLite serialises writes, so
+checkout and payment errors pile up there with more than one client.
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+
+from benchmarks.utils import benchmark_database, explicit_timestamps, percentile, print_table, setup_django
+
+PASSWORD = 'suite-Pass1!'
+
+SCALES = {
+    'small': {'users': 200, 'products': 2000, 'orders': 5000},
+    'medium': {'users': 2000, 'products': 20000, 'orders': 100000},
+    'large': {'users': 20000, 'products': 200000, 'orders': 1000000},
+}
+
+WORDS = ['wireless', 'gaming', 'laptop', 'mouse', 'keyboard', 'monitor', 'usb', 'cable', 'stand',
+         'headset', 'speaker', 'charger', 'camera', 'phone', 'case', 'adapter', 'ssd', 'router']
+
+BROWSE_PARAMS = [{}, {'ordering': 'price'}, {'ordering': '-price'}, {'ordering': 'name'},
+                 {'in_stock': 'true'}, {'min_price': '100', 'max_price': '200', 'ordering': 'price'}]
+
+# Metric -> whether a bigger number is better
+METRICS = {
+    'throughput_rps': True,
+    'p50_ms': False,
+    'p95_ms': False,
+    'p99_ms': False,
+    'queries_per_request': False,
+}
+
+
+def seed(users, products, orders, seed_value=42, batch_size=5000):
+    """Bulk-insert the synthetic shop; returns the user and product ids."""
+    from django.contrib.auth import get_user_model
+    from django.core.management import call_command
+    from django.utils import timezone
+    from orders.models import Order, OrderItem
+    from products.models import Product
+
+    rng = random.Random(seed_value)
+    User = get_user_model()
+    template = User()
+    template.set_password(PASSWORD)  # Hash once; every seeded user shares it
+    User.objects.bulk_create([
+        User(username=f'user{n}', email=f'user{n}@example.com', is_verified=True, password=template.password)
+        for n in range(users)
+    ], batch_size=batch_size)
+    user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+
+    now = timezone.now()
+    with explicit_timestamps(Product, 'created_at', 'updated_at'):
+        for start in range(0, products, batch_size):
+            batch = []
+            for _ in range(start, min(start + batch_size, products)):
+                created = now - timedelta(minutes=rng.randrange(365 * 24 * 60))
+                batch.append(Product(
+                    name=' '.join(rng.sample(WORDS, 3)).title(), price=rng.randrange(100, 100000) / 100,
+                    stock=rng.choice([0, rng.randrange(1, 500), rng.randrange(1, 500)]),
+                    created_at=created, updated_at=created,
+                ))
+            Product.objects.bulk_create(batch)
+    product_prices = dict(Product.objects.values_list('pk', 'price'))
+    product_ids = sorted(product_prices)
+
+    with explicit_timestamps(Order, 'created_at'):
+        for start in range(0, orders, batch_size):
+            batch, lines = [], []
+            for _ in range(start, min(start + batch_size, orders)):
+                items = [(rng.choice(product_ids), rng.randrange(1, 4)) for _ in range(rng.randrange(1, 6))]
+                paid = rng.random() < 0.8
+                batch.append(Order(
+                    user_id=rng.choice(user_ids), created_at=now - timedelta(minutes=rng.randrange(365 * 24 * 60)),
+                    total_price=sum(product_prices[pk] * quantity for pk, quantity in items),
+                    is_paid=paid, payment_status='paid' if paid else 'unpaid',
+                    status=rng.choice(['processing', 'shipped', 'delivered']) if paid else 'pending',
+                ))
+                lines.append(items)
+            for order, items in zip(Order.objects.bulk_create(batch), lines):
+                order._lines = items
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product_id=pk, quantity=quantity, price=product_prices[pk])
+                for order in batch for pk, quantity in order._lines
+            ], batch_size=batch_size)
+    call_command('rebuild_order_summaries', stdout=StringIO())
+    return user_ids, product_ids
+
+
+class Scenario:
+    """
+    One kind of request. ``prepare`` runs untimed before the clients start;
+    ``request`` makes client ``worker``'s ``n``-th request and returns the
+    response with the status it should have.
+    """
+    authenticated = True
+
+    def __init__(self, user_ids, product_ids):
+        self.user_ids, self.product_ids = user_ids, product_ids
+
+    def prepare(self, clients, requests):
+        pass
+
+    def request(self, client, rng, worker, n):
+        raise NotImplementedError
+
+
+class Browse(Scenario):
+    """Catalog list pages with assorted filters, and product details (catalog cache on)."""
+    authenticated = False
+
+    def request(self, client, rng, worker, n):
+        from django.urls import reverse
+
+        if n % 4 == 3:
+            return client.get(reverse('product-detail', kwargs={'pk': rng.choice(self.product_ids)})), 200
+        return client.get(reverse('product-list'), rng.choice(BROWSE_PARAMS)), 200
+
+
+class Checkout(Scenario):
+    """Orders of one to five lines, from products stocked so they never run out."""
+
+    def prepare(self, clients, requests):
+        from products.models import Product
+
+        self.pool = self.product_ids[:200]
+        self.prices = dict(Product.objects.filter(pk__in=self.pool).values_list('pk', 'price'))
+        Product.objects.filter(pk__in=self.pool).update(stock=10 ** 9)
+
+    def request(self, client, rng, worker, n):
+        from django.urls import reverse
+
+        items = [{'product': pk, 'quantity': 1, 'price': str(self.prices[pk])}
+                 for pk in rng.sample(self.pool, rng.randrange(1, 6))]
+        return client.post(reverse('order-create'), {'items': items}, format='json'), 201
+
+
+class Payment(Scenario):
+    """Pay one fresh unpaid order per request through ``PaymentView``."""
+
+    def prepare(self, clients, requests):
+        from orders.models import Order
+
+        self.orders = [
+            [order.pk for order in Order.objects.bulk_create([
+                Order(user_id=self.user_ids[worker], total_price=42) for _ in range(requests)
+            ])]
+            for worker in range(clients)
+        ]
+
+    def request(self, client, rng, worker, n):
+        from django.urls import reverse
+
+        payload = {'order_id': self.orders[worker][n], 'token': 'tok_visa'}
+        return client.post(reverse('order-payment'), payload, format='json'), 200
+
+
+class OrderHistory(Scenario):
+    """The first few pages of a buyer's order history."""
+
+    def request(self, client, rng, worker, n):
+        from django.urls import reverse
+
+        return client.get(reverse('order-list'), {'page': n % 3 + 1} if n % 3 else {}), 200
+
+
+class Login(Scenario):
+    """Password logins, so mostly the cost of the configured hasher."""
+    authenticated = False
+
+    def request(self, client, rng, worker, n):
+        from django.urls import reverse
+
+        username = f'user{(worker * 7919 + n) % len(self.user_ids)}'
+        return client.post(reverse('login'), {'username': username, 'password': PASSWORD}, format='json'), 200
+
+
+SCENARIOS = {
+    'browse': Browse,
+    'checkout': Checkout,
+    'payment': Payment,
+    'order_history': OrderHistory,
+    'login': Login,
+}
+
+
+def run_scenario(scenario, clients, requests, warmup, seed_value):
+    """Drive ``scenario`` from ``clients`` threads; returns its summary numbers."""
+    from django.db import connection
+    from rest_framework.test import APIClient
+    from users.authentication import ClaimsRefreshToken
+    from django.contrib.auth import get_user_model
+
+    scenario.prepare(clients, requests + warmup)
+    users = get_user_model().objects.in_bulk(scenario.user_ids[:clients])
+    latencies, queries, errors = [], [], []
+    lock = threading.Lock()
+    start_line = threading.Barrier(clients + 1)
+
+    def worker(index):
+        client, rng = APIClient(), random.Random(seed_value * 1000 + index)
+        if scenario.authenticated:
+            token = ClaimsRefreshToken.for_user(users[scenario.user_ids[index]]).access_token
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        count = [0]
+
+        def count_query(execute, sql, params, many, context):
+            count[0] += 1
+            return execute(sql, params, many, context)
+
+        mine, my_queries, my_errors = [], [], []
+        try:
+            with connection.execute_wrapper(count_query):
+                for n in range(warmup):
+                    try:
+                        scenario.request(client, rng, index, requests + n)
+                    except Exception:
+                        pass  # Counted if the timed requests fail the same way
+                start_line.wait()
+                for n in range(requests):
+                    count[0] = 0
+                    started = time.perf_counter()
+                    try:
+                        response, expected = scenario.request(client, rng, index, n)
+                    except Exception as e:  # e.g. "database is locked" on SQLite
+                        my_errors.append(f'{type(e).__name__}: {e}')
+                        continue
+                    mine.append((time.perf_counter() - started) * 1000)
+                    my_queries.append(count[0])
+                    if response.status_code != expected:
+                        my_errors.append(f'HTTP {response.status_code}')
+        finally:
+            connection.close()
+            with lock:
+                latencies.extend(mine)
+                queries.extend(my_queries)
+                errors.extend(my_errors)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(clients)]
+    for thread in threads:
+        thread.start()
+    start_line.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'error_samples': sorted(set(errors))[:5],
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'mean_ms': round(sum(latencies) / len(latencies), 3) if latencies else None,
+        'p50_ms': round(percentile(latencies, 50), 3) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95), 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99), 3) if latencies else None,
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    import django
+    from django.conf import settings
+    from django.db import connection
+    from django.test import override_settings
+
+    scale = {**SCALES[args.scale], **{key: getattr(args, key) for key in ('users', 'products', 'orders') if getattr(args, key)}}
+    scale['users'] = max(scale['users'], args.clients)
+    overrides = {
+        'PAYMENT_CLIENT': 'orders.payments.FakePaymentClient',
+        'REST_FRAMEWORK': {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}},
+    }
+    if args.pbkdf2_iterations:
+        overrides['PASSWORD_HASHER_PARAMS'] = {**settings.PASSWORD_HASHER_PARAMS, 'pbkdf2_sha256': {'iterations': args.pbkdf2_iterations}}
+
+    results = {}
+    with override_settings(**overrides):
+        started = time.perf_counter()
+        user_ids, product_ids = seed(scale['users'], scale['products'], scale['orders'], args.seed)
+        print(f"Seeded {scale} in {time.perf_counter() - started:.1f}s on {connection.vendor}")
+        for name in args.scenarios:
+            results[name] = run_scenario(SCENARIOS[name](user_ids, product_ids), args.clients, args.requests, args.warmup, args.seed)
+
+    print_table(
+        ['scenario', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'queries/req'],
+        [(name, r['requests'], r['errors'], r['throughput_rps'], r['p50_ms'] or 0.0, r['p95_ms'] or 0.0,
+          r['p99_ms'] or 0.0, r['queries_per_request'] or 0) for name, r in results.items()],
+    )
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'scale': scale,
+            'clients': args.clients,
+            'requests_per_client': args.requests,
+            'seed': args.seed,
+            'password_hasher': settings.PASSWORD_HASHER,
+            'pbkdf2_iterations': args.pbkdf2_iterations or settings.PASSWORD_HASHER_PARAMS['pbkdf2_sha256']['iterations'],
+        },
+        'scenarios': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f"Wrote {args.output}")
+
+
+def compare(args):
+    """Print how every scenario's numbers moved; returns True if any regressed past the threshold."""
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    print(f"{baseline['meta'].get('commit')} -> {candidate['meta'].get('commit')}")
+    for key in ('database', 'scale', 'clients', 'requests_per_client'):
+        if baseline['meta'].get(key) != candidate['meta'].get(key):
+            print(f"warning: {key} differs ({baseline['meta'].get(key)} vs {candidate['meta'].get(key)})")
+
+    rows, regressed = [], False
+    for name in sorted(set(baseline['scenarios']) & set(candidate['scenarios'])):
+        for metric, higher_is_better in METRICS.items():
+            old, new = baseline['scenarios'][name].get(metric), candidate['scenarios'][name].get(metric)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old * 100 if old else 0.0
+            worse = -change if higher_is_better else change
+            if metric == 'queries_per_request':
+                bad = new - old >= 0.5
+            else:
+                bad = worse > args.threshold
+            regressed |= bad
+            rows.append((name, metric, old, new, f'{change:+.1f}%', 'REGRESSION' if bad else ''))
+    print_table(['scenario', 'metric', 'baseline', 'candidate', 'change', ''], rows)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help="Seed a database and load-test every scenario.")
+    run_parser.add_argument('--scale', choices=SCALES, default='small')
+    run_parser.add_argument('--users', type=int, help="Override the scale's user count.")
+    run_parser.add_argument('--products', type=int, help="Override the scale's product count.")
+    run_parser.add_argument('--orders', type=int, help="Override the scale's order count.")
+    run_parser.add_argument('--clients', type=int, default=8, help="Concurrent clients per scenario.")
+    run_parser.add_argument('--requests', type=int, default=100, help="Timed requests per client.")
+    run_parser.add_argument('--warmup', type=int, default=5, help="Untimed requests per client first.")
+    run_parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    run_parser.add_argument('--seed', type=int, default=42, help="Seed for the data and request mix.")
+    run_parser.add_argument('--pbkdf2-iterations', type=int, help="PBKDF2 cost for the run (settings by default).")
+    run_parser.add_argument('--output', help="Write the results to this JSON file.")
+
+    compare_parser = commands.add_parser('compare', help="Diff two JSON results.")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    compare_parser.add_argument('--threshold', type=float, default=10, help="Percent change counted as a regression.")
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        sys.exit(1 if compare(args) else 0)
+    setup_django()
+    with benchmark_database():
+        run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Thumbnail rendering throughput.
+
+Renders every configured size and format (``THUMBNAIL_SIZES`` and
+``THUMBNAIL_FORMATS``) for a set of synthetic photos, first in this process
+and then on a pool of worker processes, and reports images per second
+overall and per core::
+
+    python -m benchmarks.thumbnails --images 40 --width 4000 --height 3000 --workers 4
+
+Only the CPU work is measured; storage writes are left out.
+"""
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from benchmarks.utils import print_table, setup_django
+
+
+def make_photos(count, size):
+    """JPEGs with enough noise that the encoders can't take shortcuts."""
+    from PIL import Image
+
+    photos = []
+    for n in range(count):
+        noise = Image.effect_noise(size, 40 + n % 20)
+        color = (random.randrange(256), random.randrange(256), random.randrange(256))
+        photo = Image.merge('RGB', [noise.point(lambda v, c=c: (v + c) % 256) for c in color])
+        out = BytesIO()
+        photo.save(out, 'JPEG', quality=90)
+        photos.append(out.getvalue())
+    return photos
+
+
+def run(images, size, workers):
+    from django.conf import settings
+    from shoply.thumbnails import render_thumbnails
+
+    photos = make_photos(images, size)
+    args = (settings.THUMBNAIL_SIZES, settings.THUMBNAIL_FORMATS, settings.THUMBNAIL_QUALITY)
+
+    rows = []
+    started = time.perf_counter()
+    for photo in photos:
+        render_thumbnails(photo, *args)
+    elapsed = time.perf_counter() - started
+    rows.append(('in process', 1, images, elapsed * 1000, images / elapsed, images / elapsed))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Start the workers before timing so process start-up isn't counted
+        list(pool.map(render_thumbnails, photos[:workers], *[[arg] * workers for arg in args]))
+        started = time.perf_counter()
+        list(pool.map(render_thumbnails, photos, *[[arg] * images for arg in args]))
+        elapsed = time.perf_counter() - started
+    rows.append(('pool', workers, images, elapsed * 1000, images / elapsed, images / elapsed / workers))
+
+    print(f"{size[0]}x{size[1]} JPEG -> {len(args[0])} sizes x {len(args[1])} formats")
+    print_table(['mode', 'cores', 'images', 'total ms', 'images/s', 'images/s/core'], rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=24)
+    parser.add_argument('--width', type=int, default=3000)
+    parser.add_argument('--height', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    setup_django()
+    run(args.images, (args.width, args.height), args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+import csv
+from datetime import date, datetime
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from shoply.bulk import ImportResult
+from .models import Order, OrderItem, OrderStatusHistory
+
+# ✅ Exportable tables: model, columns (in file order) and the date used for range filters
+RESOURCES = {
+    'orders': (Order, ['id', 'user', 'created_at', 'total_price', 'is_paid', 'payment_id',
+                       'payment_status', 'status', 'is_refunded', 'refund_id'], 'created_at'),
+    'items': (OrderItem, ['id', 'order', 'product', 'quantity', 'price'], 'order__created_at'),
+    'history': (OrderStatusHistory, ['id', 'order', 'previous_status', 'new_status', 'changed_at'], 'changed_at'),
+}
+
+
+def get_columns(model, names):
+    """Return ``(field, column name)`` pairs; foreign keys use their ``_id`` column."""
+    fields = [model._meta.get_field(name) for name in names]
+    return [(field, field.attname) for field in fields]
+
+
+def export_rows(resource, created_after=None, created_before=None):
+    """
+    Yield one tuple per row of ``resource``, in primary key order.
+
+    Rows come from ``QuerySet.iterator()``, which reads through a server-side
+    cursor on PostgreSQL, so memory use doesn't grow with the table.
+    """
+    model, names, date_field = RESOURCES[resource]
+    queryset = model.objects.order_by('pk')
+    if created_after:
+        queryset = queryset.filter(**{f'{date_field}__gte': created_after})
+    if created_before:
+        queryset = queryset.filter(**{f'{date_field}__lt': created_before})
+    columns = [column for _, column in get_columns(model, names)]
+    return queryset.values_list(*columns).iterator(chunk_size=settings.ORDER_EXPORT_CHUNK_SIZE)
+
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+class _Echo:
+    """File-like object whose ``write`` returns the line, for ``csv.writer``."""
+    def write(self, value):
+        return value
+
+
+def render_export(resource, fmt, rows):
+    """Turn ``rows`` into an iterator of NDJSON or CSV lines."""
+    model, names, _ = RESOURCES[resource]
+    columns = [column for _, column in get_columns(model, names)]
+    if fmt == 'ndjson':
+        encoder = DjangoJSONEncoder(separators=(',', ':'))
+        return (encoder.encode(dict(zip(columns, map(_plain, row)))) + '\n' for row in rows)
+
+    writer = csv.writer(_Echo())
+
+    def lines():
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow(['' if value is None else _plain(value) for value in row])
+    return lines()
+
+
+def import_rows(resource, rows, batch_size=None):
+    """
+    Validate ``rows`` (from ``parse_import``) and insert them in batches.
+
+    Each batch is cleaned field by field, its foreign keys and primary keys
+    are checked with one query per column, and the valid rows are inserted
+    with a single ``bulk_create``. Invalid rows are skipped and reported by
+    line number. Model ``save()`` and signals are bypassed, so stock and
+    order totals are taken from the file as-is.
+    """
+    model, names, _ = RESOURCES[resource]
+    batch_size = batch_size or settings.ORDER_IMPORT_BATCH_SIZE
+    columns = get_columns(model, names)
+    result = ImportResult()
+    explicit_ids = False
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        explicit_ids |= _import_batch(model, columns, batch, result)
+
+    if explicit_ids:
+        # Move the id sequence past imported ids so later inserts don't collide
+        statements = connection.ops.sequence_reset_sql(no_style(), [model])
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+    return result
+
+
+def _import_batch(model, columns, batch, result):
+    """Import one batch into ``result``; returns whether any row carried its own id."""
+    cleaned = []
+    explicit_ids = False
+    for line, row in batch:
+        if row is None:
+            result.add_error(line, {'non_field_errors': ["Not a valid JSON object."]})
+            continue
+        values, errors = {}, {}
+        for field, column in columns:
+            raw = row.get(column, row.get(field.name))
+            if raw in (None, ''):
+                if field.primary_key or field.has_default() or field.null or getattr(field, 'auto_now_add', False):
+                    continue
+                if field.blank:
+                    values[column] = ''
+                    continue
+                errors[column] = ["This field is required."]
+                continue
+            try:
+                if field.is_relation:
+                    values[column] = field.target_field.to_python(raw)
+                else:
+                    values[column] = field.clean(raw, None)
+            except ValidationError as e:
+                errors[column] = e.messages
+        if errors:
+            result.add_error(line, errors)
+        else:
+            cleaned.append((line, values))
+
+    # ✅ One query per foreign key column (and one for clashing ids) instead of one per row
+    for field, column in columns:
+        if not (field.is_relation or field.primary_key):
+            continue
+        wanted = {values[column] for _, values in cleaned if column in values}
+        if not wanted:
+            continue
+        target = field.related_model if field.is_relation else model
+        found = set(target._base_manager.filter(pk__in=wanted).values_list('pk', flat=True))
+        valid = []
+        for line, values in cleaned:
+            value = values.get(column)
+            if value is None:
+                valid.append((line, values))
+            elif field.is_relation and value not in found:
+                result.add_error(line, {column: [f"{target._meta.verbose_name.capitalize()} {value} does not exist."]})
+            elif field.primary_key and value in found:
+                result.add_error(line, {column: [f"{model._meta.verbose_name.capitalize()} {value} already exists."]})
+            else:
+                if field.primary_key:
+                    found.add(value)  # a repeated id later in the batch is a clash too
+                    explicit_ids = True
+                valid.append((line, values))
+        cleaned = valid
+
+    if not cleaned:
+        return explicit_ids
+    objects = [model(**values) for _, values in cleaned]
+    # bulk_create stamps auto_now_add fields with the current time; put imported values back
+    stamped = [field for field, column in columns if getattr(field, 'auto_now_add', False)]
+    restore = {field.attname: [values.get(field.attname) for _, values in cleaned] for field in stamped}
+    with transaction.atomic():
+        model.objects.bulk_create(objects)
+        for attname, imported in restore.items():
+            changed = []
+            for obj, value in zip(objects, imported):
+                if value is not None:
+                    setattr(obj, attname, value)
+                    changed.append(obj)
+            model.objects.bulk_update(changed, [attname], batch_size=settings.ORDER_IMPORT_BATCH_SIZE)
+    result.created += len(objects)
+    return explicit_ids
@@ -0,0 +1,143 @@
+import functools
+import hashlib
+import json
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+IN_FLIGHT = 'in-flight'
+
+
+def get_idempotency_cache():
+    return caches[settings.IDEMPOTENCY_CACHE_ALIAS]
+
+
+def request_fingerprint(request):
+    """Hash of what the request asks for, to catch a key reused for a different request."""
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def idempotency_cache_key(request, key):
+    # Keys are scoped to the user and endpoint and hashed to a fixed size
+    digest = hashlib.sha256(f'{request.user.pk}:{request.path}:{key}'.encode()).hexdigest()
+    return f'idempotency:{digest}'
+
+
+def idempotent(handler):
+    """
+    Make a view method safe to retry with an ``Idempotency-Key`` header.
+
+    The first successful (2xx) response for a key is kept for
+    ``IDEMPOTENCY_KEY_TTL`` seconds; a retry with the same key and body gets
+    that response back, marked with ``Idempotent-Replayed: true``, without
+    running the view again. A retry while the first request is still running
+    gets 409, and reusing a key for a different body gets 422. Errors are not
+    stored, so a request that failed can be retried with the same key.
+    Requests without the header are handled as usual. Coroutine handlers get
+    a coroutine wrapper that uses the cache's async API.
+    """
+    if iscoroutinefunction(handler):
+        return async_idempotent(handler)
+
+    @functools.wraps(handler)
+    def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return handler(view, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return key_too_long()
+
+        cache = get_idempotency_cache()
+        cache_key = idempotency_cache_key(request, key)
+        fingerprint = request_fingerprint(request)
+
+        # ✅ add() only succeeds for the first request with this key
+        if not cache.add(cache_key, (IN_FLIGHT, fingerprint), timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT):
+            stored = cache.get(cache_key)
+            if stored is not None:
+                return replay(stored, fingerprint)
+
+        try:
+            response = handler(view, request, *args, **kwargs)
+        except BaseException:
+            cache.delete(cache_key)
+            raise
+
+        if status.is_success(response.status_code):
+            cache.set(cache_key, stored_entry(response, fingerprint), timeout=settings.IDEMPOTENCY_KEY_TTL)
+        else:
+            cache.delete(cache_key)
+        return response
+
+    return wrapper
+
+
+def async_idempotent(handler):
+    """``idempotent`` for a coroutine handler."""
+    @functools.wraps(handler)
+    async def wrapper(view, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return await handler(view, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return key_too_long()
+
+        cache = get_idempotency_cache()
+        cache_key = idempotency_cache_key(request, key)
+        fingerprint = request_fingerprint(request)
+
+        if not await cache.aadd(cache_key, (IN_FLIGHT, fingerprint), timeout=settings.IDEMPOTENCY_LOCK_TIMEOUT):
+            stored = await cache.aget(cache_key)
+            if stored is not None:
+                return replay(stored, fingerprint)
+
+        try:
+            response = await handler(view, request, *args, **kwargs)
+        except BaseException:
+            await cache.adelete(cache_key)
+            raise
+
+        if status.is_success(response.status_code):
+            await cache.aset(cache_key, stored_entry(response, fingerprint), timeout=settings.IDEMPOTENCY_KEY_TTL)
+        else:
+            await cache.adelete(cache_key)
+        return response
+
+    return wrapper
+
+
+def stored_entry(response, fingerprint):
+    """What is kept of a successful response to replay it."""
+    headers = {name: response[name] for name in ('Location',) if response.has_header(name)}
+    return fingerprint, response.status_code, response.data, headers
+
+
+def replay(stored, fingerprint):
+    """Answer a repeated request from its stored entry."""
+    if stored[0] == IN_FLIGHT:
+        if stored[1] != fingerprint:
+            return mismatch()
+        return Response({"detail": "A request with this Idempotency-Key is still being processed."},
+                        status=status.HTTP_409_CONFLICT)
+
+    stored_fingerprint, status_code, data, headers = stored
+    if stored_fingerprint != fingerprint:
+        return mismatch()
+    return Response(data, status=status_code, headers={**headers, REPLAYED_HEADER: 'true'})
+
+
+def key_too_long(max_length=MAX_KEY_LENGTH):
+    return Response({"detail": f"{HEADER} must be at most {max_length} characters."},
+                    status=status.HTTP_400_BAD_REQUEST)
+
+
+def mismatch():
+    return Response({"detail": "This Idempotency-Key was already used for a different request."},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY)
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from orders.models import PaymentAttempt
+from orders.payments import capture_pending_payments
+
+
+class Command(BaseCommand):
+    help = "Capture pending payment intents on a pool of worker threads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help="Payments claimed per batch.")
+        parser.add_argument('--workers', type=int, help="Concurrent charges (default: PAYMENT_CAPTURE_WORKERS).")
+        parser.add_argument('--loop', action='store_true', help="Keep polling for new payments instead of exiting.")
+        parser.add_argument('--interval', type=float, default=1, help="Seconds to sleep between polls with --loop.")
+
+    def handle(self, *args, **options):
+        succeeded = failed = 0
+        while True:
+            attempts = capture_pending_payments(options['batch_size'], options['workers'])
+            batch_succeeded = sum(attempt.status == PaymentAttempt.SUCCEEDED for attempt in attempts)
+            succeeded += batch_succeeded
+            failed += len(attempts) - batch_succeeded
+            if attempts:
+                self.stdout.write(f"Captured {batch_succeeded}, failed {len(attempts) - batch_succeeded}")
+            if len(attempts) < options['batch_size']:
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f"Done: {succeeded} captured, {failed} failed."))
@@ -0,0 +1,40 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from orders.models import Order, OrderSummary
+
+
+class Command(BaseCommand):
+    help = "Recompute the order summary table from the orders in a single pass."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help="Summary rows inserted per query.")
+
+    def handle(self, *args, **options):
+        amount = OrderSummary._meta.get_field('revenue')
+        # ✅ One grouped scan over orders yields every (user, day) row with all its figures
+        rows = (
+            Order.objects.values('user_id', day=TruncDate('created_at'))
+            .annotate(
+                order_count=Count('pk'),
+                **{f'{status}_count': Count('pk', filter=Q(status=status)) for status, _ in Order.STATUS_CHOICES},
+                revenue=Coalesce(Sum('total_price', filter=Q(is_paid=True)), Value(0), output_field=amount),
+                refunded=Coalesce(Sum('total_price', filter=Q(is_refunded=True)), Value(0), output_field=amount),
+            )
+            .order_by()
+            .iterator(chunk_size=options['batch_size'])
+        )
+
+        created = 0
+        with transaction.atomic():
+            OrderSummary.objects.all().delete()
+            while True:
+                batch = [OrderSummary(**row) for row in islice(rows, options['batch_size'])]
+                if not batch:
+                    break
+                OrderSummary.objects.bulk_create(batch)
+                created += len(batch)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} order summary row(s)."))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+from orders.models import Order, order_items_total
+
+
+class Command(BaseCommand):
+    help = "Audit Order.total_price against the sum of its items and optionally fix mismatches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help="Rewrite mismatched totals from the item sum.")
+        parser.add_argument('--limit', type=int, default=50, help="Maximum number of mismatches to list.")
+
+    def handle(self, *args, **options):
+        mismatched = (
+            Order.objects.annotate(computed_total=order_items_total())
+            .exclude(total_price=F('computed_total'))
+            .order_by('pk')
+        )
+        rows = list(mismatched.values_list('pk', 'total_price', 'computed_total'))
+
+        for pk, stored, computed in rows[:options['limit']]:
+            self.stdout.write(f"Order #{pk}: stored {stored}, items sum to {computed}")
+        if len(rows) > options['limit']:
+            self.stdout.write(f"... and {len(rows) - options['limit']} more")
+
+        if not rows:
+            self.stdout.write(self.style.SUCCESS("All order totals match their items."))
+        elif options['fix']:
+            fixed = Order.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(total_price=order_items_total())
+            self.stdout.write(self.style.SUCCESS(f"Fixed {fixed} order total(s)."))
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(rows)} order total(s) do not match. Re-run with --fix to repair."))
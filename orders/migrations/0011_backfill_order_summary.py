@@ -0,0 +1,39 @@
+from django.db import migrations
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def backfill_order_summaries(apps, schema_editor):
+    # Same grouped scan as `manage.py rebuild_order_summaries`, over the historical models
+    Order = apps.get_model('orders', 'Order')
+    OrderSummary = apps.get_model('orders', 'OrderSummary')
+    db = schema_editor.connection.alias
+    amount = OrderSummary._meta.get_field('revenue')
+    rows = (
+        Order.objects.using(db).values('user_id', day=TruncDate('created_at'))
+        .annotate(
+            order_count=Count('pk'),
+            **{f'{status}_count': Count('pk', filter=Q(status=status))
+               for status, _ in Order._meta.get_field('status').choices},
+            revenue=Coalesce(Sum('total_price', filter=Q(is_paid=True)), Value(0), output_field=amount),
+            refunded=Coalesce(Sum('total_price', filter=Q(is_refunded=True)), Value(0), output_field=amount),
+        )
+        .order_by()
+    )
+    OrderSummary.objects.using(db).all().delete()
+    OrderSummary.objects.using(db).bulk_create((OrderSummary(**row) for row in rows.iterator()), batch_size=2000)
+
+
+def clear_order_summaries(apps, schema_editor):
+    apps.get_model('orders', 'OrderSummary').objects.using(schema_editor.connection.alias).all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_paymentattempt_amount'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_order_summaries, clear_order_summaries),
+    ]
@@ -1,11 +1,24 @@
 from django.conf import settings
-from django.db import models, transaction
+from django.db import IntegrityError, connections, models, transaction
 from django.core.exceptions import ValidationError
-from django.db.models.signals import post_save, post_delete
-from django.dispatch import receiver
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+from products.inventory import reserve_stock
 from products.models import Product
 
 # orders/models.py
+def items_prefetch():
+    """Items with their product names, as ``OrderSerializer`` renders them."""
+    items = OrderItem.objects.select_related('product').only(
+        'id', 'order_id', 'product_id', 'quantity', 'price', 'product__name'
+    )
+    return models.Prefetch('items', queryset=items)
+
+class OrderQuerySet(models.QuerySet):
+    def with_items(self):
+        """Prefetch items and product names so serializing a page costs a fixed number of queries."""
+        return self.prefetch_related(items_prefetch())
+
 class Order(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -25,24 +38,96 @@ class Order(models.Model):
     is_refunded = models.BooleanField(default=False)
     refund_id = models.CharField(max_length=100, blank=True, null=True)
 
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # ✅ Serves keyset pagination of a user's order history
+            models.Index(fields=['user', 'created_at', 'id'], name='order_user_created_idx'),
+        ]
+
     def update_total_price(self):
-        # Safely recalculate the total price
-        self.total_price = sum(item.price * item.quantity for item in self.items.all())
-        self.save(update_fields=['total_price'])
-    
+        """Recompute total_price from the items with a single DB-side aggregate."""
+        previous_total = self.total_price
+        Order.objects.filter(pk=self.pk).update(total_price=order_items_total())
+        self.refresh_from_db(fields=['total_price'])
+        total_field = self._meta.get_field('total_price')
+        delta = self.total_price - (total_field.to_python(previous_total) or 0)
+        if delta:
+            shift_order_summary_total(self.pk, delta)
+            if getattr(self, '_loaded_summary', None) is not None:
+                self._loaded_summary = {**self._loaded_summary, 'total_price': self.total_price}
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # ✅ Remember what the order counts for in its summary row, so save() can move it without re-fetching
+        if not instance.get_deferred_fields() & set(SUMMARY_STATE_FIELDS):
+            instance._loaded_summary = instance.summary_state()
+        return instance
+
+    def stored_summary_state(self, using=None):
+        """Lock the row and return the summary values it holds, or None if it is gone."""
+        stored = (
+            Order.objects.using(using).select_for_update()
+            .filter(pk=self.pk).values(*SUMMARY_STATE_FIELDS).first()
+        )
+        return None if stored is None else self.summary_state(**stored)
+
+    def summary_state(self, **overrides):
+        """The values that decide this order's contribution to its ``OrderSummary`` row."""
+        state = {name: getattr(self, name) for name in SUMMARY_STATE_FIELDS}
+        state.update(overrides)
+        state['total_price'] = self._meta.get_field('total_price').to_python(state['total_price']) or 0
+        return state
+
     def save(self, *args, **kwargs):
-            """Track status changes automatically before saving."""
-            if self.pk:
-                old_order = Order.objects.get(pk=self.pk)
-                if old_order.status != self.status:
-                    OrderStatusHistory.objects.create(
-                        order=self,
-                        previous_status=old_order.status,
-                        new_status=self.status
-                    )
+        """Track status changes and keep the order's summary row up to date when saving."""
+        update_fields = kwargs.get('update_fields')
+        summary_fields = [
+            name for name in SUMMARY_STATE_FIELDS
+            if update_fields is None or name.removesuffix('_id') in update_fields or name in update_fields
+        ]
+        if not summary_fields:
+            # Status is one of these too, so there is nothing to track
+            return super().save(*args, **kwargs)
 
+        using = kwargs.get('using')
+        adding = self._state.adding
+        with transaction.atomic(using=using):
+            if not adding:
+                if not hasattr(self, '_loaded_summary'):
+                    # Some of these were deferred when loaded, so this is the only case that reads first
+                    self._loaded_summary = self.stored_summary_state(using)
+                self._guard_update = True
             super().save(*args, **kwargs)
-            
+            # _do_update() replaces the loaded values with the stored ones if they were stale
+            previous = None if adding else self._loaded_summary
+
+            # Fields left out of update_fields keep their stored values
+            current = self.summary_state(**{**(previous or {}), **{name: getattr(self, name) for name in summary_fields}})
+            if previous is not None and previous['status'] != current['status']:
+                OrderStatusHistory.objects.create(
+                    order=self,
+                    previous_status=previous['status'],
+                    new_status=current['status']
+                )
+            # ✅ Move this order's contribution in the summary table in the same transaction
+            apply_summary_deltas(summary_deltas(previous, current))
+        self._loaded_summary = current
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        if not self.__dict__.pop('_guard_update', False) or self._loaded_summary is None:
+            return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+        # ✅ UPDATE ... WHERE the row still holds the values this instance was loaded with
+        loaded = base_qs.filter(**self._loaded_summary)
+        if super()._do_update(loaded, using, pk_val, values, update_fields, forced_update):
+            return True
+        # Another save, a bulk_transition or a concurrent request has moved it since;
+        # lock the row and start the summary delta from its stored values
+        self._loaded_summary = self.stored_summary_state(using)
+        return super()._do_update(base_qs, using, pk_val, values, update_fields, forced_update)
+
     def __str__(self):
         return f"Order #{self.id} - {self.get_status_display()} by {self.user.username}"
 
@@ -52,33 +137,37 @@ class OrderItem(models.Model):
     quantity = models.PositiveIntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # ✅ Remember what this row contributed to its order total when it was loaded
+        if not instance.get_deferred_fields() & {'order_id', 'price', 'quantity'}:
+            instance._loaded_total = (instance.order_id, instance.line_total)
+        return instance
+
+    @property
+    def line_total(self):
+        price = self._meta.get_field('price').to_python(self.price) or 0
+        return price * self.quantity
+
     def clean(self):
         """Check stock availability before saving."""
-        if self.quantity > self.product.stock:
-            raise ValidationError(f"Insufficient stock for {self.product.name}. Available: {self.product.stock}")
+        if self.quantity > self.product.available_stock:
+            raise ValidationError(f"Insufficient stock for {self.product.name}. Available: {self.product.available_stock}")
 
     @transaction.atomic
     def save(self, *args, **kwargs):
         """Ensure stock update is atomic and prevent race conditions."""
         with transaction.atomic():
-            product = Product.objects.select_for_update().get(id=self.product.id)
-
-            if self.quantity > product.stock:
-                raise ValidationError(f"Insufficient stock for {product.name}. Available: {product.stock}")
+            # ✅ Same locking (or shard reservation) as checkout
+            product = reserve_stock({self.product_id: self.quantity}, source='order_item')[self.product_id]
 
             # If price is not set, use product price
             if not self.price:
                 self.price = product.price
 
-            # Reduce stock
-            product.stock -= self.quantity
-            product.save()
-
             super().save(*args, **kwargs)
 
-            # Update order total price
-            self.order.update_total_price()
-
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
 
@@ -91,20 +180,215 @@ class OrderStatusHistory(models.Model):
     def __str__(self):
         return f"Order {self.order.id} changed from {self.previous_status} to {self.new_status} on {self.changed_at}"
 
-@receiver(post_save, sender=OrderItem)
-@receiver(post_delete, sender=OrderItem)
-def update_order_total(sender, instance, **kwargs):
-    order = instance.order
-    order.total_price = sum(item.price * item.quantity for item in order.items.all())
-    order.save()
-
-@receiver(post_save, sender=Order)
-def log_order_status_change(sender, instance, created, **kwargs):
-    if not created:
-        previous_status = instance.__class__.objects.get(pk=instance.pk).status
-        if previous_status != instance.status:
-            OrderStatusHistory.objects.create(
-                order=instance,
-                previous_status=previous_status,
-                new_status=instance.status
-            )
\ No newline at end of file
+class PaymentAttempt(models.Model):
+    """A payment intent recorded by the API and captured later by ``capture_payments``."""
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (PROCESSING, 'Processing'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='payment_attempts')
+    idempotency_key = models.CharField(max_length=255, unique=True)
+    token = models.CharField(max_length=100)  # Stripe payment token
+    amount = models.DecimalField(max_digits=10, decimal_places=2, null=True)  # Order total when recorded
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    charge_id = models.CharField(max_length=100, blank=True)
+    error = models.TextField(blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # ✅ Serves the capture worker's queue scan
+            models.Index(fields=['status', 'created_at'], name='payment_attempt_queue_idx'),
+        ]
+        constraints = [
+            # ✅ At most one payment in flight per order
+            models.UniqueConstraint(
+                fields=['order'],
+                condition=models.Q(status__in=['pending', 'processing']),
+                name='payment_attempt_active_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Payment {self.idempotency_key} for order {self.order_id}: {self.status}"
+
+class OrderSummary(models.Model):
+    """
+    Per-user, per-day order figures, kept up to date as orders change.
+
+    Maintained by ``Order.save()``, order deletes, item total changes and
+    ``bulk_transition``; writes that skip those (``QuerySet.update()``, bulk
+    imports) leave it stale until ``rebuild_order_summaries`` is run.
+    Revenue is the total of paid orders, refunds included; ``refunded`` is
+    the part of it that was refunded.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='order_summaries')
+    day = models.DateField()
+    order_count = models.IntegerField(default=0)
+    pending_count = models.IntegerField(default=0)
+    processing_count = models.IntegerField(default=0)
+    shipped_count = models.IntegerField(default=0)
+    delivered_count = models.IntegerField(default=0)
+    cancelled_count = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    refunded = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='order_summary_user_day_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} on {self.day}: {self.order_count} orders"
+
+# ✅ Order fields that decide which summary row an order counts in, and for how much
+SUMMARY_STATE_FIELDS = ('user_id', 'created_at', 'status', 'is_paid', 'is_refunded', 'total_price')
+SUMMARY_COUNT_FIELDS = ['order_count'] + [f'{status}_count' for status, _ in Order.STATUS_CHOICES]
+SUMMARY_AMOUNT_FIELDS = ['revenue', 'refunded']
+
+def summary_key(user_id, created_at):
+    return user_id, timezone.localdate(created_at) if timezone.is_aware(created_at) else created_at.date()
+
+def summary_deltas(before, after):
+    """
+    Changes to summary rows when an order's state goes from ``before`` to ``after``.
+
+    Either side may be ``None`` for an order being created or deleted.
+    Returns ``{(user_id, day): {field: delta}}``.
+    """
+    deltas = {}
+    for state, sign in ((before, -1), (after, 1)):
+        if state is None:
+            continue
+        row = deltas.setdefault(summary_key(state['user_id'], state['created_at']), {})
+        contribution = {
+            'order_count': 1,
+            f"{state['status']}_count": 1,
+            'revenue': state['total_price'] if state['is_paid'] else 0,
+            'refunded': state['total_price'] if state['is_refunded'] else 0,
+        }
+        for name, value in contribution.items():
+            row[name] = row.get(name, 0) + sign * value
+    return deltas
+
+def _summary_case(name, deltas):
+    field = OrderSummary._meta.get_field(name)
+    whens = [
+        models.When(user_id=user_id, day=day, then=models.Value(changes[name], output_field=field))
+        for (user_id, day), changes in deltas.items() if changes.get(name)
+    ]
+    return models.F(name) + models.Case(*whens, default=models.Value(0, output_field=field), output_field=field)
+
+def apply_summary_deltas(deltas, create_missing=True):
+    """
+    Add ``deltas`` (from ``summary_deltas``) to the summary table.
+
+    Every touched row is updated by one ``UPDATE`` with a ``CASE`` per
+    column; rows that don't exist yet are inserted with the deltas as their
+    values unless ``create_missing`` is false.
+    """
+    deltas = {key: changes for key, changes in deltas.items() if any(changes.values())}
+    if not deltas:
+        return
+    rows = models.Q()
+    for user_id, day in deltas:
+        rows |= models.Q(user_id=user_id, day=day)
+    names = sorted({name for changes in deltas.values() for name, value in changes.items() if value})
+
+    updated = OrderSummary.objects.filter(rows).update(**{name: _summary_case(name, deltas) for name in names})
+    if updated == len(deltas) or not create_missing:
+        return
+    existing = set(OrderSummary.objects.filter(rows).values_list('user_id', 'day'))
+    missing = {key: changes for key, changes in deltas.items() if key not in existing}
+    try:
+        with transaction.atomic():
+            OrderSummary.objects.bulk_create([
+                OrderSummary(user_id=user_id, day=day, **changes) for (user_id, day), changes in missing.items()
+            ])
+    except IntegrityError:
+        # Another transaction created one of these rows first; add to it instead
+        apply_summary_deltas(missing, create_missing=False)
+
+def shift_order_summary_total(order_id, delta):
+    """Apply a change of ``delta`` in an order's total to its summary row, if the order is paid or refunded."""
+    order = Order.objects.filter(pk=order_id)
+    field = OrderSummary._meta.get_field('revenue')
+
+    def amount(flag):
+        return models.Case(
+            models.When(models.Exists(order.filter(**{flag: True})), then=models.Value(delta, output_field=field)),
+            default=models.Value(0, output_field=field), output_field=field,
+        )
+    # ✅ One UPDATE that finds the row and checks the flags in the database, no read first
+    OrderSummary.objects.filter(
+        user_id=models.Subquery(order.values('user_id')),
+        day=models.Subquery(order.annotate(day=TruncDate('created_at')).values('day')),
+    ).update(revenue=models.F('revenue') + amount('is_paid'), refunded=models.F('refunded') + amount('is_refunded'))
+
+def order_items_total():
+    """Sum of ``price * quantity`` over an order's items, for use in Order queries."""
+    totals = (
+        OrderItem.objects.filter(order=models.OuterRef('pk'))
+        .values('order')
+        .annotate(total=models.Sum(models.F('price') * models.F('quantity')))
+        .values('total')
+    )
+    output_field = models.DecimalField(max_digits=10, decimal_places=2)
+    return Coalesce(models.Subquery(totals, output_field=output_field), models.Value(0), output_field=output_field)
+
+def bulk_transition(queryset, new_status):
+    """
+    Move every order in ``queryset`` to ``new_status`` and record its history.
+
+    Runs four statements whatever the size of the queryset: an
+    ``INSERT ... SELECT`` writing a history row for each order whose status
+    actually changes, a single ``UPDATE`` of the orders, and a grouped
+    ``SELECT`` plus one ``UPDATE`` moving the counts in ``OrderSummary``.
+    Like ``QuerySet.update()`` it bypasses ``Order.save()`` and signals.
+    Returns the number of orders moved.
+    """
+    if new_status not in dict(Order.STATUS_CHOICES):
+        raise ValidationError(f"Invalid order status: {new_status}")
+
+    db = queryset.db
+    connection = connections[db]
+    qn = connection.ops.quote_name
+    history = OrderStatusHistory._meta
+    columns = ', '.join(
+        qn(history.get_field(name).column)
+        for name in ('order', 'previous_status', 'new_status', 'changed_at')
+    )
+
+    changing = queryset.exclude(status=new_status)
+    source = changing.select_for_update().annotate(
+        history_new_status=models.Value(new_status, output_field=models.CharField()),
+        history_changed_at=models.Value(timezone.now(), output_field=models.DateTimeField()),
+    ).values_list('pk', 'status', 'history_new_status', 'history_changed_at')
+
+    with transaction.atomic(using=db):
+        select_sql, params = source.query.get_compiler(using=db).as_sql()
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {qn(history.db_table)} ({columns}) {select_sql}", params)
+        # The changing orders are locked now; count them per summary row and old status
+        moved = (
+            changing.values_list('user_id', TruncDate('created_at'), 'status')
+            .annotate(count=models.Count('pk'))
+            .order_by()
+        )
+        deltas = {}
+        for user_id, day, previous_status, count in moved:
+            changes = deltas.setdefault((user_id, day), {f'{new_status}_count': 0})
+            changes[f'{previous_status}_count'] = changes.get(f'{previous_status}_count', 0) - count
+            changes[f'{new_status}_count'] += count
+        updated = changing.update(status=new_status)
+        apply_summary_deltas(deltas, create_missing=False)
+        return updated
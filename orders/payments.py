@@ -0,0 +1,186 @@
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import stripe
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from shoply.profiling import external_call
+from .models import PaymentAttempt
+
+
+class PaymentError(Exception):
+    """The payment processor declined or failed to process a charge."""
+
+
+class StripeClient:
+    """Charges cards through the Stripe API."""
+
+    def __init__(self):
+        stripe.api_key = settings.STRIPE_SECRET_KEY
+
+    def charge_params(self, amount, description, source, idempotency_key):
+        return {
+            'amount': int(amount * 100),  # Convert to cents
+            'currency': 'usd',
+            'description': description,
+            'source': source,
+            **({'idempotency_key': idempotency_key} if idempotency_key else {}),
+        }
+
+    def charge(self, amount, description, source, idempotency_key=None):
+        """Charge ``amount`` (a Decimal in dollars) and return the charge id."""
+        try:
+            with external_call('stripe'):
+                charge = stripe.Charge.create(**self.charge_params(amount, description, source, idempotency_key))
+        except stripe.error.StripeError as e:
+            raise PaymentError(str(e)) from e
+        return charge["id"]
+
+    async def acharge(self, amount, description, source, idempotency_key=None):
+        """``charge`` over Stripe's async HTTP client (httpx), for async views."""
+        try:
+            with external_call('stripe'):
+                charge = await stripe.Charge.create_async(
+                    **self.charge_params(amount, description, source, idempotency_key)
+                )
+        except stripe.error.StripeError as e:
+            raise PaymentError(str(e)) from e
+        return charge["id"]
+
+
+class FakePaymentClient:
+    """
+    In-process stand-in for ``StripeClient`` for tests and benchmarks.
+
+    Every source succeeds except ``tok_chargeDeclined``. Like Stripe, a
+    repeated idempotency key returns the original charge instead of charging
+    again. Charges are recorded in ``FakePaymentClient.charges``.
+    """
+    charges = {}
+    _lock = threading.Lock()
+
+    def charge(self, amount, description, source, idempotency_key=None):
+        if source == 'tok_chargeDeclined':
+            raise PaymentError("Your card was declined.")
+        with self._lock:
+            key = idempotency_key or f'{len(self.charges)}'
+            if key not in self.charges:
+                charge_id = f"ch_fake_{hashlib.sha1(key.encode()).hexdigest()[:16]}"
+                self.charges[key] = {'id': charge_id, 'amount': amount, 'description': description, 'source': source}
+            return self.charges[key]['id']
+
+    async def acharge(self, amount, description, source, idempotency_key=None):
+        return self.charge(amount, description, source, idempotency_key)
+
+
+def get_payment_client():
+    """Return an instance of the client named by ``settings.PAYMENT_CLIENT``."""
+    return import_string(settings.PAYMENT_CLIENT)()
+
+
+def claim_payment_attempts(batch_size):
+    """
+    Mark up to ``batch_size`` due attempts as processing and return them.
+
+    Pending attempts are claimed with ``SKIP LOCKED`` so several workers can
+    run at once. Attempts left processing for longer than
+    ``PAYMENT_CLAIM_TIMEOUT`` seconds (a worker died mid-capture) are claimed
+    again; the idempotency key keeps the processor from charging twice.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.PAYMENT_CLAIM_TIMEOUT)
+    with transaction.atomic():
+        attempts = list(
+            PaymentAttempt.objects.select_for_update(skip_locked=True, of=('self',))
+            .select_related('order')
+            .filter(Q(status=PaymentAttempt.PENDING) | Q(status=PaymentAttempt.PROCESSING, claimed_at__lt=stale))
+            .order_by('created_at', 'pk')[:batch_size]
+        )
+        PaymentAttempt.objects.filter(pk__in=[attempt.pk for attempt in attempts]).update(
+            status=PaymentAttempt.PROCESSING, claimed_at=now, updated_at=now,
+        )
+    return attempts
+
+
+def capture_payment(attempt, client):
+    """Charge one claimed attempt and record the outcome on it and its order."""
+    order = attempt.order
+    order_fields = []
+    if order.is_paid:
+        attempt.status = PaymentAttempt.FAILED
+        attempt.error = "Order is already paid."
+    else:
+        try:
+            charge_id = client.charge(
+                order.total_price, f'Order #{order.id}', attempt.token, idempotency_key=attempt.idempotency_key,
+            )
+        except PaymentError as e:
+            attempt.status = PaymentAttempt.FAILED
+            attempt.error = str(e)
+            order.payment_status = 'failed'
+            order_fields = ['payment_status']
+        else:
+            attempt.status = PaymentAttempt.SUCCEEDED
+            attempt.charge_id = charge_id
+            order.payment_id = charge_id
+            order.payment_status = 'paid'
+            order.is_paid = True
+            order.status = 'processing'  # Auto-move to processing
+            order_fields = ['payment_id', 'payment_status', 'is_paid', 'status']
+
+    with transaction.atomic():
+        attempt.save(update_fields=['status', 'charge_id', 'error', 'updated_at'])
+        if order_fields:
+            # ✅ One UPDATE for all payment fields (plus the status history row)
+            order.save(update_fields=order_fields)
+    return attempt
+
+
+def capture_pending_payments(batch_size=50, workers=None, client=None):
+    """
+    Claim a batch of pending payments and capture them concurrently.
+
+    Charges run on a pool of ``workers`` threads (``PAYMENT_CAPTURE_WORKERS``
+    by default), since each one mostly waits on the processor. With one
+    worker everything runs in the calling thread. Returns the attempts.
+    """
+    workers = settings.PAYMENT_CAPTURE_WORKERS if workers is None else workers
+    client = client or get_payment_client()
+    attempts = claim_payment_attempts(batch_size)
+    if workers <= 1 or len(attempts) <= 1:
+        return [capture_payment(attempt, client) for attempt in attempts]
+
+    def capture(attempt):
+        try:
+            return capture_payment(attempt, client)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(capture, attempts))
+
+
+def record_payment_attempt(order, token, idempotency_key):
+    """
+    Record a pending payment for ``order`` and return ``(attempt, created)``.
+
+    If the order already has a payment in flight that attempt is returned
+    instead, so a double-submitted form can't charge the card twice.
+    """
+    try:
+        with transaction.atomic():
+            return PaymentAttempt.objects.create(
+                order=order, token=token, amount=order.total_price, idempotency_key=idempotency_key,
+            ), True
+    except IntegrityError:
+        attempt = PaymentAttempt.objects.filter(
+            Q(idempotency_key=idempotency_key) | Q(order=order, status__in=[PaymentAttempt.PENDING, PaymentAttempt.PROCESSING])
+        ).order_by('-created_at').first()
+        if attempt is None:
+            raise
+        return attempt, False
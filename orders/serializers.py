@@ -1,9 +1,29 @@
+from collections import defaultdict
+from decimal import Decimal
 from rest_framework import serializers
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import transaction
-from .models import Order, OrderItem
+from django.db.models import prefetch_related_objects
+from .models import SUMMARY_AMOUNT_FIELDS, SUMMARY_COUNT_FIELDS, Order, OrderItem, OrderSummary, PaymentAttempt, items_prefetch
+from products.inventory import reserve_stock
 from products.models import Product
 
+class CartProductField(serializers.PrimaryKeyRelatedField):
+    """Resolves a line's product from the ones ``OrderSerializer`` loaded for the whole cart."""
+
+    def to_internal_value(self, data):
+        products = self.context.get('cart_products')
+        if products is None:
+            return super().to_internal_value(data)
+        try:
+            return products[Product._meta.pk.to_python(data)]
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
 class OrderItemSerializer(serializers.ModelSerializer):
+    product = CartProductField(queryset=Product.objects.all())
     product_name = serializers.ReadOnlyField(source='product.name')
 
     class Meta:
@@ -17,6 +37,20 @@ class OrderSerializer(serializers.ModelSerializer):
         model = Order
         fields = ['id', 'created_at', 'total_price', 'is_paid', 'status', 'items']
 
+    def to_internal_value(self, data):
+        # ✅ Look up every product in the cart with one query instead of one per line
+        items = data.get('items') if hasattr(data, 'get') else None
+        if isinstance(items, list):
+            ids = set()
+            for item in items:
+                try:
+                    ids.add(Product._meta.pk.to_python(item.get('product')))
+                except (AttributeError, TypeError, DjangoValidationError):
+                    continue  # Reported by the item's own validation
+            ids.discard(None)
+            self.context['cart_products'] = Product.objects.defer('search_vector').in_bulk(ids)
+        return super().to_internal_value(data)
+
     def validate_items(self, value):
         if not value:
             raise serializers.ValidationError("Order must contain at least one item.")
@@ -25,55 +59,46 @@ class OrderSerializer(serializers.ModelSerializer):
     @transaction.atomic  # ✅ Ensures atomicity
     def create(self, validated_data):
         items_data = validated_data.pop('items', [])
-        order = Order.objects.create(user=self.context['request'].user, **validated_data)
-        total = 0
-        stock_rollback = []  # ✅ Track stock rollback
-        
+
+        # ✅ Lock every product in the cart with one query and take the stock in bulk
+        quantities = defaultdict(int)
+        for item_data in items_data:
+            quantities[item_data['product'].id] += item_data['quantity']
         try:
-            for item_data in items_data:
-                product = Product.objects.select_for_update().get(id=item_data['product'].id)
-
-                # ✅ Check stock
-                if item_data['quantity'] > product.stock:
-                    raise serializers.ValidationError(
-                        f"Insufficient stock for {product.name}. Available: {product.stock}"
-                    )
-
-                order_item = OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    quantity=item_data['quantity'],
-                    price=item_data.get('price', product.price)
-                )
-
-                total += float(order_item.price) * order_item.quantity
-                stock_rollback.append((product, item_data['quantity']))
-                product.stock -= item_data['quantity']
-                product.save()
-
-            order.total_price = total
-            order.save()
-            return order
-
-        except Exception as e:
-            # ✅ Rollback stock on failure
-            for product, quantity in stock_rollback:
-                product.stock += quantity
-                product.save()
-            raise e  # Re-raise the exception after rollback
-
-    def to_representation(self, instance):
-        response = super().to_representation(instance)
-        response['items'] = OrderItemSerializer(instance.items.all(), many=True).data
-        return response
+            products = reserve_stock(quantities)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.messages)
+
+        lines = []
+        total = Decimal('0')
+        for item_data in items_data:
+            product = products[item_data['product'].id]
+            price = item_data.get('price', product.price)
+            total += price * item_data['quantity']
+            lines.append((product, item_data['quantity'], price))
+
+        order = Order.objects.create(user_id=self.context['request'].user.pk, total_price=total, **validated_data)
+
+        # ✅ Stock is already reserved, so bypass OrderItem.save and insert all lines at once
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=quantity, price=price)
+            for product, quantity, price in lines
+        ])
+        # ✅ Render the response's items and product names with one query
+        prefetch_related_objects([order], items_prefetch())
+        return order
 
 class PaymentSerializer(serializers.Serializer):
     order_id = serializers.IntegerField()
     token = serializers.CharField(max_length=100)  # Stripe payment token
 
+    def get_order_queryset(self):
+        return Order.objects.all()
+
     def validate(self, data):
         try:
-            order = Order.objects.get(id=data['order_id'], is_paid=False)
+            # ✅ Keep the order so the view doesn't fetch it again
+            data['order'] = self.get_order_queryset().get(id=data['order_id'], is_paid=False)
         except Order.DoesNotExist:
             raise serializers.ValidationError("Order not found or already paid.")
         return data
@@ -87,6 +112,16 @@ class PaymentSerializer(serializers.Serializer):
             raise serializers.ValidationError("Invalid payment status.")
         return value
 
+class PaymentIntentRequestSerializer(PaymentSerializer):
+    def get_order_queryset(self):
+        return Order.objects.filter(user_id=self.context['request'].user.pk)
+
+class PaymentAttemptSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PaymentAttempt
+        fields = ['id', 'order', 'status', 'charge_id', 'error', 'created_at', 'updated_at']
+        read_only_fields = fields
+
 class CancellationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Order
@@ -102,4 +137,22 @@ class CancellationSerializer(serializers.ModelSerializer):
         if instance.is_paid:
             validated_data['is_refunded'] = True
             validated_data['refund_id'] = f"REF-{instance.id}"
-        return super().update(instance, validated_data)
\ No newline at end of file
+        return super().update(instance, validated_data)
+
+class OrderSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderSummary
+        fields = ['day'] + SUMMARY_COUNT_FIELDS + SUMMARY_AMOUNT_FIELDS
+        read_only_fields = fields
+
+class OrderSummaryTotalsSerializer(serializers.Serializer):
+    """Sums of the summary rows in a date range; ``total_spent`` is revenue net of refunds."""
+    order_count = serializers.IntegerField()
+    pending_count = serializers.IntegerField()
+    processing_count = serializers.IntegerField()
+    shipped_count = serializers.IntegerField()
+    delivered_count = serializers.IntegerField()
+    cancelled_count = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=12, decimal_places=2)
+    refunded = serializers.DecimalField(max_digits=12, decimal_places=2)
+    total_spent = serializers.DecimalField(max_digits=12, decimal_places=2)
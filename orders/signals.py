@@ -1,9 +1,59 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from .models import OrderItem
+from .models import SUMMARY_STATE_FIELDS, Order, OrderItem, apply_summary_deltas, shift_order_summary_total, summary_deltas
+
+
+def apply_total_delta(item, order_id, delta):
+    """Shift an order's total_price by ``delta`` with an atomic UPDATE."""
+    if not delta:
+        return
+    Order.objects.filter(pk=order_id).update(total_price=F('total_price') + delta)
+    shift_order_summary_total(order_id, delta)
+
+    # Keep an already-loaded order in sync so a later save() doesn't write a stale total
+    if OrderItem.order.is_cached(item) and item.order.pk == order_id:
+        order = item.order
+        total_field = Order._meta.get_field('total_price')
+        order.total_price = total_field.to_python(order.total_price) + delta
+        if getattr(order, '_loaded_summary', None) is not None:
+            order._loaded_summary = {**order._loaded_summary, 'total_price': order._loaded_summary['total_price'] + delta}
+
 
 @receiver(post_save, sender=OrderItem)
+def update_order_total_on_save(sender, instance, raw=False, **kwargs):
+    """Apply the change in this item's line total instead of re-summing the order."""
+    if raw:
+        return
+    previous_order_id, previous_total = getattr(instance, '_loaded_total', (instance.order_id, 0))
+    current_total = instance.line_total
+
+    if previous_order_id != instance.order_id:
+        apply_total_delta(instance, previous_order_id, -previous_total)
+        previous_total = 0
+    apply_total_delta(instance, instance.order_id, current_total - previous_total)
+    instance._loaded_total = (instance.order_id, current_total)
+
+
 @receiver(post_delete, sender=OrderItem)
-def update_order_total(sender, instance, **kwargs):
-    """Automatically update order total whenever OrderItem is modified."""
-    instance.order.update_total_price()
+def update_order_total_on_delete(sender, instance, origin=None, **kwargs):
+    """Remove the deleted item's line total from its order."""
+    if isinstance(origin, Order):
+        return  # The order itself is being deleted
+    order_id, line_total = getattr(instance, '_loaded_total', (instance.order_id, instance.line_total))
+    apply_total_delta(instance, order_id, -line_total)
+
+
+@receiver(pre_delete, sender=Order)
+def update_order_summary_on_delete(sender, instance, origin=None, **kwargs):
+    """Take the deleted order out of its summary row."""
+    if origin is instance or instance.get_deferred_fields() & set(SUMMARY_STATE_FIELDS):
+        # order.delete() runs on the caller's instance, which may be stale; use the stored values
+        stored = Order.objects.filter(pk=instance.pk).values(*SUMMARY_STATE_FIELDS).first()
+        if stored is None:
+            return
+        state = instance.summary_state(**stored)
+    else:
+        state = instance.summary_state()  # Just loaded by the cascade
+    # The row is gone too when the user is being deleted, so never recreate it
+    apply_summary_deltas(summary_deltas(state, None), create_missing=False)
@@ -3,10 +3,32 @@ from rest_framework import status
 from rest_framework.test import APITestCase
 from django.contrib.auth import get_user_model
 from products.models import Product
-from .models import Order, OrderItem, OrderStatusHistory
+from .models import Order, OrderItem, OrderStatusHistory, OrderSummary, PaymentAttempt, bulk_transition
+from shoply.bulk import FORMATS
+from .idempotency import get_idempotency_cache
+from .payments import FakePaymentClient
+from .serializers import OrderSerializer
+from .views import AsyncPaymentView
+from shoply.budgets import Budget, EndpointBudgetMixin
+from shoply.metrics import REGISTRY, Counter, Histogram, MetricsRegistry
+from shoply.profiling import RequestProfilingMiddleware, normalize_sql
+from users.authentication import ClaimsRefreshToken
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.http import HttpResponse
 from unittest import mock
-from django.test import TestCase
+from io import StringIO
+from datetime import timedelta
+from importlib import import_module
+from django.apps import apps as django_apps
+from django.core.management import call_command
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+import json
+import multiprocessing
+import os
 import stripe
+import tempfile
 
 User = get_user_model()
 
@@ -29,6 +51,40 @@ class OrderModelTests(TestCase):
         self.order.refresh_from_db()
         self.assertEqual(float(self.order.total_price), 200.00)
 
+    def test_order_total_tracks_item_changes(self):
+        """Ensure item updates and deletes shift the total by their delta."""
+        first = OrderItem.objects.create(order=self.order, product=self.product, quantity=2, price=100.00)
+        OrderItem.objects.create(order=self.order, product=self.product, quantity=1, price=50.00)
+
+        item = OrderItem.objects.get(pk=first.pk)
+        item.quantity = 3
+        item.save()
+        self.order.refresh_from_db()
+        self.assertEqual(float(self.order.total_price), 350.00)
+
+        item.delete()
+        self.order.refresh_from_db()
+        self.assertEqual(float(self.order.total_price), 50.00)
+
+    def test_adding_items_does_not_resum_order(self):
+        """Ensure adding an item never re-reads the order's other items."""
+        OrderItem.objects.create(order=self.order, product=self.product, quantity=1, price=100.00)
+        with CaptureQueriesContext(connection) as ctx:
+            OrderItem.objects.create(order=self.order, product=self.product, quantity=1, price=100.00)
+        self.assertFalse([q for q in ctx.captured_queries if 'FROM "orders_orderitem"' in q['sql']])
+        self.assertEqual(float(self.order.total_price), 200.00)
+
+    def test_reconcile_order_totals_fixes_mismatch(self):
+        """Ensure the reconciliation command repairs drifted totals."""
+        OrderItem.objects.create(order=self.order, product=self.product, quantity=2, price=100.00)
+        Order.objects.filter(pk=self.order.pk).update(total_price=1)
+
+        out = StringIO()
+        call_command('reconcile_order_totals', '--fix', stdout=out)
+        self.order.refresh_from_db()
+        self.assertEqual(float(self.order.total_price), 200.00)
+        self.assertIn(f"Order #{self.order.pk}", out.getvalue())
+
     def test_stock_rollback_on_failure(self):
         """Ensure stock is rolled back if transaction fails."""
         try:
@@ -50,6 +106,44 @@ class OrderModelTests(TestCase):
         self.assertEqual(history.previous_status, 'pending')
         self.assertEqual(history.new_status, 'shipped')
 
+    def test_status_change_does_not_refetch_order(self):
+        """Ensure saving a status change never re-reads the order row."""
+        with CaptureQueriesContext(connection) as ctx:
+            self.order.status = 'processing'
+            self.order.save()
+            self.order.status = 'shipped'
+            self.order.save()
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('SELECT')])
+        self.assertEqual(
+            list(self.order.status_history.order_by('id').values_list('previous_status', 'new_status')),
+            [('pending', 'processing'), ('processing', 'shipped')]
+        )
+
+    def test_save_without_status_change_writes_no_history(self):
+        """Ensure unrelated updates don't create history rows."""
+        order = Order.objects.get(pk=self.order.pk)
+        order.is_paid = True
+        order.save()
+        self.assertFalse(OrderStatusHistory.objects.exists())
+
+    def test_bulk_transition(self):
+        """Ensure bulk_transition moves orders, logs history and updates summaries in four statements."""
+        shipped = Order.objects.create(user=self.user, status='shipped')
+        Order.objects.create(user=self.user, status='processing')
+
+        with CaptureQueriesContext(connection) as ctx:
+            moved = bulk_transition(Order.objects.filter(user=self.user), 'shipped')
+        statements = [q for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]
+
+        self.assertEqual(moved, 2)
+        self.assertEqual(len(statements), 4)
+        self.assertFalse(Order.objects.exclude(status='shipped').exists())
+        self.assertFalse(shipped.status_history.exists())
+        self.assertEqual(
+            sorted(OrderStatusHistory.objects.values_list('previous_status', 'new_status')),
+            [('pending', 'shipped'), ('processing', 'shipped')]
+        )
+
 class OrderAPITests(APITestCase):
 
     def setUp(self):
@@ -86,6 +180,65 @@ class OrderAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(len(response.data['items']), 2)
 
+    # ✅ Test listing orders costs the same number of queries whatever the page size
+    def test_order_list_query_count_is_constant(self):
+        def make_orders(count):
+            for _ in range(count):
+                order = Order.objects.create(user=self.user)
+                OrderItem.objects.bulk_create([
+                    OrderItem(order=order, product=self.product1, quantity=1, price=100),
+                    OrderItem(order=order, product=self.product2, quantity=1, price=200),
+                ])
+
+        # count + orders + items joined with their products
+        make_orders(2)
+        with self.assertNumQueries(3):
+            response = self.client.get(self.order_list_url, {'page_size': 100})
+        self.assertEqual(len(response.data['results']), 2)
+
+        make_orders(48)
+        with self.assertNumQueries(3):
+            response = self.client.get(self.order_list_url, {'page_size': 100})
+        self.assertEqual(len(response.data['results']), 50)
+        self.assertEqual(response.data['results'][0]['items'][0]['product_name'], "Product 1")
+
+    # ✅ Test updating an order re-reads its items with one query whatever their number
+    def test_order_update_query_count_is_constant(self):
+        order = Order.objects.create(user=self.user)
+        detail_url = reverse('order-detail', kwargs={'pk': order.pk})
+        for status_value, items in [('processing', 2), ('shipped', 20)]:
+            order.items.all().delete()
+            products = Product.objects.bulk_create([Product(name=f"Line {n}", price=1, stock=1) for n in range(items)])
+            OrderItem.objects.bulk_create([OrderItem(order=order, product=p, quantity=1, price=1) for p in products])
+            with self.assertNumQueries(8):
+                response = self.client.patch(detail_url, {'status': status_value}, format='json')
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(len(response.data['items']), items)
+            self.assertIn("Line 0", [item['product_name'] for item in response.data['items']])
+
+    # ✅ Test cursor pagination walks every order once, even with identical timestamps
+    def test_order_list_cursor_pagination(self):
+        orders = [Order.objects.create(user=self.user) for _ in range(7)]
+        Order.objects.filter(pk__in=[o.pk for o in orders[2:5]]).update(created_at=orders[2].created_at)
+        expected = list(Order.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+        seen = []
+        response = self.client.get(self.order_list_url, {'pagination': 'cursor', 'page_size': 3})
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(order['id'] for order in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(seen, expected)
+
+        previous = self.client.get(response.data['previous'])
+        self.assertEqual([order['id'] for order in previous.data['results']], expected[3:6])
+
+    def test_order_list_invalid_cursor(self):
+        response = self.client.get(self.order_list_url, {'cursor': 'cD1bInllc3RlcmRheSIsIjEiXQ=='})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
     # ✅ Test insufficient stock scenario
     def test_create_order_insufficient_stock(self):
         data = {
@@ -96,6 +249,80 @@ class OrderAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn('Insufficient stock for Product 2', str(response.data))
 
+    # ✅ Test stock is taken exactly once per line, including repeated products
+    def test_create_order_reserves_stock_once(self):
+        data = {
+            "items": [
+                {"product": self.product1.id, "quantity": 2, "price": 100.00},
+                {"product": self.product2.id, "quantity": 1, "price": 200.00},
+                {"product": self.product1.id, "quantity": 3, "price": 100.00}
+            ]
+        }
+        response = self.client.post(self.order_create_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.product1.refresh_from_db()
+        self.product2.refresh_from_db()
+        self.assertEqual(self.product1.stock, 5)
+        self.assertEqual(self.product2.stock, 4)
+        self.assertEqual(response.data['total_price'], '700.00')
+
+    # ✅ Test insufficient stock leaves every product untouched
+    def test_create_order_insufficient_stock_keeps_other_lines(self):
+        data = {
+            "items": [
+                {"product": self.product1.id, "quantity": 2, "price": 100.00},
+                {"product": self.product2.id, "quantity": 6, "price": 200.00}
+            ]
+        }
+        response = self.client.post(self.order_create_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.stock, 10)
+        self.assertFalse(Order.objects.exists())
+
+    # ✅ Test the locked section issues the same statements whatever the cart size
+    def test_create_order_write_queries_do_not_grow_with_cart(self):
+        products = Product.objects.bulk_create([
+            Product(name=f"Bulk {i}", price=10, stock=10) for i in range(20)
+        ])
+        # The user's first order of the day also inserts its summary row
+        Order.objects.create(user=self.user)
+
+        def write_queries(cart):
+            data = {"items": [{"product": p.id, "quantity": 1, "price": "10.00"} for p in cart]}
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.post(self.order_create_url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            return [q['sql'] for q in ctx.captured_queries
+                    if 'FOR UPDATE' in q['sql'] or q['sql'].startswith(('UPDATE', 'INSERT'))]
+
+        self.assertEqual(len(write_queries(products[:2])), len(write_queries(products)))
+
+    # ✅ Test validating the cart and rendering the order cost the same whatever its size
+    def test_create_order_queries_do_not_grow_with_cart(self):
+        products = Product.objects.bulk_create([
+            Product(name=f"Bulk {i}", price=10, stock=10) for i in range(20)
+        ])
+        Order.objects.create(user=self.user)
+
+        def queries(cart):
+            data = {"items": [{"product": p.id, "quantity": 1, "price": "10.00"} for p in cart]}
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.post(self.order_create_url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertCountEqual([item['product_name'] for item in response.data['items']], [p.name for p in cart])
+            return len(ctx)
+
+        self.assertEqual(queries(products[:1]), queries(products))
+
+    # ✅ Test unknown and malformed product ids are still reported per line
+    def test_create_order_reports_bad_products(self):
+        data = {"items": [{"product": 999999, "quantity": 1}, {"product": "abc", "quantity": 1}]}
+        response = self.client.post(self.order_create_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('does not exist', str(response.data['items'][0]['product']))
+        self.assertIn('Incorrect type', str(response.data['items'][1]['product']))
+
     def test_create_order_invalid_data(self):
         # No items provided
         data = {}
@@ -236,6 +463,18 @@ class PaymentAPITests(APITestCase):
         self.assertFalse(self.order.is_paid)
         self.assertIn("Payment failed", str(response.data))
 
+    # ✅ Test the order validated by the serializer is reused and saved in one UPDATE
+    @mock.patch('stripe.Charge.create')
+    def test_payment_reads_and_writes_order_once(self, mock_charge):
+        mock_charge.return_value = {"id": "ch_12345"}
+
+        data = {"order_id": self.order.id, "token": "tok_visa"}
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(self.payment_url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        order_queries = [q['sql'] for q in ctx.captured_queries if 'FROM "orders_order"' in q['sql'] or q['sql'].startswith('UPDATE "orders_order"')]
+        self.assertEqual(len(order_queries), 2, order_queries)
+
     def test_payment_with_invalid_order(self):
         # Invalid order ID
         data = {
@@ -262,6 +501,672 @@ class PaymentAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn("Order not found or already paid.", str(response.data))
 
+@override_settings(PAYMENT_CLIENT='orders.payments.FakePaymentClient')
+class PaymentIntentTests(APITestCase):
+
+    def setUp(self):
+        FakePaymentClient.charges.clear()
+        self.user = User.objects.create_user(username='payer', email='payer@example.com', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+        self.order = Order.objects.create(user=self.user, total_price=120.00)
+        self.url = reverse('payment-intent-create')
+
+    def create_intent(self, token="tok_visa", **extra):
+        return self.client.post(self.url, {"order_id": self.order.id, "token": token}, format='json', **extra)
+
+    def capture(self):
+        call_command('capture_payments', workers=1, stdout=StringIO())
+
+    # ✅ Test the endpoint records a pending payment without charging
+    def test_intent_is_accepted_and_pending(self):
+        response = self.create_intent()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], PaymentAttempt.PENDING)
+        self.assertEqual(response['Location'], reverse('payment-intent-detail', kwargs={'pk': response.data['id']}))
+        self.assertEqual(FakePaymentClient.charges, {})
+        self.order.refresh_from_db()
+        self.assertFalse(self.order.is_paid)
+
+    # ✅ Test the worker captures the charge and updates the order in one write
+    def test_capture_marks_order_paid(self):
+        attempt_id = self.create_intent().data['id']
+        with CaptureQueriesContext(connection) as ctx:
+            self.capture()
+        order_updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "orders_order"')]
+        self.assertEqual(len(order_updates), 1)
+
+        self.order.refresh_from_db()
+        self.assertTrue(self.order.is_paid)
+        self.assertEqual(self.order.payment_status, 'paid')
+        self.assertEqual(self.order.status, 'processing')
+        self.assertTrue(self.order.status_history.filter(new_status='processing').exists())
+
+        response = self.client.get(reverse('payment-intent-detail', kwargs={'pk': attempt_id}))
+        self.assertEqual(response.data['status'], PaymentAttempt.SUCCEEDED)
+        self.assertEqual(response.data['charge_id'], self.order.payment_id)
+
+    # ✅ Test a declined card fails the attempt and leaves the order unpaid
+    def test_capture_declined(self):
+        attempt_id = self.create_intent(token="tok_chargeDeclined").data['id']
+        self.capture()
+
+        response = self.client.get(reverse('payment-intent-detail', kwargs={'pk': attempt_id}))
+        self.assertEqual(response.data['status'], PaymentAttempt.FAILED)
+        self.assertIn("declined", response.data['error'])
+        self.order.refresh_from_db()
+        self.assertFalse(self.order.is_paid)
+        self.assertEqual(self.order.payment_status, 'failed')
+
+    # ✅ Test retries with the same key, or while a payment is in flight, reuse the attempt
+    def test_repeated_requests_reuse_attempt(self):
+        first = self.create_intent(HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(self.create_intent().data['id'], first.data['id'])
+
+        self.capture()
+        replay = self.create_intent(HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(replay.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(replay.data['id'], first.data['id'])
+        self.assertEqual(replay.data['status'], PaymentAttempt.SUCCEEDED)
+        self.assertEqual(len(FakePaymentClient.charges), 1)
+
+    # ✅ Test a key reused for another card, order or amount is refused
+    def test_reused_key_for_different_request(self):
+        self.create_intent(HTTP_IDEMPOTENCY_KEY='abc')
+        response = self.create_intent(token="tok_mastercard", HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        other = Order.objects.create(user=self.user, total_price=5.00)
+        response = self.client.post(self.url, {"order_id": other.id, "token": "tok_visa"}, format='json',
+                                    HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        Order.objects.filter(pk=self.order.pk).update(total_price=150.00)
+        response = self.create_intent(HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(PaymentAttempt.objects.count(), 1)
+
+    # ✅ Test a key that won't fit the column once scoped to the user is rejected
+    def test_key_too_long(self):
+        max_length = PaymentAttempt._meta.get_field('idempotency_key').max_length - len(f'{self.user.pk}:')
+        response = self.create_intent(HTTP_IDEMPOTENCY_KEY='k' * (max_length + 1))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(PaymentAttempt.objects.exists())
+
+        response = self.create_intent(HTTP_IDEMPOTENCY_KEY='k' * max_length)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+    # ✅ Test users can't pay for or poll other users' orders
+    def test_other_users_orders_are_hidden(self):
+        attempt_id = self.create_intent().data['id']
+        other = User.objects.create_user(username='other', email='other@example.com', password='testpassword')
+        self.client.force_authenticate(user=other)
+
+        response = self.create_intent()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse('payment-intent-detail', kwargs={'pk': attempt_id}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+class IdempotencyKeyTests(APITestCase):
+
+    def setUp(self):
+        get_idempotency_cache().clear()
+        self.user = User.objects.create_user(username='retrier', email='retrier@example.com', password='testpassword')
+        self.client.force_authenticate(user=self.user)
+        self.product = Product.objects.create(name="Retry Product", price=50.00, stock=10)
+        self.url = reverse('order-create')
+        self.payload = {"items": [{"product": self.product.id, "quantity": 2, "price": "50.00"}]}
+
+    def create(self, key, payload=None):
+        return self.client.post(self.url, payload or self.payload, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    # ✅ Test a retried checkout replays the first response without touching products
+    def test_retry_replays_response(self):
+        first = self.create('order-1')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+
+        with CaptureQueriesContext(connection) as ctx:
+            retry = self.create('order-1')
+        self.assertFalse([q for q in ctx.captured_queries if 'products_product' in q['sql']])
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data, first.data)
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 8)
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 1)
+
+    # ✅ Test a key survives however much the catalog caches in the meantime
+    def test_retry_after_catalog_traffic(self):
+        first = self.create('order-1')
+        for n in range(400):
+            self.client.get(reverse('product-list'), {'min_price': n})
+        retry = self.create('order-1')
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(Order.objects.filter(user=self.user).count(), 1)
+
+    # ✅ Test a key reused with a different body is rejected
+    def test_key_reused_for_different_request(self):
+        self.create('order-1')
+        payload = {"items": [{"product": self.product.id, "quantity": 1, "price": "50.00"}]}
+        response = self.create('order-1', payload)
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    # ✅ Test failures aren't stored, so the same key can be retried
+    def test_failed_request_can_be_retried(self):
+        payload = {"items": [{"product": self.product.id, "quantity": 20, "price": "50.00"}]}
+        self.assertEqual(self.create('order-1', payload).status_code, status.HTTP_400_BAD_REQUEST)
+        Product.objects.filter(pk=self.product.pk).update(stock=20)
+        self.assertEqual(self.create('order-1', payload).status_code, status.HTTP_201_CREATED)
+
+    # ✅ Test a retry arriving while the first request is still running gets 409
+    def test_concurrent_retry_conflicts(self):
+        responses = []
+        original_create = OrderSerializer.create
+
+        def create_and_retry(serializer, validated_data):
+            responses.append(self.create('order-1'))
+            return original_create(serializer, validated_data)
+
+        with mock.patch.object(OrderSerializer, 'create', create_and_retry):
+            self.assertEqual(self.create('order-1').status_code, status.HTTP_201_CREATED)
+        self.assertEqual(responses[0].status_code, status.HTTP_409_CONFLICT)
+
+    # ✅ Test keys are scoped per user
+    def test_keys_are_per_user(self):
+        self.create('order-1')
+        other = User.objects.create_user(username='other', email='other@example.com', password='testpassword')
+        self.client.force_authenticate(user=other)
+        response = self.create('order-1')
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(Order.objects.filter(user=other).count(), 1)
+
+    # ✅ Test a retried payment charges the card once
+    @mock.patch('stripe.Charge.create')
+    def test_payment_retry_charges_once(self, mock_charge):
+        mock_charge.return_value = {"id": "ch_12345"}
+        order = Order.objects.create(user=self.user, total_price=100.00)
+        data = {"order_id": order.id, "token": "tok_visa"}
+
+        for _ in range(2):
+            response = self.client.post(reverse('order-payment'), data, format='json', HTTP_IDEMPOTENCY_KEY='pay-1')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data['payment_id'], "ch_12345")
+        self.assertEqual(mock_charge.call_count, 1)
+
+class OrderBulkTransferTests(APITestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin', email='admin@example.com', password='testpassword', is_staff=True)
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='testpassword')
+        self.client.force_authenticate(user=self.admin)
+        self.product = Product.objects.create(name="Export Product", price=25.00, stock=100)
+        self.orders = []
+        for quantity in (1, 2, 3):
+            order = Order.objects.create(user=self.user)
+            OrderItem.objects.create(order=order, product=self.product, quantity=quantity, price=25)
+            self.orders.append(order)
+        self.orders[0].status = 'shipped'
+        self.orders[0].save()
+
+    def export(self, resource, fmt, **params):
+        response = self.client.get(reverse('order-export', args=[resource, fmt]), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def import_(self, resource, fmt, body):
+        return self.client.post(reverse('order-import', args=[resource, fmt]), body, content_type=FORMATS[fmt])
+
+    # ✅ Test only admins can export or import
+    def test_admin_only(self):
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.get(reverse('order-export', args=['orders', 'ndjson'])).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.import_('orders', 'ndjson', '').status_code, status.HTTP_403_FORBIDDEN)
+
+    # ✅ Test NDJSON export has one object per order in id order
+    def test_export_orders_ndjson(self):
+        rows = [json.loads(line) for line in self.export('orders', 'ndjson').splitlines()]
+        self.assertEqual([row['id'] for row in rows], [order.id for order in self.orders])
+        self.assertEqual(rows[0]['user_id'], self.user.id)
+        self.assertEqual(rows[0]['status'], 'shipped')
+        self.assertEqual(rows[1]['total_price'], '50.00')
+
+    # ✅ Test CSV export of items and history, with a date filter
+    def test_export_csv(self):
+        lines = self.export('items', 'csv').splitlines()
+        self.assertEqual(lines[0], 'id,order_id,product_id,quantity,price')
+        self.assertEqual(len(lines), 4)
+
+        lines = self.export('history', 'csv').splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('pending,shipped', lines[1])
+
+        future = (self.orders[-1].created_at + timedelta(days=1)).isoformat()
+        self.assertEqual(len(self.export('orders', 'csv', created_after=future).splitlines()), 1)
+
+    # ✅ Test unknown tables or formats are 404s
+    def test_export_unknown_resource(self):
+        response = self.client.get(reverse('order-export', args=['users', 'ndjson']))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    # ✅ Test an export can be imported back with ids and timestamps intact
+    @override_settings(ORDER_IMPORT_BATCH_SIZE=2)
+    def test_export_import_round_trip(self):
+        exported = {resource: self.export(resource, fmt) for resource, fmt in
+                    (('orders', 'ndjson'), ('items', 'csv'), ('history', 'ndjson'))}
+        before = list(Order.objects.order_by('pk').values())
+        Order.objects.all().delete()
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.import_('orders', 'ndjson', exported['orders'])
+        self.assertEqual(response.data, {'created': 3, 'updated': 0, 'failed': 0, 'errors': []})
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "orders_order"')]
+        self.assertEqual(len(inserts), 2)
+        self.assertEqual(list(Order.objects.order_by('pk').values()), before)
+
+        self.assertEqual(self.import_('items', 'csv', exported['items']).data['created'], 3)
+        self.assertEqual(self.import_('history', 'ndjson', exported['history']).data['created'], 1)
+        self.assertEqual(Order.objects.create(user=self.user).pk, self.orders[-1].pk + 1)
+
+    # ✅ Test invalid rows are reported by line and the rest are imported
+    def test_import_reports_invalid_rows(self):
+        body = "\n".join([
+            json.dumps({"user_id": self.user.id, "total_price": "10.00", "status": "pending"}),
+            json.dumps({"user_id": 9999, "total_price": "10.00"}),
+            json.dumps({"user_id": self.user.id, "total_price": "ten", "status": "lost"}),
+            "not json",
+            json.dumps({"id": self.orders[0].id, "user_id": self.user.id, "total_price": "1.00"}),
+        ])
+        response = self.import_('orders', 'ndjson', body)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['failed'], 4)
+        errors = {error['line']: error['errors'] for error in response.data['errors']}
+        self.assertEqual(set(errors), {2, 3, 4, 5})
+        self.assertIn('user_id', errors[2])
+        self.assertEqual(set(errors[3]), {'total_price', 'status'})
+        self.assertIn('already exists', errors[5]['id'][0])
+
+class OrderSummaryTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='summaryuser', email='summary@example.com', password='testpass')
+        self.other = User.objects.create_user(username='otheruser', email='other@example.com', password='testpass')
+        self.product = Product.objects.create(name='Summary Product', price=25.00, stock=100)
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('order-summary')
+
+    def summary(self, user=None):
+        row = OrderSummary.objects.get(user=user or self.user)
+        return {name: getattr(row, name) for name in (
+            'order_count', 'pending_count', 'processing_count', 'cancelled_count', 'revenue', 'refunded')}
+
+    def assertMatchesRebuild(self):
+        """The incrementally maintained table must equal a rebuild from scratch."""
+        maintained = sorted(OrderSummary.objects.values_list(
+            'user_id', 'day', 'order_count', 'pending_count', 'processing_count', 'shipped_count',
+            'delivered_count', 'cancelled_count', 'revenue', 'refunded'))
+        call_command('rebuild_order_summaries', stdout=StringIO())
+        rebuilt = sorted(OrderSummary.objects.values_list(
+            'user_id', 'day', 'order_count', 'pending_count', 'processing_count', 'shipped_count',
+            'delivered_count', 'cancelled_count', 'revenue', 'refunded'))
+        self.assertEqual(maintained, rebuilt)
+
+    # ✅ Test the migration that adds the table fills it from the existing orders
+    def test_migration_backfills_existing_orders(self):
+        Order.objects.create(user=self.user, total_price=40, is_paid=True, status='processing')
+        Order.objects.create(user=self.other, total_price=15, status='cancelled')
+        expected = sorted(OrderSummary.objects.values_list('user_id', 'day', 'order_count', 'revenue'))
+        OrderSummary.objects.all().delete()
+
+        migration = import_module('orders.migrations.0011_backfill_order_summary')
+        migration.backfill_order_summaries(django_apps, mock.Mock(connection=connection))
+        self.assertEqual(sorted(OrderSummary.objects.values_list('user_id', 'day', 'order_count', 'revenue')), expected)
+        self.assertMatchesRebuild()
+
+    # ✅ Test the summary follows an order through creation, payment and cancellation
+    def test_summary_tracks_order_lifecycle(self):
+        response = self.client.post(reverse('order-create'), {
+            "items": [{"product": self.product.id, "quantity": 2, "price": 25.00}]
+        }, format='json')
+        order = Order.objects.get(pk=response.data['id'])
+        self.assertEqual(self.summary(), {'order_count': 1, 'pending_count': 1, 'processing_count': 0,
+                                          'cancelled_count': 0, 'revenue': 0, 'refunded': 0})
+
+        order.is_paid = True
+        order.status = 'processing'
+        order.save(update_fields=['is_paid', 'status'])
+        self.assertEqual(self.summary(), {'order_count': 1, 'pending_count': 0, 'processing_count': 1,
+                                          'cancelled_count': 0, 'revenue': 50, 'refunded': 0})
+
+        # Items added to a paid order count towards revenue
+        OrderItem.objects.create(order=order, product=self.product, quantity=1)
+        self.assertEqual(self.summary()['revenue'], 75)
+
+        self.client.put(reverse('order-cancellation', kwargs={'pk': order.pk}), {'status': 'cancelled'}, format='json')
+        self.assertEqual(self.summary(), {'order_count': 1, 'pending_count': 0, 'processing_count': 0,
+                                          'cancelled_count': 1, 'revenue': 75, 'refunded': 75})
+        self.assertMatchesRebuild()
+
+    # ✅ Test a status change costs one summary UPDATE and no reads
+    def test_status_change_updates_summary_in_place(self):
+        order = Order.objects.create(user=self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            order.status = 'shipped'
+            order.save()
+        statements = [q['sql'] for q in ctx.captured_queries if 'SAVEPOINT' not in q['sql']]
+        self.assertFalse([sql for sql in statements if sql.startswith('SELECT')])
+        self.assertEqual(len([sql for sql in statements if 'orders_ordersummary' in sql]), 1)
+        self.assertEqual(OrderSummary.objects.get(user=self.user).shipped_count, 1)
+
+    # ✅ Test saving an instance loaded before a bulk_transition moves the order from its stored status
+    def test_stale_instance_after_bulk_transition(self):
+        order = Order.objects.create(user=self.user, total_price=10)
+        stale, older = Order.objects.get(pk=order.pk), Order.objects.get(pk=order.pk)
+        bulk_transition(Order.objects.filter(pk=order.pk), 'shipped')
+
+        stale.status = 'cancelled'
+        stale.save()
+        row = OrderSummary.objects.get(user=self.user)
+        self.assertEqual((row.pending_count, row.shipped_count, row.cancelled_count), (0, 0, 1))
+        self.assertEqual(order.status_history.latest('id').previous_status, 'shipped')
+
+        # Paying through a copy that still says pending counts the revenue and leaves the counts alone
+        older.is_paid = True
+        older.save(update_fields=['is_paid'])
+        self.assertEqual(self.summary(), {'order_count': 1, 'pending_count': 0, 'processing_count': 0,
+                                          'cancelled_count': 1, 'revenue': 10, 'refunded': 0})
+        self.assertMatchesRebuild()
+
+    def test_bulk_transition_and_delete_update_summary(self):
+        orders = [Order.objects.create(user=user, total_price=10, is_paid=True) for user in (self.user, self.user, self.other)]
+        bulk_transition(Order.objects.all(), 'shipped')
+        self.assertEqual(OrderSummary.objects.get(user=self.user).shipped_count, 2)
+        self.assertEqual(OrderSummary.objects.get(user=self.other).pending_count, 0)
+
+        orders[0].delete()
+        self.assertEqual(self.summary()['order_count'], 1)
+        self.assertEqual(self.summary()['revenue'], 10)
+        self.assertMatchesRebuild()
+
+        self.other.delete()
+        self.assertFalse(OrderSummary.objects.filter(user_id=self.other.pk).exists())
+
+    # ✅ Test the read API returns the caller's days and totals only
+    def test_summary_api(self):
+        today = Order.objects.create(user=self.user, total_price=30, is_paid=True, status='processing')
+        old = Order.objects.create(user=self.user, total_price=20, is_paid=True, is_refunded=True, status='cancelled')
+        Order.objects.filter(pk=old.pk).update(created_at=today.created_at - timedelta(days=3))
+        Order.objects.create(user=self.other, total_price=99, is_paid=True)
+        call_command('rebuild_order_summaries', stdout=StringIO())
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['days']), 2)
+        self.assertEqual(response.data['totals']['order_count'], 2)
+        self.assertEqual(response.data['totals']['revenue'], '50.00')
+        self.assertEqual(response.data['totals']['total_spent'], '30.00')
+
+        response = self.client.get(self.url, {'start': response.data['days'][1]['day']})
+        self.assertEqual(response.data['totals']['order_count'], 1)
+        self.assertEqual(response.data['totals']['refunded'], '0.00')
+
+        self.assertEqual(self.client.get(self.url, {'start': 'soon'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url, {'user': self.other.pk}).status_code, status.HTTP_403_FORBIDDEN)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(self.url, {'user': self.other.pk})
+        self.assertEqual(response.data['totals']['revenue'], '99.00')
+
+class RequestProfilingTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='profiled', email='profiled@example.com', password='testpass')
+        self.client.force_authenticate(user=self.user)
+        self.order = Order.objects.create(user=self.user, total_price=300)
+
+    def profile(self, logs):
+        self.assertEqual(len(logs.records), 1)
+        return json.loads(logs.records[0].getMessage())
+
+    # ✅ Test a sampled request reports SQL time in Server-Timing and logs its slowest queries
+    @override_settings(PROFILE_SAMPLE_RATE=1.0, PROFILE_SLOW_QUERIES=2)
+    def test_sampled_request(self):
+        with self.assertLogs('shoply.profiling', 'INFO') as logs:
+            response = self.client.get(reverse('order-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        record = self.profile(logs)
+
+        self.assertRegex(response['Server-Timing'], rf'^db;dur=[\d.]+;desc="{record["queries"]} queries", app;dur=[\d.]+, total;dur=[\d.]+$')
+        self.assertEqual(record['view'], 'order-list')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['queries'], 0)
+        self.assertEqual(len(record['slow_queries']), 2)
+        self.assertGreaterEqual(record['slow_queries'][0]['ms'], record['slow_queries'][1]['ms'])
+        self.assertNotIn('%s', json.dumps(record['slow_queries']))
+        self.assertIn('allocated_blocks', record)
+
+    # ✅ Test Stripe time is reported apart from SQL and app time
+    @override_settings(PROFILE_SAMPLE_RATE=1.0)
+    @mock.patch('stripe.Charge.create')
+    def test_external_call_time(self, mock_charge):
+        mock_charge.return_value = {"id": "ch_12345"}
+        with self.assertLogs('shoply.profiling', 'INFO') as logs:
+            response = self.client.post(reverse('order-payment'), {"order_id": self.order.id, "token": "tok_visa"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('stripe;dur=', response['Server-Timing'])
+        self.assertIn('stripe', self.profile(logs)['external_ms'])
+
+    # ✅ Test queries made through sync_to_async are profiled in an async middleware chain
+    @override_settings(PROFILE_SAMPLE_RATE=1.0)
+    async def test_async_request(self):
+        async def view(request):
+            await Order.objects.acount()
+            await sync_to_async(list)(Order.objects.all())
+            return HttpResponse()
+
+        middleware = RequestProfilingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        with self.assertLogs('shoply.profiling', 'INFO') as logs:
+            response = await middleware(AsyncRequestFactory().get('/'))
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+        record = self.profile(logs)
+        self.assertEqual(record['queries'], 2)
+        self.assertIsNone(record['cpu_ms'])
+
+    def test_unsampled_request(self):
+        with self.assertNoLogs('shoply.profiling'):
+            response = self.client.get(reverse('order-list'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_normalize_sql(self):
+        self.assertEqual(
+            normalize_sql('SELECT  "a"."id" FROM "a"\nWHERE "a"."id" IN (%s, %s, %s) AND "a"."name" = \'x\' LIMIT 21'),
+            'SELECT "a"."id" FROM "a" WHERE "a"."id" IN (...) AND "a"."name" = ? LIMIT ?',
+        )
+
+class MetricsTests(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='metered', email='metered@example.com', password='testpass')
+        self.client.force_authenticate(user=self.user)
+        self.product = Product.objects.create(name='Metered Product', price=10, stock=10)
+
+    def counts(self, *samples):
+        return [REGISTRY.get_sample_value(name, labels) or 0 for name, labels in samples]
+
+    # ✅ Test checkout latency and the stock lock wait are observed once per order
+    def test_checkout_metrics(self):
+        samples = [('shoply_checkout_seconds_count', None),
+                   ('shoply_stock_lock_wait_seconds_count', {'source': 'checkout'}),
+                   ('shoply_stock_lock_wait_seconds_count', {'source': 'order_item'})]
+        before = self.counts(*samples)
+        response = self.client.post(reverse('order-create'), {'items': [{'product': self.product.id, 'quantity': 1, 'price': '10.00'}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        OrderItem.objects.create(order_id=response.data['id'], product=self.product, quantity=1)
+        self.assertEqual([after - start for after, start in zip(self.counts(*samples), before)], [1, 1, 1])
+
+    @mock.patch('stripe.Charge.create')
+    def test_payment_metrics(self, mock_charge):
+        mock_charge.side_effect = [stripe.error.StripeError("Card declined"), {"id": "ch_12345"}]
+        order = Order.objects.create(user=self.user, total_price=10)
+        samples = [('shoply_payment_seconds_count', {'result': 'succeeded'}),
+                   ('shoply_payment_seconds_count', {'result': 'failed'})]
+        before = self.counts(*samples)
+        for _ in range(2):
+            self.client.post(reverse('order-payment'), {"order_id": order.id, "token": "tok_visa"}, format='json')
+        self.assertEqual([after - start for after, start in zip(self.counts(*samples), before)], [1, 1])
+
+    def test_metrics_endpoint(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('# TYPE shoply_checkout_seconds histogram\n', text)
+        self.assertIn('shoply_stock_lock_wait_seconds_bucket{source="checkout",le="+Inf"} ', text)
+        self.assertIn('shoply_catalog_cache_requests_total{result="hit"} ', text)
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.9').status_code, status.HTTP_403_FORBIDDEN)
+
+    # ✅ Test totals add up over the per-process files, skipping files from another layout
+    def test_aggregates_worker_processes(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            registry = MetricsRegistry()
+            events = Counter('test_events', "Events.", registry=registry)
+            latency = Histogram('test_seconds', "Latency.", buckets=(.1, 1), label='kind', values=('a', 'b'), registry=registry)
+            events.inc(2)
+            latency.labels('b').observe(.5)
+
+            worker = multiprocessing.get_context('fork').Process(target=events.inc, args=(3,))
+            worker.start()
+            worker.join()
+            with open(f'{directory}/stale.metrics', 'wb') as f:
+                f.write(bytes(64))
+
+            self.assertEqual(registry.get_sample_value('test_events_total'), 5)
+            self.assertEqual(registry.get_sample_value('test_seconds_bucket', {'kind': 'b', 'le': '1'}), 1)
+            self.assertEqual(registry.get_sample_value('test_seconds_bucket', {'kind': 'b', 'le': '0.1'}), 0)
+            self.assertEqual(registry.get_sample_value('test_seconds_sum', {'kind': 'b'}), .5)
+            self.assertEqual(registry.get_sample_value('test_seconds_count', {'kind': 'a'}), 0)
+            with self.assertRaises(RuntimeError):
+                Counter('test_late', "Declared too late.", registry=registry)
+
+# ✅ Query and time budgets for every order route, at ORDERS orders of ITEMS lines each
+@override_settings(PAYMENT_CLIENT='orders.payments.FakePaymentClient')
+class OrderEndpointBudgetTests(EndpointBudgetMixin, APITestCase):
+    ORDERS = 10
+    ITEMS = 3
+    urlconf = 'orders.urls'
+    snapshot_file = os.path.join(os.path.dirname(__file__), 'query_budgets.json')
+    unbudgeted = {
+        'api/orders/orders/<int:pk>/payment/': "PaymentView.post takes no pk, so this route can't serve requests",
+    }
+    budgets = [
+        Budget('order-list', queries=3, ms=100, user='user'),
+        Budget('order-create', 'post', queries=11, ms=200, status=201, user='user',
+               data=lambda t: {'items': [{'product': p.id, 'quantity': 1, 'price': '10.00'} for p in t.products]}),
+        Budget('order-detail', queries=2, ms=100, user='user', kwargs=lambda t: {'pk': t.order.pk}),
+        Budget('order-detail', 'patch', queries=8, ms=200, status=202, user='user', kwargs=lambda t: {'pk': t.order.pk},
+               data={'status': 'shipped'}),
+        Budget('order-payment', 'post', queries=6, ms=200, user='user', data=lambda t: {'order_id': t.order.pk, 'token': 'tok_visa'}),
+        Budget('order-cancellation', 'patch', queries=6, ms=200, user='user', kwargs=lambda t: {'pk': t.order.pk},
+               data={'status': 'cancelled'}),
+        Budget('order-summary', queries=2, ms=100, user='user'),
+        Budget('payment-intent-create', 'post', queries=4, ms=200, status=202, user='user',
+               data=lambda t: {'order_id': t.order.pk, 'token': 'tok_visa'}),
+        Budget('payment-intent-detail', queries=1, ms=100, user='user', kwargs=lambda t: {'pk': t.attempt.pk}),
+        Budget('order-export', queries=1, ms=100, user='admin', kwargs={'resource': 'orders', 'fmt': 'csv'}),
+        Budget('order-import', 'post', queries=4, ms=200, user='admin', kwargs={'resource': 'orders', 'fmt': 'ndjson'},
+               content_type='application/x-ndjson',
+               data=lambda t: '\n'.join(json.dumps({'user_id': t.user.id, 'total_price': '10.00'}) for _ in range(t.ORDERS))),
+    ]
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='budget', email='budget@example.com', password='testpass')
+        self.admin = User.objects.create_user(username='budget-admin', email='budget-admin@example.com',
+                                              password='testpass', is_staff=True)
+        self.products = Product.objects.bulk_create([
+            Product(name=f'Budget Product {n}', price=10, stock=1000) for n in range(self.ITEMS)
+        ])
+        self.client.force_authenticate(user=self.user)
+        for _ in range(self.ORDERS):
+            response = self.client.post(reverse('order-create'), {
+                'items': [{'product': p.id, 'quantity': 1, 'price': '10.00'} for p in self.products]
+            }, format='json')
+        self.client.force_authenticate(user=None)
+        self.order = Order.objects.get(pk=response.data['id'])
+        self.attempt = PaymentAttempt.objects.create(order=Order.objects.create(user=self.user, total_price=5),
+                                                     token='tok_visa', idempotency_key='budget')
+
+# ✅ The async payment view served under ASGI (settings.ASYNC_VIEWS)
+@override_settings(PAYMENT_CLIENT='orders.payments.FakePaymentClient')
+class AsyncPaymentViewTests(TestCase):
+
+    def setUp(self):
+        get_idempotency_cache().clear()
+        self.user = User.objects.create_user(username='asyncpayer', email='asyncpayer@example.com', password='testpass')
+        self.order = Order.objects.create(user=self.user, total_price=300)
+        self.token = str(ClaimsRefreshToken.for_user(self.user).access_token)
+
+    async def pay(self, token='tok_visa', **headers):
+        request = AsyncRequestFactory().post(
+            reverse('order-payment'), {'order_id': self.order.id, 'token': token}, content_type='application/json',
+            headers={'Authorization': f'Bearer {self.token}', **headers},
+        )
+        return await AsyncPaymentView.as_view()(request)
+
+    def test_view_is_async(self):
+        self.assertTrue(iscoroutinefunction(AsyncPaymentView.as_view()))
+
+    async def test_successful_payment(self):
+        response = await self.pay()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        await self.order.arefresh_from_db()
+        self.assertTrue(self.order.is_paid)
+        self.assertEqual(self.order.status, 'processing')
+        self.assertEqual(self.order.payment_id, response.data['payment_id'])
+        self.assertTrue(await OrderStatusHistory.objects.filter(order=self.order, new_status='processing').aexists())
+
+    async def test_declined_payment(self):
+        response = await self.pay('tok_chargeDeclined')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        await self.order.arefresh_from_db()
+        self.assertFalse(self.order.is_paid)
+
+    async def test_paid_order_is_rejected(self):
+        await Order.objects.filter(pk=self.order.pk).aupdate(is_paid=True)
+        response = await self.pay()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("Order not found or already paid.", str(response.data))
+
+    async def test_requires_authentication(self):
+        self.token = 'not-a-token'
+        self.assertEqual((await self.pay()).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    # ✅ Test a retried async payment is replayed instead of charged again
+    async def test_retry_charges_once(self):
+        with mock.patch.object(FakePaymentClient, 'acharge', mock.AsyncMock(return_value='ch_async')) as acharge:
+            first = await self.pay(**{'Idempotency-Key': 'pay-1'})
+            retry = await self.pay(**{'Idempotency-Key': 'pay-1'})
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.data, first.data)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(acharge.call_count, 1)
+
+    # ✅ Test the Stripe client charges through Stripe's async API
+    @override_settings(PAYMENT_CLIENT='orders.payments.StripeClient')
+    async def test_stripe_async_charge(self):
+        with mock.patch('stripe.Charge.create_async', mock.AsyncMock(return_value={'id': 'ch_async'})) as create:
+            response = await self.pay()
+        self.assertEqual(response.data['payment_id'], 'ch_async')
+        self.assertEqual(create.call_args.kwargs['amount'], 30000)
+
+        await Order.objects.filter(pk=self.order.pk).aupdate(is_paid=False)
+        with mock.patch('stripe.Charge.create_async', mock.AsyncMock(side_effect=stripe.error.StripeError("Payment failed"))):
+            response = await self.pay()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("Payment failed", str(response.data))
+
 if __name__ == "__main__":
     import unittest
     unittest.main()
\ No newline at end of file
@@ -1,12 +1,22 @@
+from django.conf import settings
 from django.urls import path
 from .views import OrderListView, OrderCreateView, \
-    OrderDetailView, PaymentView, CancellationView
+    OrderDetailView, PaymentView, AsyncPaymentView, CancellationView, PaymentIntentView, PaymentIntentDetailView, \
+    OrderExportView, OrderImportView, OrderSummaryView
+
+# ✅ Async payments when served over ASGI (settings.ASYNC_VIEWS)
+payment_view = (AsyncPaymentView if settings.ASYNC_VIEWS else PaymentView).as_view()
 
 urlpatterns = [
     path('', OrderListView.as_view(), name='order-list'),
     path('create/', OrderCreateView.as_view(), name='order-create'),
     path('<int:pk>/', OrderDetailView.as_view(), name='order-detail'),
-    path('orders/<int:pk>/payment/', PaymentView.as_view(), name='order-payment'),
+    path('orders/<int:pk>/payment/', payment_view, name='order-payment'),
     path('orders/<int:pk>/cancel/', CancellationView.as_view(), name='order-cancellation'),
-    path('payments/', PaymentView.as_view(), name='order-payment'),
+    path('payments/', payment_view, name='order-payment'),
+    path('summary/', OrderSummaryView.as_view(), name='order-summary'),
+    path('payments/intents/', PaymentIntentView.as_view(), name='payment-intent-create'),
+    path('payments/intents/<int:pk>/', PaymentIntentDetailView.as_view(), name='payment-intent-detail'),
+    path('export/<str:resource>.<str:fmt>', OrderExportView.as_view(), name='order-export'),
+    path('import/<str:resource>.<str:fmt>', OrderImportView.as_view(), name='order-import'),
 ]
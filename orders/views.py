@@ -1,17 +1,28 @@
+import time
+import uuid
+from asgiref.sync import sync_to_async
+from django import forms
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import transaction
+from django.db.models import Sum, prefetch_related_objects
+from django.http import StreamingHttpResponse
 from django.urls import reverse
 from rest_framework import generics, permissions, status
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
-from .models import Order
+from .models import SUMMARY_AMOUNT_FIELDS, SUMMARY_COUNT_FIELDS, Order, OrderSummary, PaymentAttempt, items_prefetch
+from shoply.async_views import AsyncAPIViewMixin
+from shoply.bulk import FORMATS, parse_import, request_lines
+from .bulk import RESOURCES, export_rows, import_rows, render_export
+from .idempotency import idempotent, key_too_long, mismatch
+from .payments import PaymentError, get_payment_client, record_payment_attempt
+from shoply.metrics import CHECKOUT_SECONDS, PAYMENT_SECONDS
+from shoply.pagination import KeysetCursorPagination
 from .serializers import OrderSerializer, PaymentSerializer,\
-     CancellationSerializer, PaymentSerializer
-import stripe
+     CancellationSerializer, PaymentAttemptSerializer, PaymentIntentRequestSerializer, \
+     OrderSummarySerializer, OrderSummaryTotalsSerializer
 from rest_framework.views import APIView
-from django.conf import settings
-
-# Set your Stripe secret key
-stripe.api_key = settings.STRIPE_SECRET_KEY
 
 # ✅ Pagination for orders
 class OrderPagination(PageNumberPagination):
@@ -19,6 +30,13 @@ class OrderPagination(PageNumberPagination):
     page_size_query_param = 'page_size'
     max_page_size = 100
 
+# ✅ Keyset pagination for deep order history (?pagination=cursor)
+class OrderCursorPagination(KeysetCursorPagination):
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+
 # ✅ List all orders for the authenticated user
 class OrderListView(generics.ListAPIView):
     serializer_class = OrderSerializer
@@ -26,13 +44,30 @@ class OrderListView(generics.ListAPIView):
     pagination_class = OrderPagination
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).order_by('-created_at')
+        return Order.objects.filter(user_id=self.request.user.pk).with_items().order_by('-created_at', '-id')
+
+    @property
+    def paginator(self):
+        """Use keyset pagination when a cursor is requested, page numbers otherwise."""
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if 'cursor' in params or params.get('pagination') == 'cursor':
+                self._paginator = OrderCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
 # ✅ Create a new order with transaction management
 class OrderCreateView(generics.CreateAPIView):
     serializer_class = OrderSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    # ✅ Retries carrying the same Idempotency-Key get the first response back
+    @idempotent
+    def post(self, request, *args, **kwargs):
+        with CHECKOUT_SECONDS.time():
+            return super().post(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         serializer.save()  # ✅ No need to pass user explicitly
 
@@ -42,7 +77,7 @@ class OrderDetailView(generics.RetrieveUpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        return Order.objects.filter(user_id=self.request.user.pk).with_items()
 
     def partial_update(self, request, *args, **kwargs):
         allowed_fields = {'status', 'is_paid'}
@@ -51,33 +86,42 @@ class OrderDetailView(generics.RetrieveUpdateAPIView):
         response = super().partial_update(request, *args, **kwargs)
         return Response(response.data, status=202)
 
+    def update(self, request, *args, **kwargs):
+        partial = kwargs.pop('partial', False)
+        instance = self.get_object()
+        serializer = self.get_serializer(instance, data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        # ✅ DRF drops the prefetch after saving; reload the items with one query instead of one per product
+        instance._prefetched_objects_cache = {}
+        prefetch_related_objects([instance], items_prefetch())
+        return Response(serializer.data)
+
 class PaymentView(APIView):
+    @idempotent
     def post(self, request):
         serializer = PaymentSerializer(data=request.data)
         if serializer.is_valid():
-            order_id = serializer.validated_data['order_id']
+            order = serializer.validated_data['order']
             token = serializer.validated_data['token']
-            order = Order.objects.get(id=order_id)
 
+            started = time.perf_counter()
             try:
                 # Create Stripe charge
-                charge = stripe.Charge.create(
-                    amount=int(order.total_price * 100),  # Convert to cents
-                    currency='usd',
-                    description=f'Order #{order.id}',
-                    source=token,
-                )
+                charge_id = get_payment_client().charge(order.total_price, f'Order #{order.id}', token)
+                PAYMENT_SECONDS.labels('succeeded').observe(time.perf_counter() - started)
 
                 # Update order on success
-                order.payment_id = charge["id"]
+                order.payment_id = charge_id
                 order.payment_status = 'paid'
                 order.is_paid = True
                 order.status = 'processing'  # Auto-move to processing
-                order.save()
+                order.save(update_fields=['payment_id', 'payment_status', 'is_paid', 'status'])
 
-                return Response({'message': 'Payment successful', 'payment_id': charge["id"]}, status=status.HTTP_200_OK)
+                return Response({'message': 'Payment successful', 'payment_id': charge_id}, status=status.HTTP_200_OK)
 
-            except stripe.error.StripeError as e:
+            except PaymentError as e:
+                PAYMENT_SECONDS.labels('failed').observe(time.perf_counter() - started)
                 return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -94,6 +138,84 @@ class PaymentView(APIView):
         
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+# ✅ PaymentView for ASGI: the request waits on the processor without holding a thread
+class AsyncPaymentView(AsyncAPIViewMixin, PaymentView):
+    @idempotent
+    async def post(self, request):
+        serializer = PaymentSerializer(data=request.data)
+        if not await sync_to_async(serializer.is_valid)():  # Looks the order up
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        order = serializer.validated_data['order']
+        token = serializer.validated_data['token']
+
+        started = time.perf_counter()
+        try:
+            charge_id = await get_payment_client().acharge(order.total_price, f'Order #{order.id}', token)
+        except PaymentError as e:
+            PAYMENT_SECONDS.labels('failed').observe(time.perf_counter() - started)
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        PAYMENT_SECONDS.labels('succeeded').observe(time.perf_counter() - started)
+
+        order.payment_id = charge_id
+        order.payment_status = 'paid'
+        order.is_paid = True
+        order.status = 'processing'  # Auto-move to processing
+        await order.asave(update_fields=['payment_id', 'payment_status', 'is_paid', 'status'])
+
+        return Response({'message': 'Payment successful', 'payment_id': charge_id}, status=status.HTTP_200_OK)
+
+# ✅ Record a payment intent and return 202; `manage.py capture_payments` charges it
+class PaymentIntentView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        key = request.headers.get('Idempotency-Key')
+        if key:
+            # Keys are per user, so one user's key can't collide with another's
+            prefix = f'{request.user.pk}:'
+            max_length = PaymentAttempt._meta.get_field('idempotency_key').max_length - len(prefix)
+            if len(key) > max_length:
+                return key_too_long(max_length)
+            key = prefix + key
+            attempt = PaymentAttempt.objects.select_related('order').filter(
+                idempotency_key=key, order__user_id=request.user.pk,
+            ).first()
+            if attempt is not None:
+                return self.replay(attempt, request.data)
+
+        serializer = PaymentIntentRequestSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        attempt, created = record_payment_attempt(
+            serializer.validated_data['order'],
+            serializer.validated_data['token'],
+            key or f'{request.user.pk}:{uuid.uuid4().hex}',
+        )
+        if not created and attempt.idempotency_key == key:
+            # Lost a race with a retry carrying the same key
+            return self.replay(attempt, request.data)
+        return self.accepted(attempt)
+
+    def replay(self, attempt, data):
+        # ✅ A key is only replayed for the same order, card and amount
+        same_request = (
+            str(data.get('order_id')) == str(attempt.order_id)
+            and data.get('token') == attempt.token
+            and attempt.amount in (None, attempt.order.total_price)
+        )
+        return self.accepted(attempt) if same_request else mismatch()
+
+    def accepted(self, attempt):
+        url = reverse('payment-intent-detail', kwargs={'pk': attempt.pk})
+        return Response(PaymentAttemptSerializer(attempt).data, status=status.HTTP_202_ACCEPTED, headers={'Location': url})
+
+# ✅ Poll the outcome of a payment intent
+class PaymentIntentDetailView(generics.RetrieveAPIView):
+    serializer_class = PaymentAttemptSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return PaymentAttempt.objects.filter(order__user_id=self.request.user.pk)
+
 class CancellationView(generics.UpdateAPIView):
     queryset = Order.objects.all()
     serializer_class = CancellationSerializer
@@ -110,4 +232,66 @@ class CancellationView(generics.UpdateAPIView):
         serializer.is_valid(raise_exception=True)
         serializer.save()
 
-        return Response(serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+# ✅ Dashboard figures from the maintained summary table, no scans over orders
+class OrderSummaryView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        if request.query_params.get('user') and not request.user.is_staff:
+            raise PermissionDenied("Only staff can view other users' summaries.")
+        filters, errors = {'user_id': request.user.pk}, {}
+        for param, lookup, field in (('user', 'user_id', forms.IntegerField()),
+                                     ('start', 'day__gte', forms.DateField()),
+                                     ('end', 'day__lte', forms.DateField())):
+            if request.query_params.get(param):
+                try:
+                    filters[lookup] = field.clean(request.query_params[param])
+                except DjangoValidationError as e:
+                    errors[param] = e.messages
+        if errors:
+            raise ValidationError(errors)
+
+        rows = OrderSummary.objects.filter(**filters).order_by('day')
+        totals = rows.aggregate(**{name: Sum(name) for name in SUMMARY_COUNT_FIELDS + SUMMARY_AMOUNT_FIELDS})
+        totals = {name: value or 0 for name, value in totals.items()}
+        totals['total_spent'] = totals['revenue'] - totals['refunded']
+        return Response({
+            'totals': OrderSummaryTotalsSerializer(totals).data,
+            'days': OrderSummarySerializer(rows, many=True).data,
+        })
+
+def get_bulk_resource(resource, fmt):
+    if resource not in RESOURCES or fmt not in FORMATS:
+        raise NotFound(f"Use one of {', '.join(RESOURCES)} with .{' or .'.join(FORMATS)}.")
+
+# ✅ Admin-only streaming export of orders, items or status history (NDJSON or CSV)
+class OrderExportView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, resource, fmt):
+        get_bulk_resource(resource, fmt)
+        filters, errors = {}, {}
+        for param in ('created_after', 'created_before'):
+            if request.query_params.get(param):
+                try:
+                    filters[param] = forms.DateTimeField().clean(request.query_params[param])
+                except DjangoValidationError as e:
+                    errors[param] = e.messages
+        if errors:
+            raise ValidationError(errors)
+
+        rows = export_rows(resource, **filters)
+        response = StreamingHttpResponse(render_export(resource, fmt, rows), content_type=FORMATS[fmt])
+        response['Content-Disposition'] = f'attachment; filename="{resource}.{fmt}"'
+        return response
+
+# ✅ Admin-only bulk import in the export's format, validated and inserted in batches
+class OrderImportView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request, resource, fmt):
+        get_bulk_resource(resource, fmt)
+        result = import_rows(resource, parse_import(fmt, request_lines(request)))
+        return Response(result.as_dict(), status=status.HTTP_200_OK)
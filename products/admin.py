@@ -1,7 +1,18 @@
 from django.contrib import admin
+from django.db import connection
 from .models import Product
+from .search import search_products
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'price', 'stock', 'created_at')
+    list_display = ('name', 'price', 'available_stock', 'is_sharded', 'created_at')
     search_fields = ('name',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_available_stock()
+
+    def get_search_results(self, request, queryset, search_term):
+        # ✅ Use the indexed full-text search instead of an icontains scan on PostgreSQL
+        if search_term and connection.vendor == 'postgresql':
+            return queryset.filter(pk__in=search_products(search_term).values('pk')), False
+        return super().get_search_results(request, queryset, search_term)
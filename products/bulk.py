@@ -0,0 +1,106 @@
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from shoply.bulk import ImportResult
+from .cache import bump_catalog_version
+from .inventory import set_sharded_stock
+from .models import Product
+
+KEY_FIELD = 'sku'
+UPSERT_FIELDS = ('name', 'description', 'price', 'stock')
+REQUIRED_FOR_NEW = ('name', 'price')
+
+
+def upsert_products(rows, batch_size=None):
+    """
+    Insert or update products from ``(line number, row dict)`` pairs, matched on ``sku``.
+
+    Rows are handled in batches: each is cleaned field by field, merged over
+    the stored values of products it already knows (one query), and written
+    with a single ``INSERT ... ON CONFLICT (sku) DO UPDATE``. Only columns
+    present in a batch are updated, so a price-and-stock feed leaves names
+    and descriptions alone. Invalid rows are reported and skipped without
+    failing the rest of their batch. Catalog caches are invalidated once at
+    the end rather than per product.
+    """
+    batch_size = batch_size or settings.PRODUCT_IMPORT_BATCH_SIZE
+    result = ImportResult()
+    rows = iter(rows)
+    try:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            _upsert_batch(batch, result)
+    finally:
+        if result.created or result.updated:
+            bump_catalog_version()
+    return result
+
+
+def _clean_row(row):
+    values, errors = {}, {}
+    for name in (KEY_FIELD,) + UPSERT_FIELDS:
+        raw = row.get(name)
+        if raw is None or (raw == '' and name != 'description'):
+            continue
+        try:
+            values[name] = Product._meta.get_field(name).clean(raw, None)
+        except ValidationError as e:
+            errors[name] = e.messages
+    if KEY_FIELD not in values and KEY_FIELD not in errors:
+        errors[KEY_FIELD] = ["This field is required."]
+    return values, errors
+
+
+def _upsert_batch(batch, result):
+    cleaned = {}
+    for line, row in batch:
+        if row is None:
+            result.add_error(line, {'non_field_errors': ["Not a valid JSON object."]})
+            continue
+        values, errors = _clean_row(row)
+        if not errors and values[KEY_FIELD] in cleaned:
+            errors = {KEY_FIELD: ["This SKU appears earlier in the same batch."]}
+        if errors:
+            result.add_error(line, errors)
+        else:
+            cleaned[values[KEY_FIELD]] = (line, values)
+
+    existing = {
+        product[KEY_FIELD]: product
+        for product in Product.objects.filter(sku__in=list(cleaned)).values(KEY_FIELD, 'is_sharded', *UPSERT_FIELDS)
+    }
+    provided = set()
+    products, sharded_stock = [], {}
+    for sku, (line, values) in cleaned.items():
+        stored = existing.get(sku)
+        if stored is None:
+            missing = [name for name in REQUIRED_FOR_NEW if name not in values]
+            if missing:
+                result.add_error(line, {name: ["This field is required for new products."] for name in missing})
+                continue
+        elif stored['is_sharded'] and 'stock' in values:
+            # ✅ Sharded stock lives in the shards; spread it there after the upsert
+            sharded_stock[sku] = values.pop('stock')
+        provided.update(values)
+        if stored is not None:
+            # Fill in columns this row doesn't mention so the upsert keeps them as they are
+            values = {**stored, **values}
+            del values['is_sharded']
+        products.append(Product(**values))
+
+    if not products:
+        return
+    update_fields = sorted(provided - {KEY_FIELD}) + ['updated_at']
+    with transaction.atomic():
+        Product.objects.bulk_create(
+            products, update_conflicts=True, unique_fields=[KEY_FIELD], update_fields=update_fields,
+        )
+        if sharded_stock:
+            for product in Product.objects.filter(sku__in=list(sharded_stock)):
+                set_sharded_stock(product, sharded_stock[product.sku])
+    result.updated += sum(1 for product in products if product.sku in existing)
+    result.created += sum(1 for product in products if product.sku not in existing)
@@ -0,0 +1,73 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.dateparse import parse_datetime
+
+VERSION_KEY = 'catalog:version'
+
+
+def get_catalog_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def get_catalog_version():
+    """Return the current catalog version, initialising it if the cache lost it."""
+    cache = get_catalog_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Start from the clock so a lost key can never resurrect old entries
+        cache.add(VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+async def aget_catalog_version():
+    """``get_catalog_version`` for async views."""
+    cache = get_catalog_cache()
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = await cache.aget(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """Invalidate every cached catalog response at once."""
+    cache = get_catalog_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        get_catalog_version()
+
+
+def catalog_cache_key(request, version=None):
+    """Key for a catalog response, scoped to the catalog version, host and full path."""
+    location = f"{request.get_host()}{request.get_full_path()}"
+    digest = hashlib.sha1(location.encode('utf-8')).hexdigest()
+    return f"catalog:{get_catalog_version() if version is None else version}:{digest}"
+
+
+async def acatalog_cache_key(request):
+    """``catalog_cache_key`` for async views."""
+    return catalog_cache_key(request, await aget_catalog_version())
+
+
+def build_catalog_entry(data):
+    """
+    Bundle serialized catalog data with its HTTP validators.
+
+    The ETag is a hash of the payload itself and Last-Modified is the newest
+    ``updated_at`` in it, so both stay correct even when an entry is rebuilt
+    after a stock change that didn't bump the version.
+    """
+    payload = json.dumps(data, sort_keys=True, default=str).encode('utf-8')
+    products = data.get('results', [data]) if isinstance(data, dict) else data
+    stamps = [parse_datetime(p['updated_at']) for p in products if p.get('updated_at')]
+    return {
+        'data': data,
+        'etag': f'"{hashlib.md5(payload).hexdigest()}"',
+        'last_modified': int(max(stamps).timestamp()) if stamps else None,
+    }
@@ -0,0 +1,58 @@
+from django import forms
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Exists, OuterRef, Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+from .models import StockShard
+
+
+class ProductFilter(BaseFilterBackend):
+    """
+    Server-side filtering and sorting for the public product list.
+
+    Filters: ``min_price``, ``max_price``, ``in_stock=true``,
+    ``created_after`` and ``created_before``. Sorting: ``ordering`` set to
+    ``price``, ``created_at`` or ``name``, prefixed with ``-`` for descending.
+    Every option is backed by an index on ``Product``.
+    """
+    ordering_param = 'ordering'
+    ordering_fields = ('price', 'created_at', 'name')
+    default_ordering = '-created_at'
+
+    filter_fields = {
+        'min_price': ('price__gte', forms.DecimalField(max_digits=10, decimal_places=2)),
+        'max_price': ('price__lte', forms.DecimalField(max_digits=10, decimal_places=2)),
+        'created_after': ('created_at__gte', forms.DateTimeField()),
+        'created_before': ('created_at__lt', forms.DateTimeField()),
+    }
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        filters = {}
+        conditions = []
+        errors = {}
+
+        for param, (lookup, field) in self.filter_fields.items():
+            if params.get(param):
+                try:
+                    filters[lookup] = field.clean(params[param])
+                except DjangoValidationError as e:
+                    errors[param] = e.messages
+
+        if forms.BooleanField(required=False).clean(params.get('in_stock')):
+            in_shards = Exists(StockShard.objects.filter(product=OuterRef('pk'), stock__gt=0))
+            conditions.append(Q(stock__gt=0) | Q(in_shards, is_sharded=True))
+
+        if errors:
+            raise ValidationError(errors)
+        return queryset.filter(*conditions, **filters).order_by(*self.get_ordering(request, queryset, view))
+
+    def get_ordering(self, request, queryset, view):
+        """Return the requested sort with ``id`` as a tie-breaker in the same direction."""
+        ordering = request.query_params.get(self.ordering_param) or self.default_ordering
+        if ordering.lstrip('-') not in self.ordering_fields:
+            raise ValidationError({self.ordering_param: [
+                f"Unsupported ordering. Choose one of: {', '.join(self.ordering_fields)}."
+            ]})
+        direction = '-' if ordering.startswith('-') else ''
+        return (ordering, f'{direction}id')
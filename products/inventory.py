@@ -0,0 +1,170 @@
+import random
+
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Case, F, Q, When
+from django.utils import timezone
+from shoply.metrics import STOCK_LOCK_WAIT_SECONDS
+from .models import Product, StockShard
+
+
+def reserve_stock(quantities, source='checkout'):
+    """
+    Take stock for several products in one step.
+
+    ``quantities`` maps a product id to the quantity to reserve. All rows are
+    locked with a single ``SELECT ... FOR UPDATE`` ordered by primary key, so
+    concurrent checkouts always acquire locks in the same order and cannot
+    deadlock, then decremented with one conditional ``UPDATE``. Sharded
+    products are not locked; their stock is taken from a shard instead (see
+    ``reserve_sharded_stock``).
+
+    Must be called inside a transaction. Returns the products keyed by id,
+    with ``stock`` already reflecting the reservation for unsharded ones.
+    The time spent waiting for the locks is recorded under ``source``.
+    """
+    if not quantities:
+        return {}
+
+    with STOCK_LOCK_WAIT_SECONDS.labels(source).time():
+        products = {
+            product.pk: product
+            for product in Product.objects.select_for_update().filter(pk__in=quantities, is_sharded=False).order_by('pk')
+        }
+    missing = [product_id for product_id in quantities if product_id not in products]
+    if missing:
+        products.update(Product.objects.filter(pk__in=missing, is_sharded=True).in_bulk())
+
+    for product_id, quantity in quantities.items():
+        product = products.get(product_id)
+        if product is None:
+            raise ValidationError(f"Product {product_id} does not exist.")
+        if not product.is_sharded and quantity > product.stock:
+            raise ValidationError(f"Insufficient stock for {product.name}. Available: {product.stock}")
+
+    unsharded = {pk: quantity for pk, quantity in quantities.items() if not products[pk].is_sharded}
+    if unsharded:
+        condition = Q()
+        whens = []
+        for product_id, quantity in unsharded.items():
+            condition |= Q(pk=product_id, stock__gte=quantity)
+            whens.append(When(pk=product_id, then=F('stock') - quantity))
+
+        updated = Product.objects.filter(condition).update(
+            stock=Case(*whens, default=F('stock'), output_field=models.PositiveIntegerField()),
+            updated_at=timezone.now(),
+        )
+        if updated != len(unsharded):
+            # Rows are locked above, so this only happens if something bypassed the lock.
+            raise ValidationError("Stock changed during checkout, please try again.")
+
+        for product_id, quantity in unsharded.items():
+            products[product_id].stock -= quantity
+
+    # Sharded products go in id order too, so two carts never wait on each other's shards.
+    for product_id in sorted(set(quantities) - set(unsharded)):
+        reserve_sharded_stock(products[product_id], quantities[product_id])
+    return products
+
+
+def reserve_sharded_stock(product, quantity):
+    """
+    Take ``quantity`` units from one of ``product``'s stock shards.
+
+    Shards that can cover the whole quantity are tried in random order with a
+    conditional ``UPDATE``, so concurrent checkouts of the same product spread
+    their row locks over the shards instead of queueing on one row. Only when
+    no single shard has enough are all shards locked and drained in turn.
+
+    Must be called inside a transaction.
+    """
+    candidates = list(
+        StockShard.objects.filter(product=product, stock__gte=quantity).values_list('pk', flat=True)
+    )
+    random.shuffle(candidates)
+    for pk in candidates:
+        if StockShard.objects.filter(pk=pk, stock__gte=quantity).update(stock=F('stock') - quantity):
+            product.__dict__.pop('shard_stock', None)
+            return
+
+    shards = list(StockShard.objects.select_for_update().filter(product=product).order_by('pk'))
+    available = sum(shard.stock for shard in shards)
+    if quantity > available:
+        raise ValidationError(f"Insufficient stock for {product.name}. Available: {available}")
+
+    remaining = quantity
+    for shard in shards:
+        taken = min(shard.stock, remaining)
+        if taken:
+            StockShard.objects.filter(pk=shard.pk).update(stock=F('stock') - taken)
+            remaining -= taken
+        if not remaining:
+            break
+    product.shard_stock = available - quantity
+
+
+def _lock_shards(product):
+    """Lock ``product`` and its shards, returning the fresh product and the shards keyed by index."""
+    product = Product.objects.select_for_update().get(pk=product.pk)
+    shards = {shard.index: shard for shard in product.stock_shards.select_for_update().order_by('pk')}
+    return product, shards
+
+
+def _spread_stock(product, shards, total, count):
+    """Rewrite the locked ``shards`` so ``total`` is split evenly over ``count`` of them."""
+    base, extra = divmod(total, count)
+    amounts = [base + (1 if index < extra else 0) for index in range(count)]
+
+    changed = []
+    for index, shard in shards.items():
+        if index < count and shard.stock != amounts[index]:
+            shard.stock = amounts[index]
+            changed.append(shard)
+    StockShard.objects.bulk_update(changed, ['stock'])
+    StockShard.objects.bulk_create([
+        StockShard(product=product, index=index, stock=amounts[index])
+        for index in range(count) if index not in shards
+    ])
+    product.stock_shards.filter(index__gte=count).delete()
+    product.shard_stock = total
+
+
+@transaction.atomic
+def shard_product(product, shards):
+    """Move ``product``'s stock into ``shards`` counters, or change how many it has."""
+    if shards < 1:
+        raise ValidationError("A sharded product needs at least one shard.")
+    product, current = _lock_shards(product)
+    _spread_stock(product, current, product.stock + sum(shard.stock for shard in current.values()), shards)
+    product.stock = 0
+    product.is_sharded = True
+    product.save(update_fields=['stock', 'is_sharded', 'updated_at'])
+    return product
+
+
+@transaction.atomic
+def unshard_product(product):
+    """Fold ``product``'s shards back into its stock column."""
+    product, current = _lock_shards(product)
+    product.stock_shards.all().delete()
+    product.stock += sum(shard.stock for shard in current.values())
+    product.is_sharded = False
+    product.save(update_fields=['stock', 'is_sharded', 'updated_at'])
+    product.__dict__.pop('shard_stock', None)
+    return product
+
+
+@transaction.atomic
+def rebalance_stock(product):
+    """Even out a sharded product's stock across its existing shards."""
+    product, current = _lock_shards(product)
+    _spread_stock(product, current, sum(shard.stock for shard in current.values()), max(len(current), 1))
+    return product
+
+
+@transaction.atomic
+def set_sharded_stock(product, stock):
+    """Set a sharded product's total stock, spread evenly across its shards."""
+    locked, current = _lock_shards(product)
+    _spread_stock(locked, current, stock, max(len(current), 1))
+    product.shard_stock = stock
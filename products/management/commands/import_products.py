@@ -0,0 +1,34 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from products.bulk import upsert_products
+from shoply.bulk import FORMATS, parse_import
+
+
+class Command(BaseCommand):
+    help = "Insert or update products by SKU from a CSV or NDJSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or - for standard input.")
+        parser.add_argument('--format', choices=sorted(FORMATS), help="File format (default: from the file extension).")
+        parser.add_argument('--batch-size', type=int, help="Rows per upsert statement (default: PRODUCT_IMPORT_BATCH_SIZE).")
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if fmt not in FORMATS:
+            raise CommandError(f"Cannot tell the format of {options['path']}; pass --format.")
+
+        if options['path'] == '-':
+            result = upsert_products(parse_import(fmt, sys.stdin), options['batch_size'])
+        else:
+            with open(options['path'], newline='', encoding='utf-8-sig') as f:
+                result = upsert_products(parse_import(fmt, f), options['batch_size'])
+
+        for error in result.errors:
+            self.stderr.write(f"Line {error['line']}: {error['errors']}")
+        if result.failed > len(result.errors):
+            self.stderr.write(f"... and {result.failed - len(result.errors)} more")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result.created}, updated {result.updated}, failed {result.failed}."
+        ))
@@ -0,0 +1,47 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from products.inventory import rebalance_stock, shard_product, unshard_product
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = "Even out stock across the shards of sharded products, or shard and unshard products."
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_ids', nargs='*', type=int, help="Products to act on (default: every sharded product).")
+        parser.add_argument('--shards', type=int, help="Split the products' stock across this many shards.")
+        parser.add_argument('--unshard', action='store_true', help="Fold the products' shards back into their stock column.")
+
+    def handle(self, *args, **options):
+        if options['shards'] is not None and options['unshard']:
+            raise CommandError("--shards and --unshard cannot be used together.")
+
+        if options['product_ids']:
+            products = Product.objects.filter(pk__in=options['product_ids']).order_by('pk')
+            missing = set(options['product_ids']) - set(products.values_list('pk', flat=True))
+            if missing:
+                raise CommandError(f"Unknown product id(s): {', '.join(map(str, sorted(missing)))}")
+        elif options['shards'] is not None:
+            raise CommandError("--shards needs at least one product id.")
+        else:
+            products = Product.objects.filter(is_sharded=True).order_by('pk')
+
+        for product in products:
+            try:
+                if options['unshard']:
+                    product = unshard_product(product)
+                    self.stdout.write(f"{product.name}: unsharded, stock {product.stock}")
+                    continue
+                if options['shards'] is not None:
+                    product = shard_product(product, options['shards'])
+                elif product.is_sharded:
+                    product = rebalance_stock(product)
+                else:
+                    self.stdout.write(f"{product.name}: not sharded, skipped")
+                    continue
+            except ValidationError as e:
+                raise CommandError(' '.join(e.messages))
+            amounts = product.stock_shards.order_by('index').values_list('stock', flat=True)
+            self.stdout.write(f"{product.name}: {product.available_stock} across shards {list(amounts)}")
+
+        self.stdout.write(self.style.SUCCESS("Done."))
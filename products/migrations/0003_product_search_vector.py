@@ -0,0 +1,66 @@
+# Generated by Django 5.1.7 on 2026-10-16 22:37
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+SEARCH_VECTOR = """
+    setweight(to_tsvector('english', coalesce({row}name, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce({row}description, '')), 'B')
+"""
+
+CREATE_SEARCH_SUPPORT = [
+    f"""
+    CREATE FUNCTION products_product_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := {SEARCH_VECTOR.format(row='NEW.')};
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+    """,
+    """
+    CREATE TRIGGER products_product_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, description ON products_product
+    FOR EACH ROW EXECUTE FUNCTION products_product_search_vector_update();
+    """,
+    f"UPDATE products_product SET search_vector = {SEARCH_VECTOR.format(row='')};",
+    "CREATE INDEX product_search_vector_idx ON products_product USING gin (search_vector);",
+    "CREATE INDEX product_name_trgm_idx ON products_product USING gin (name gin_trgm_ops);",
+]
+
+DROP_SEARCH_SUPPORT = [
+    "DROP INDEX IF EXISTS product_name_trgm_idx;",
+    "DROP INDEX IF EXISTS product_search_vector_idx;",
+    "DROP TRIGGER IF EXISTS products_product_search_vector_trigger ON products_product;",
+    "DROP FUNCTION IF EXISTS products_product_search_vector_update();",
+]
+
+
+def run_on_postgresql(statements):
+    # The trigger and GIN indexes are PostgreSQL-only; other databases use the
+    # in-process index in products.search instead.
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            for statement in statements:
+                schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_product_catalog_indexes'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(
+            run_on_postgresql(CREATE_SEARCH_SUPPORT),
+            run_on_postgresql(DROP_SEARCH_SUPPORT),
+        ),
+    ]
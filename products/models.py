@@ -1,6 +1,28 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import Case, F, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+
+class ProductQuerySet(models.QuerySet):
+    def with_available_stock(self):
+        """Annotate ``shard_stock`` so ``available_stock`` needs no extra query per product."""
+        shard_total = (
+            StockShard.objects.filter(product=OuterRef('pk'))
+            .values('product')
+            .annotate(total=Sum('stock'))
+            .values('total')
+        )
+        return self.annotate(shard_stock=Case(
+            When(is_sharded=True, then=Coalesce(Subquery(shard_total), Value(0))),
+            default=F('stock'),
+            output_field=models.PositiveIntegerField(),
+        ))
+
 
 class Product(models.Model):
+    # ✅ Supplier SKU, the natural key used by bulk upserts (products.bulk)
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
@@ -8,9 +30,48 @@ class Product(models.Model):
     image = models.ImageField(upload_to='product_images/', blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # ✅ Weighted name/description tsvector, kept current by a PostgreSQL trigger
+    # (see migration 0003, which also creates its GIN and trigram indexes)
+    search_vector = SearchVectorField(null=True, editable=False)
+    # ✅ Hot SKUs keep their stock in StockShard rows instead of the stock column
+    # (see products.inventory and the rebalance_stock command)
+    is_sharded = models.BooleanField(default=False)
+
+    objects = ProductQuerySet.as_manager()
     
     class Meta:
         app_label = 'products'  # ✅ Explicitly set the app label if needed
+        indexes = [
+            # ✅ One index per catalog sort/filter, each ending in id for keyset pagination
+            models.Index(fields=['price', 'id'], name='product_price_idx'),
+            models.Index(fields=['created_at', 'id'], name='product_created_idx'),
+            models.Index(fields=['name', 'id'], name='product_name_idx'),
+            models.Index(fields=['created_at', 'id'], condition=models.Q(stock__gt=0), name='product_in_stock_idx'),
+        ]
+
+    @property
+    def available_stock(self):
+        """Units left to sell: the stock column, or the sum of the shards for sharded products."""
+        if not self.is_sharded:
+            return self.stock
+        if 'shard_stock' not in self.__dict__:
+            self.shard_stock = self.stock_shards.aggregate(total=Coalesce(Sum('stock'), 0))['total']
+        return self.shard_stock
 
     def __str__(self):
         return self.name
+
+
+class StockShard(models.Model):
+    """One of several counters holding a sharded product's stock."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_shards')
+    index = models.PositiveSmallIntegerField()
+    stock = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'index'], name='stock_shard_product_index_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.product} shard {self.index}: {self.stock}"
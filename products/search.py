@@ -0,0 +1,126 @@
+import math
+import re
+from collections import defaultdict
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db import connection
+from django.db.models import F
+from .cache import get_catalog_version
+from .models import Product
+
+SEARCH_CONFIG = 'english'
+# Same cut-off as pg_trgm.similarity_threshold, used by the trigram_similar lookup
+TRIGRAM_THRESHOLD = 0.3
+# PostgreSQL's default ts_rank weights for the 'A' (name) and 'B' (description) labels
+NAME_WEIGHT = 1.0
+DESCRIPTION_WEIGHT = 0.4
+
+
+def search_products(query):
+    """
+    Return products matching ``query``, best match first.
+
+    On PostgreSQL this ranks the trigger-maintained ``search_vector`` and
+    falls back to trigram similarity on ``name`` when nothing matches (typos).
+    Other databases use an in-process inverted index with the same rules.
+    """
+    products = Product.objects.defer('search_vector').with_available_stock()
+    if connection.vendor == 'postgresql':
+        search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+        ranked = (
+            products.filter(search_vector=search_query)
+            .annotate(rank=SearchRank(F('search_vector'), search_query))
+            .order_by('-rank', '-id')
+        )
+        if ranked.exists():
+            return ranked
+        return (
+            products.filter(name__trigram_similar=query)
+            .annotate(similarity=TrigramSimilarity('name', query))
+            .order_by('-similarity', '-id')
+        )
+
+    return RankedProducts(products, get_inverted_index().search(query))
+
+
+class RankedProducts:
+    """Ranked product ids that only load the rows of the slice being paginated."""
+
+    def __init__(self, queryset, ids):
+        self.queryset = queryset
+        self.ids = ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        ids = self.ids[index] if isinstance(index, slice) else [self.ids[index]]
+        found = self.queryset.in_bulk(ids)
+        products = [found[pk] for pk in ids if pk in found]
+        return products if isinstance(index, slice) else products[0]
+
+
+def tokenize(text):
+    return re.findall(r'\w+', text.lower())
+
+
+def trigrams(text):
+    """Trigrams of each word padded the way pg_trgm does ("  word ")."""
+    grams = set()
+    for word in re.findall(r'[^\W_]+', text.lower()):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def trigram_similarity(left, right):
+    """Python port of pg_trgm's ``similarity()``, taking trigram sets."""
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+class InvertedIndex:
+    """In-memory term index over product names and descriptions."""
+
+    def __init__(self, rows):
+        self.postings = defaultdict(dict)  # term -> {product id: weighted frequency}
+        self.names = {}  # product id -> trigrams of its name
+        for pk, name, description in rows:
+            self.names[pk] = trigrams(name)
+            for text, weight in ((name, NAME_WEIGHT), (description, DESCRIPTION_WEIGHT)):
+                for term in tokenize(text):
+                    self.postings[term][pk] = self.postings[term].get(pk, 0) + weight
+
+    def idf(self, term):
+        return math.log(1 + len(self.names) / len(self.postings[term]))
+
+    def search(self, query):
+        """Ids of products containing every query term, ranked; trigram matches on name otherwise."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        matches = None
+        for term in terms:
+            docs = set(self.postings.get(term, ()))
+            matches = docs if matches is None else matches & docs
+        if matches:
+            scores = {pk: sum(self.postings[term][pk] * self.idf(term) for term in terms) for pk in matches}
+            return sorted(matches, key=lambda pk: (-scores[pk], -pk))
+
+        query_trigrams = trigrams(query)
+        similar = [(trigram_similarity(name, query_trigrams), pk) for pk, name in self.names.items()]
+        return [pk for score, pk in sorted(similar, key=lambda s: (-s[0], -s[1])) if score >= TRIGRAM_THRESHOLD]
+
+
+_index = (None, None)
+
+
+def get_inverted_index():
+    """Return the inverted index for the current catalog version, rebuilding it when stale."""
+    global _index
+    version = get_catalog_version()
+    if _index[0] != version:
+        _index = (version, InvertedIndex(Product.objects.values_list('id', 'name', 'description').iterator()))
+    return _index[1]
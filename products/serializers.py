@@ -1,7 +1,22 @@
 from rest_framework import serializers
+from shoply.thumbnails import ThumbnailsField
+from .inventory import set_sharded_stock
 from .models import Product
 
 class ProductSerializer(serializers.ModelSerializer):
+    thumbnails = ThumbnailsField(source='image')  # ✅ Resized WebP/JPEG copies of the image
+
     class Meta:
         model = Product
-        fields = ['id', 'name', 'description', 'price', 'stock', 'image', 'created_at', 'updated_at']
+        fields = ['id', 'sku', 'name', 'description', 'price', 'stock', 'image', 'thumbnails', 'created_at', 'updated_at']
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        data['stock'] = instance.available_stock
+        return data
+
+    def update(self, instance, validated_data):
+        # ✅ A sharded product's stock lives in its shards, not the stock column
+        if instance.is_sharded and 'stock' in validated_data:
+            set_sharded_stock(instance, validated_data.pop('stock'))
+        return super().update(instance, validated_data)
@@ -0,0 +1,13 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .cache import bump_catalog_version
+from shoply.thumbnails import register_thumbnails
+from .models import Product
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_catalog_cache(sender, instance, **kwargs):
+    """Drop cached catalog responses whenever a product changes (API or admin)."""
+    bump_catalog_version()
+
+register_thumbnails(Product, 'image')
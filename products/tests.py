@@ -1,5 +1,29 @@
-from django.test import TestCase
-from .models import Product
+import json
+import os
+import tempfile
+from io import BytesIO
+from io import StringIO
+from unittest import mock
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from .cache import get_catalog_cache
+from .inventory import reserve_stock, shard_product, unshard_product
+from .models import Product, StockShard
+from .views import AsyncProductDetailView, AsyncProductListView, AsyncProductSearchView
+from PIL import Image
+from asgiref.sync import iscoroutinefunction
+from shoply.budgets import Budget, EndpointBudgetMixin
+from shoply.metrics import REGISTRY
+from shoply.thumbnails import render_thumbnails, thumbnail_name
 
 class ProductModelTest(TestCase):
 
@@ -48,3 +72,439 @@ class ProductModelTest(TestCase):
             price=29.99
         )
         self.assertEqual(product.stock, 0)
+
+class ProductCatalogCacheTests(APITestCase):
+
+    def setUp(self):
+        get_catalog_cache().clear()
+        self.product = Product.objects.create(name="Gaming Laptop", price=1500.99, stock=10)
+        self.list_url = reverse('product-list')
+        self.detail_url = reverse('product-detail', kwargs={'pk': self.product.pk})
+
+    # ✅ Test repeated reads are served from the cache
+    def test_catalog_reads_are_cached(self):
+        hits, misses = (REGISTRY.get_sample_value('shoply_catalog_cache_requests_total', {'result': result}) for result in ('hit', 'miss'))
+        first = self.client.get(self.list_url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.list_url)
+        self.assertEqual(REGISTRY.get_sample_value('shoply_catalog_cache_requests_total', {'result': 'hit'}), hits + 1)
+        self.assertEqual(REGISTRY.get_sample_value('shoply_catalog_cache_requests_total', {'result': 'miss'}), misses + 1)
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first['ETag'], second['ETag'])
+        self.assertIn('Last-Modified', second)
+
+    # ✅ Test the catalog keeps its entries when other cached data or many other pages fill up
+    def test_catalog_cache_is_separate_and_large(self):
+        self.client.get(self.list_url)
+        default = caches['default']
+        for n in range(400):
+            default.set(f'other:{n}', n)
+            self.client.get(self.list_url, {'min_price': n})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.list_url).status_code, status.HTTP_200_OK)
+
+    # ✅ Test conditional GETs return 304 without touching the database
+    def test_conditional_get_returns_not_modified(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        last_modified = self.client.get(self.detail_url)['Last-Modified']
+        response = self.client.get(self.detail_url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    # ✅ Test admin writes invalidate cached responses
+    def test_update_invalidates_cache(self):
+        etag = self.client.get(self.detail_url)['ETag']
+        admin = get_user_model().objects.create_superuser(username='admin', email='admin@example.com', password='adminpass')
+        self.client.force_authenticate(user=admin)
+        response = self.client.patch(reverse('product-update', kwargs={'pk': self.product.pk}), {'price': '999.00'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['price'], '999.00')
+        self.assertNotEqual(response['ETag'], etag)
+
+    # ✅ Test deletes invalidate the list
+    def test_delete_invalidates_list(self):
+        self.client.get(self.list_url)
+        self.product.delete()
+        self.assertEqual(self.client.get(self.list_url).data['results'], [])
+
+# ✅ The async catalog views served under ASGI (settings.ASYNC_VIEWS)
+class AsyncCatalogViewTests(APITestCase):
+
+    def setUp(self):
+        get_catalog_cache().clear()
+        self.product = Product.objects.create(name="Gaming Laptop", description="Fast", price=1500.99, stock=10)
+        self.detail_url = reverse('product-detail', kwargs={'pk': self.product.pk})
+
+    async def get(self, view, url, data=None, headers=None, **kwargs):
+        return await view.as_view()(AsyncRequestFactory().get(url, data, headers=headers), **kwargs)
+
+    def test_views_are_async(self):
+        for view in (AsyncProductListView, AsyncProductDetailView, AsyncProductSearchView):
+            self.assertTrue(iscoroutinefunction(view.as_view()), view)
+
+    # ✅ Test async reads match the sync views and share their cache entries
+    async def test_matches_sync_views(self):
+        for view, url, data, kwargs in [
+            (AsyncProductListView, reverse('product-list'), None, {}),
+            (AsyncProductDetailView, self.detail_url, None, {'pk': self.product.pk}),
+            (AsyncProductSearchView, reverse('product-search'), {'q': 'laptop'}, {}),
+        ]:
+            response = await self.get(view, url, data, **kwargs)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            cached = await self.async_client.get(url, data)
+            self.assertEqual(cached.json(), json.loads(json.dumps(response.data, default=str)))
+            self.assertEqual(cached['ETag'], response['ETag'])
+
+    async def test_hit_and_conditional_get(self):
+        etag = (await self.get(AsyncProductDetailView, self.detail_url, pk=self.product.pk))['ETag']
+        hits = REGISTRY.get_sample_value('shoply_catalog_cache_requests_total', {'result': 'hit'})
+        response = await self.get(AsyncProductDetailView, self.detail_url, headers={'If-None-Match': etag}, pk=self.product.pk)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(REGISTRY.get_sample_value('shoply_catalog_cache_requests_total', {'result': 'hit'}), hits + 1)
+
+    async def test_errors(self):
+        response = await self.get(AsyncProductDetailView, '/api/products/0/', pk=0)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = await self.get(AsyncProductSearchView, reverse('product-search'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('q', response.data)
+
+class ProductListFilterTests(APITestCase):
+
+    def setUp(self):
+        get_catalog_cache().clear()
+        self.list_url = reverse('product-list')
+        self.cheap = Product.objects.create(name="Mouse", price=20, stock=5)
+        self.mid = Product.objects.create(name="Keyboard", price=80, stock=0)
+        self.pricey = Product.objects.create(name="Laptop", price=1500, stock=2)
+
+    def names(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return [product['name'] for product in response.data['results']]
+
+    # ✅ Test price range and stock filters
+    def test_filters(self):
+        response = self.client.get(self.list_url, {'min_price': '50', 'max_price': '2000', 'ordering': 'price'})
+        self.assertEqual(self.names(response), ["Keyboard", "Laptop"])
+
+        response = self.client.get(self.list_url, {'in_stock': 'true', 'ordering': 'price'})
+        self.assertEqual(self.names(response), ["Mouse", "Laptop"])
+
+    # ✅ Test created_at window
+    def test_created_window(self):
+        Product.objects.filter(pk=self.cheap.pk).update(created_at='2024-01-01T00:00:00Z')
+        response = self.client.get(self.list_url, {'created_before': '2024-06-01', 'ordering': 'name'})
+        self.assertEqual(self.names(response), ["Mouse"])
+        response = self.client.get(self.list_url, {'created_after': '2024-06-01', 'ordering': 'name'})
+        self.assertEqual(self.names(response), ["Keyboard", "Laptop"])
+
+    # ✅ Test sorting and cursor pagination
+    def test_sorting_and_pagination(self):
+        response = self.client.get(self.list_url, {'ordering': '-price', 'page_size': 2})
+        self.assertEqual(self.names(response), ["Laptop", "Keyboard"])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(self.names(response), ["Mouse"])
+        self.assertIsNone(response.data['next'])
+
+    # ✅ Test invalid parameters are rejected
+    def test_invalid_parameters(self):
+        response = self.client.get(self.list_url, {'ordering': 'stock'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.list_url, {'min_price': 'cheap'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('min_price', response.data)
+
+class ProductSearchTests(APITestCase):
+
+    def setUp(self):
+        get_catalog_cache().clear()
+        self.search_url = reverse('product-search')
+        self.laptop = Product.objects.create(name="Gaming Laptop", description="Fast and light", price=1500, stock=3)
+        self.bag = Product.objects.create(name="Travel Bag", description="Fits a 15 inch laptop", price=60, stock=8)
+        Product.objects.create(name="Wireless Mouse", description="Ergonomic", price=25, stock=20)
+
+    def ids(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return [product['id'] for product in response.data['results']]
+
+    # ✅ Test name matches rank above description matches
+    def test_search_ranks_name_above_description(self):
+        response = self.client.get(self.search_url, {'q': 'laptop'})
+        self.assertEqual(self.ids(response), [self.laptop.id, self.bag.id])
+
+    # ✅ Test every term must match
+    def test_search_requires_all_terms(self):
+        response = self.client.get(self.search_url, {'q': 'gaming laptop'})
+        self.assertEqual(self.ids(response), [self.laptop.id])
+
+    # ✅ Test typos fall back to trigram similarity on the name
+    def test_search_typo_fallback(self):
+        response = self.client.get(self.search_url, {'q': 'Gamming Laptpo'})
+        self.assertEqual(self.ids(response), [self.laptop.id])
+
+    # ✅ Test new products are searchable straight away
+    def test_search_sees_new_products(self):
+        self.client.get(self.search_url, {'q': 'keyboard'})
+        keyboard = Product.objects.create(name="Mechanical Keyboard", price=90, stock=4)
+        response = self.client.get(self.search_url, {'q': 'keyboard'})
+        self.assertEqual(self.ids(response), [keyboard.id])
+
+    # ✅ Test sharded stock comes with the results instead of a query per product
+    def test_search_annotates_sharded_stock(self):
+        shard_product(self.laptop, 2)
+        shard_product(self.bag, 2)
+        get_catalog_cache().clear()
+        with CaptureQueriesContext(connection) as one:
+            self.client.get(self.search_url, {'q': 'gaming laptop'})
+        get_catalog_cache().clear()
+        with CaptureQueriesContext(connection) as two:
+            response = self.client.get(self.search_url, {'q': 'laptop'})
+
+        self.assertEqual(len(two), len(one))
+        self.assertEqual([product['stock'] for product in response.data['results']], [3, 8])
+
+    # ✅ Test the query parameter is required
+    def test_search_requires_query(self):
+        response = self.client.get(self.search_url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ShardedStockTests(APITestCase):
+
+    def setUp(self):
+        get_catalog_cache().clear()
+        self.product = shard_product(Product.objects.create(name="Flash Sale TV", price=499, stock=10), 4)
+
+    def shard_stock(self):
+        return list(self.product.stock_shards.order_by('index').values_list('stock', flat=True))
+
+    # ✅ Test sharding spreads the stock column over the shards
+    def test_shard_product_spreads_stock(self):
+        self.product.refresh_from_db()
+        self.assertTrue(self.product.is_sharded)
+        self.assertEqual(self.product.stock, 0)
+        self.assertEqual(self.shard_stock(), [3, 3, 2, 2])
+        self.assertEqual(self.product.available_stock, 10)
+
+    # ✅ Test a reservation comes out of a single shard without touching the product row
+    def test_reserve_takes_from_one_shard(self):
+        updated_at = Product.objects.get(pk=self.product.pk).updated_at
+        reserve_stock({self.product.pk: 2})
+        taken = [before - after for before, after in zip([3, 3, 2, 2], self.shard_stock())]
+        self.assertEqual(sorted(taken), [0, 0, 0, 2])
+        self.assertEqual(Product.objects.get(pk=self.product.pk).updated_at, updated_at)
+
+    # ✅ Test a quantity no single shard holds drains several shards
+    def test_reserve_spans_shards_when_needed(self):
+        reserve_stock({self.product.pk: 9})
+        self.assertEqual(sum(self.shard_stock()), 1)
+
+    # ✅ Test overselling is refused with the total available
+    def test_reserve_insufficient_stock(self):
+        with self.assertRaisesMessage(ValidationError, "Available: 10"):
+            reserve_stock({self.product.pk: 11})
+        self.assertEqual(self.shard_stock(), [3, 3, 2, 2])
+
+    # ✅ Test the API reports the shard total and in_stock sees sharded products
+    def test_reads_report_sum_of_shards(self):
+        response = self.client.get(reverse('product-detail', args=[self.product.pk]))
+        self.assertEqual(response.data['stock'], 10)
+
+        response = self.client.get(reverse('product-list'), {'in_stock': 'true'})
+        self.assertEqual([p['id'] for p in response.data['results']], [self.product.pk])
+
+        StockShard.objects.update(stock=0)
+        get_catalog_cache().clear()
+        response = self.client.get(reverse('product-list'), {'in_stock': 'true'})
+        self.assertEqual(response.data['results'], [])
+
+    # ✅ Test the rebalance command evens out drained shards
+    def test_rebalance_command(self):
+        StockShard.objects.filter(product=self.product, index=0).update(stock=10)
+        StockShard.objects.filter(product=self.product).exclude(index=0).update(stock=0)
+
+        out = StringIO()
+        call_command('rebalance_stock', stdout=out)
+        self.assertEqual(self.shard_stock(), [3, 3, 2, 2])
+
+        call_command('rebalance_stock', self.product.pk, shards=2, stdout=out)
+        self.assertEqual(self.shard_stock(), [5, 5])
+
+    # ✅ Test unsharding folds the shards back into the stock column
+    def test_unshard_product(self):
+        product = unshard_product(self.product)
+        self.assertFalse(product.is_sharded)
+        self.assertEqual(product.stock, 10)
+        self.assertFalse(StockShard.objects.exists())
+
+
+class ProductBulkUpsertTests(APITestCase):
+
+    def setUp(self):
+        self.admin = get_user_model().objects.create_user(
+            username="admin", email="admin@example.com", password="adminpass", is_staff=True
+        )
+        self.client.force_authenticate(user=self.admin)
+        self.existing = Product.objects.create(sku="SKU-1", name="Desk Lamp", description="Warm light", price=30, stock=5)
+
+    def upsert(self, fmt, body):
+        content_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+        return self.client.post(reverse('product-bulk-upsert', args=[fmt]), body, content_type=content_type)
+
+    # ✅ Test only admins can bulk upsert
+    def test_admin_only(self):
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.upsert('csv', "sku,price\nSKU-1,1\n").status_code, status.HTTP_401_UNAUTHORIZED)
+
+    # ✅ Test new SKUs are created and known ones only get the columns in the file
+    def test_csv_creates_and_updates(self):
+        body = "sku,name,price,stock\nSKU-1,,35.50,7\nSKU-2,Desk Chair,120,3\n"
+        response = self.upsert('csv', body)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'created': 1, 'updated': 1, 'failed': 0, 'errors': []})
+
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.name, self.existing.description), ("Desk Lamp", "Warm light"))
+        self.assertEqual((float(self.existing.price), self.existing.stock), (35.5, 7))
+        self.assertEqual(Product.objects.get(sku="SKU-2").name, "Desk Chair")
+
+    # ✅ Test bad rows are reported while the rest of the batch is written
+    def test_row_errors_do_not_abort_batch(self):
+        body = "\n".join([
+            json.dumps({"sku": "SKU-2", "name": "Desk Chair", "price": "120"}),
+            json.dumps({"sku": "SKU-3", "name": "Bad Price", "price": "cheap"}),
+            json.dumps({"sku": "SKU-4", "price": "10"}),
+            json.dumps({"name": "No SKU", "price": "10"}),
+            json.dumps({"sku": "SKU-2", "name": "Again", "price": "1"}),
+            json.dumps({"sku": "SKU-1", "stock": 9}),
+        ])
+        response = self.upsert('ndjson', body)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['updated'], 1)
+        errors = {error['line']: error['errors'] for error in response.data['errors']}
+        self.assertEqual(set(errors), {2, 3, 4, 5})
+        self.assertIn('price', errors[2])
+        self.assertIn('name', errors[3])
+        self.assertIn('sku', errors[4])
+        self.assertEqual(Product.objects.get(sku="SKU-2").name, "Desk Chair")
+
+    # ✅ Test the catalog cache is invalidated once, however many batches there are
+    @override_settings(PRODUCT_IMPORT_BATCH_SIZE=2)
+    def test_catalog_invalidated_once(self):
+        body = "sku,name,price\n" + "".join(f"BULK-{i},Bulk {i},{i + 1}\n" for i in range(5))
+        with mock.patch('products.bulk.bump_catalog_version') as bump:
+            response = self.upsert('csv', body)
+        self.assertEqual(response.data['created'], 5)
+        self.assertEqual(bump.call_count, 1)
+
+    # ✅ Test stock for a sharded product is spread over its shards
+    def test_sharded_stock(self):
+        shard_product(self.existing, 2)
+        self.upsert('csv', "sku,stock\nSKU-1,9\n")
+        product = Product.objects.get(pk=self.existing.pk)
+        self.assertEqual(product.stock, 0)
+        self.assertEqual(product.available_stock, 9)
+
+    # ✅ Test the management command reads a file
+    def test_import_products_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write("sku,name,price,stock\nSKU-9,Monitor,200,4\n")
+        self.addCleanup(os.unlink, f.name)
+        out = StringIO()
+        call_command('import_products', f.name, stdout=out, stderr=StringIO())
+        self.assertIn("Created 1, updated 0, failed 0.", out.getvalue())
+        self.assertEqual(Product.objects.get(sku="SKU-9").stock, 4)
+
+def make_image(size=(1200, 800), mode='RGB', fmt='JPEG'):
+    out = BytesIO()
+    Image.new(mode, size, (200, 30, 30, 128)[:len(mode)]).save(out, fmt)
+    return out.getvalue()
+
+@override_settings(THUMBNAIL_WORKERS=0, THUMBNAIL_SIZES={'small': (100, 100), 'large': (400, 400)})
+class ProductThumbnailTests(APITestCase):
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media_root = media.name
+        override = override_settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.admin = get_user_model().objects.create_superuser(
+            username='imageadmin', email='imageadmin@example.com', password='testpass')
+        self.client.force_authenticate(user=self.admin)
+
+    # ✅ Test an upload writes every size in every format and the API lists their URLs
+    def test_upload_generates_thumbnails(self):
+        upload = SimpleUploadedFile('photo.jpg', make_image(), content_type='image/jpeg')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('product-create'), {
+                'name': 'Camera', 'price': '99.00', 'stock': 1, 'image': upload,
+            }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        product = Product.objects.get(pk=response.data['id'])
+        for size, box in (('small', (100, 67)), ('large', (400, 267))):
+            for fmt in ('webp', 'jpeg'):
+                path = os.path.join(self.media_root, thumbnail_name(product.image.name, size, fmt))
+                with Image.open(path) as thumb:
+                    self.assertEqual((thumb.format.lower(), thumb.size), (fmt, box))
+                self.assertTrue(response.data['thumbnails'][size][fmt].endswith(
+                    thumbnail_name(product.image.name, size, fmt)))
+
+        # Saving without a new upload doesn't render again
+        with self.captureOnCommitCallbacks() as callbacks:
+            product.name = 'Camera II'
+            product.save()
+        self.assertEqual(callbacks, [])
+
+    def test_products_without_image_have_no_thumbnails(self):
+        product = Product.objects.create(name='Plain', price=1, stock=1)
+        response = self.client.get(reverse('product-detail', kwargs={'pk': product.pk}))
+        self.assertIsNone(response.data['thumbnails'])
+
+    def test_render_keeps_aspect_and_flattens_alpha_for_jpeg(self):
+        rendered = render_thumbnails(make_image((50, 300), 'RGBA', 'PNG'), {'small': (100, 100)}, ['webp', 'jpeg'], 80)
+        with Image.open(BytesIO(rendered['small', 'webp'])) as webp:
+            self.assertEqual((webp.size, webp.mode), ((17, 100), 'RGBA'))
+        with Image.open(BytesIO(rendered['small', 'jpeg'])) as jpeg:
+            self.assertEqual((jpeg.size, jpeg.mode), ((17, 100), 'RGB'))
+
+
+
+# ✅ Query and time budgets for every product route, with PRODUCTS products in the catalog
+class ProductEndpointBudgetTests(EndpointBudgetMixin, APITestCase):
+    PRODUCTS = 30
+    urlconf = 'products.urls'
+    snapshot_file = os.path.join(os.path.dirname(__file__), 'query_budgets.json')
+    budgets = [
+        Budget('product-list', queries=1, ms=100),
+        # PostgreSQL full-text search checks for a match before counting; SQLite's fallback takes 2
+        Budget('product-search', queries=3, ms=100, data={'q': 'laptop'}),
+        Budget('product-detail', queries=1, ms=100, kwargs=lambda t: {'pk': t.product.pk}),
+        Budget('product-create', 'post', queries=1, ms=200, status=201, user='admin',
+               data={'name': 'Budget Lamp', 'description': 'Warm light', 'price': '30.00', 'stock': 5}),
+        Budget('product-bulk-upsert', 'post', queries=4, ms=200, user='admin', kwargs={'fmt': 'csv'}, content_type='text/csv',
+               data=lambda t: 'sku,name,price,stock\n' + ''.join(f'BUDGET-{n},Budget {n},10,5\n' for n in range(t.PRODUCTS))),
+        Budget('product-update', 'patch', queries=2, ms=200, user='admin', kwargs=lambda t: {'pk': t.product.pk},
+               data={'price': '999.00'}),
+        Budget('product-delete', 'delete', queries=4, ms=200, status=204, user='admin', kwargs=lambda t: {'pk': t.product.pk}),
+    ]
+
+    def setUp(self):
+        self.admin = get_user_model().objects.create_user(
+            username="budget-admin", email="budget-admin@example.com", password="adminpass", is_staff=True
+        )
+        Product.objects.bulk_create([
+            Product(sku=f'BUDGET-{n}', name=f'Laptop Stand {n}', description="Aluminium", price=20 + n, stock=n % 5)
+            for n in range(self.PRODUCTS)
+        ])
+        self.product = Product.objects.order_by('pk').first()
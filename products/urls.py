@@ -1,16 +1,29 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
+    AsyncProductDetailView,
+    AsyncProductListView,
+    AsyncProductSearchView,
     ProductListView,
     ProductDetailView,
     ProductCreateView,
     ProductUpdateView,
     ProductDeleteView,
+    ProductSearchView,
+    ProductBulkUpsertView,
 )
 
+# ✅ Async catalog reads when served over ASGI (settings.ASYNC_VIEWS)
+list_view = (AsyncProductListView if settings.ASYNC_VIEWS else ProductListView).as_view()
+search_view = (AsyncProductSearchView if settings.ASYNC_VIEWS else ProductSearchView).as_view()
+detail_view = (AsyncProductDetailView if settings.ASYNC_VIEWS else ProductDetailView).as_view()
+
 urlpatterns = [
-    path('', ProductListView.as_view(), name='product-list'),
-    path('<int:pk>/', ProductDetailView.as_view(), name='product-detail'),
+    path('', list_view, name='product-list'),
+    path('search/', search_view, name='product-search'),
+    path('<int:pk>/', detail_view, name='product-detail'),
     path('create/', ProductCreateView.as_view(), name='product-create'),
+    path('bulk.<str:fmt>', ProductBulkUpsertView.as_view(), name='product-bulk-upsert'),
     path('<int:pk>/update/', ProductUpdateView.as_view(), name='product-update'),
     path('<int:pk>/delete/', ProductDeleteView.as_view(), name='product-delete'),
 ]
@@ -1,19 +1,121 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from rest_framework import generics, permissions
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from shoply.async_views import AsyncAPIViewMixin
+from shoply.bulk import FORMATS, parse_import, request_lines
+from shoply.metrics import CATALOG_CACHE_REQUESTS
+from shoply.pagination import KeysetCursorPagination
+from .bulk import upsert_products
+from .cache import acatalog_cache_key, build_catalog_entry, catalog_cache_key, get_catalog_cache
+from .filters import ProductFilter
 from .models import Product
+from .search import search_products
 from .serializers import ProductSerializer
 
+# ✅ Keyset pagination for the catalog; ordering comes from ProductFilter
+class ProductPagination(KeysetCursorPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+# ✅ Relevance-ranked results are paged by number; deep search pages are rare
+class ProductSearchPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+
+# ✅ Serve public catalog reads from the versioned cache, honouring conditional GETs
+class CatalogCacheMixin:
+    def get(self, request, *args, **kwargs):
+        cache = get_catalog_cache()
+        key = catalog_cache_key(request)
+        entry = cache.get(key)
+        CATALOG_CACHE_REQUESTS.labels('miss' if entry is None else 'hit').inc()
+        if entry is None:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            entry = build_catalog_entry(response.data)
+            cache.set(key, entry, settings.CATALOG_CACHE_TIMEOUT)
+        return self.cached_response(request, entry)
+
+    def cached_response(self, request, entry):
+        response = get_conditional_response(
+            request, etag=entry['etag'], last_modified=entry['last_modified']
+        ) or Response(entry['data'])
+        response['ETag'] = entry['etag']
+        if entry['last_modified'] is not None:
+            response['Last-Modified'] = http_date(entry['last_modified'])
+        return response
+
+# ✅ CatalogCacheMixin for async views: the cache is read through its async API
+class AsyncCatalogCacheMixin(AsyncAPIViewMixin, CatalogCacheMixin):
+    async def get(self, request, *args, **kwargs):
+        cache = get_catalog_cache()
+        key = await acatalog_cache_key(request)
+        entry = await cache.aget(key)
+        CATALOG_CACHE_REQUESTS.labels('miss' if entry is None else 'hit').inc()
+        if entry is None:
+            response = await self.uncached_response(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            entry = build_catalog_entry(response.data)
+            await cache.aset(key, entry, settings.CATALOG_CACHE_TIMEOUT)
+        return self.cached_response(request, entry)
+
+    async def uncached_response(self, request, *args, **kwargs):
+        # Filtering and pagination are sync, so lists are built on the request's thread
+        return await sync_to_async(self.list)(request, *args, **kwargs)
+
 # ✅ List all products (Public)
-class ProductListView(generics.ListAPIView):
-    queryset = Product.objects.all()
+class ProductListView(CatalogCacheMixin, generics.ListAPIView):
+    queryset = Product.objects.defer('search_vector').with_available_stock()
     serializer_class = ProductSerializer
     permission_classes = [permissions.AllowAny]
+    filter_backends = [ProductFilter]
+    pagination_class = ProductPagination
 
 # ✅ Retrieve a single product (Public)
-class ProductDetailView(generics.RetrieveAPIView):
-    queryset = Product.objects.all()
+class ProductDetailView(CatalogCacheMixin, generics.RetrieveAPIView):
+    queryset = Product.objects.defer('search_vector').with_available_stock()
     serializer_class = ProductSerializer
     permission_classes = [permissions.AllowAny]
 
+# ✅ Full-text product search (Public)
+class ProductSearchView(CatalogCacheMixin, generics.ListAPIView):
+    serializer_class = ProductSerializer
+    permission_classes = [permissions.AllowAny]
+    pagination_class = ProductSearchPagination
+
+    def get_queryset(self):
+        query = self.request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': ["This query parameter is required."]})
+        return search_products(query)
+
+# ✅ Async catalog reads for ASGI (settings.ASYNC_VIEWS)
+class AsyncProductListView(AsyncCatalogCacheMixin, ProductListView):
+    pass
+
+class AsyncProductDetailView(AsyncCatalogCacheMixin, ProductDetailView):
+    async def uncached_response(self, request, *args, **kwargs):
+        try:
+            product = await self.get_queryset().aget(pk=kwargs['pk'])
+        except Product.DoesNotExist:
+            raise Http404(f"No {Product._meta.object_name} matches the given query.")
+        self.check_object_permissions(request, product)
+        return Response(self.get_serializer(product).data)
+
+class AsyncProductSearchView(AsyncCatalogCacheMixin, ProductSearchView):
+    pass
+
 # ✅ Create a product (Admin only)
 class ProductCreateView(generics.CreateAPIView):
     queryset = Product.objects.all()
@@ -31,3 +133,14 @@ class ProductDeleteView(generics.DestroyAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [permissions.IsAdminUser]
+
+
+# ✅ Upsert products by SKU from a streamed CSV or NDJSON file (Admin only)
+class ProductBulkUpsertView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request, fmt):
+        if fmt not in FORMATS:
+            raise NotFound(f"Use .{' or .'.join(FORMATS)}.")
+        result = upsert_products(parse_import(fmt, request_lines(request)))
+        return Response(result.as_dict())
@@ -0,0 +1,36 @@
+from asgiref.sync import sync_to_async
+
+
+class AsyncAPIViewMixin:
+    """
+    Let an ``APIView`` declare its handlers with ``async def``.
+
+    DRF only dispatches synchronously, so this replaces ``dispatch`` with a
+    coroutine. Authentication, permission and throttle checks may hit the
+    database or cache, so they run through ``sync_to_async`` (on the
+    request's own thread under ASGI) before the handler is awaited; the rest
+    of the request/response handling is DRF's own. Every HTTP handler of the
+    view must be a coroutine for Django to treat it as async.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if hasattr(response, '__await__'):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
@@ -0,0 +1,185 @@
+import difflib
+import json
+import os
+import re
+import time
+from pathlib import Path
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver, resolve, reverse
+from shoply.profiling import normalize_sql
+
+_SAVEPOINT = re.compile(r'(SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT) "?\w+"?')
+_VALUES = re.compile(r'VALUES \([^()]*\)(?:, \([^()]*\))*')
+
+# Slow machines can stretch every time budget, e.g. BUDGET_TIME_FACTOR=3 on CI
+TIME_FACTOR = float(os.getenv('BUDGET_TIME_FACTOR', 1))
+# UPDATE_QUERY_BUDGETS=1 rewrites the SQL snapshots failures are diffed against
+UPDATE_SNAPSHOTS = os.getenv('UPDATE_QUERY_BUDGETS') == '1'
+
+
+def snapshot_sql(sql):
+    """Normalized SQL with savepoint names (which embed the thread id) and multi-row VALUES blanked out."""
+    return _VALUES.sub('VALUES (...)', _SAVEPOINT.sub(r'\1 ?', normalize_sql(sql)))
+
+
+class Budget:
+    """
+    The most queries and milliseconds one request to a named route may take.
+
+    ``kwargs`` and ``data`` may be callables taking the test case, for values
+    that come from its fixtures. ``user`` names the test case attribute to
+    send a fresh access token for; ``content_type`` sends ``data`` as a raw
+    body.
+    """
+
+    def __init__(self, name, method='get', queries=0, ms=100, status=200, user=None, kwargs=None, data=None,
+                 content_type=None, label=None):
+        self.name = name
+        self.method = method
+        self.queries = queries
+        self.ms = ms
+        self.status = status
+        self.user = user
+        self.kwargs = kwargs
+        self.data = data
+        self.content_type = content_type
+        self.label = label or f'{name} {method.upper()}'
+
+    def resolve(self, value, test):
+        return value(test) if callable(value) else value
+
+
+def app_routes(urlconf):
+    """Full routes of every pattern in ``urlconf`` as included by the root URLconf."""
+    for entry in get_resolver().url_patterns:
+        if isinstance(entry, URLResolver) and getattr(entry.urlconf_module, '__name__', None) == urlconf:
+            return {str(entry.pattern) + str(pattern.pattern) for pattern in entry.url_patterns}
+    return set()
+
+
+class EndpointBudgetMixin:
+    """
+    Turn the ``budgets`` of a test case into one test each.
+
+    Each test resets the in-process caches (catalog, token revocation,
+    blacklist, throttles) so counts don't depend on test order, makes its
+    request once with the queries captured, and fails if it issued more
+    queries or took longer than budgeted. The failure shows a diff of the
+    captured SQL against the snapshot in ``snapshot_file``, last written by a
+    run with ``UPDATE_QUERY_BUDGETS=1``. ``test_every_route_has_budget``
+    checks that each route in ``urlconf`` has a budget or is listed in
+    ``unbudgeted`` with the reason. A summary table is printed after the
+    class has run.
+    """
+    budgets = []
+    urlconf = None
+    unbudgeted = {}
+    snapshot_file = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for budget in cls.budgets:
+            name = 'test_budget_' + re.sub(r'\W+', '_', budget.label.lower()).strip('_')
+
+            def test(self, budget=budget):
+                self.check_budget(budget)
+            test.__name__ = name
+            setattr(cls, name, test)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.budget_results = []
+        cls.captured_sql = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.budget_results:
+            cls.print_summary()
+        if UPDATE_SNAPSHOTS and cls.captured_sql:
+            snapshots = cls.load_snapshots()
+            snapshots.setdefault(connection.vendor, {}).update(cls.captured_sql)
+            with open(cls.snapshot_file, 'w') as f:
+                json.dump(snapshots, f, indent=2, sort_keys=True)
+                f.write('\n')
+        super().tearDownClass()
+
+    @classmethod
+    def load_snapshots(cls):
+        path = Path(cls.snapshot_file)
+        return json.loads(path.read_text()) if path.exists() else {}
+
+    @classmethod
+    def print_summary(cls):
+        rows = [('endpoint', 'status', 'queries', 'budget', 'ms', 'budget ms', '')]
+        for label, status, queries, budget_queries, ms, budget_ms, ok in sorted(cls.budget_results):
+            rows.append((label, str(status), str(queries), str(budget_queries), f'{ms:.1f}', f'{budget_ms:.0f}',
+                         '' if ok else 'OVER'))
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        print(f'\n{cls.__name__} ({connection.vendor})')
+        for n, row in enumerate(rows):
+            print('  '.join(value.ljust(width) for value, width in zip(row, widths)).rstrip())
+            if n == 0:
+                print('  '.join('-' * width for width in widths).rstrip())
+
+    def reset_caches(self):
+        from products.cache import get_catalog_cache
+        from users.authentication import blacklist_cache, revocation_cache
+        from users.throttling import get_throttle_backend
+
+        get_catalog_cache().clear()
+        revocation_cache.clear()
+        blacklist_cache.clear()
+        'warm-up' in blacklist_cache  # Loaded once per process, not per request
+        get_throttle_backend().clear()
+
+    def authenticate_budget(self, budget):
+        from users.authentication import ClaimsRefreshToken
+
+        if budget.user:
+            token = ClaimsRefreshToken.for_user(getattr(self, budget.user)).access_token
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def request_budget(self, budget):
+        """Make the budgeted request and return the response, its body fully read."""
+        path = reverse(budget.name, kwargs=budget.resolve(budget.kwargs, self))
+        data = budget.resolve(budget.data, self)
+        if budget.content_type:
+            response = self.client.generic(budget.method.upper(), path, data or '', content_type=budget.content_type)
+        else:
+            response = getattr(self.client, budget.method)(path, data, format='json')
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def check_budget(self, budget):
+        self.reset_caches()
+        self.authenticate_budget(budget)
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            response = self.request_budget(budget)
+            elapsed = (time.perf_counter() - started) * 1000
+        self.assertEqual(response.status_code, budget.status,
+                         getattr(response, 'data', None) if not response.streaming else None)
+
+        sql = [snapshot_sql(query['sql']) for query in ctx.captured_queries]
+        self.captured_sql[budget.label] = sql
+        max_ms = budget.ms * TIME_FACTOR
+        ok = len(sql) <= budget.queries and elapsed <= max_ms
+        self.budget_results.append(
+            (budget.label, response.status_code, len(sql), budget.queries, elapsed, max_ms, ok)
+        )
+        if not ok:
+            expected = self.load_snapshots().get(connection.vendor, {}).get(budget.label, [])
+            diff = '\n'.join(difflib.unified_diff(expected, sql, 'snapshot', 'captured', lineterm=''))
+            self.fail(
+                f"{budget.label}: {len(sql)} queries (budget {budget.queries}), "
+                f"{elapsed:.1f} ms (budget {max_ms:.0f} ms)\n{diff or chr(10).join(sql)}"
+            )
+
+    def test_every_route_has_budget(self):
+        budgeted = {resolve(reverse(b.name, kwargs=b.resolve(b.kwargs, self))).route for b in self.budgets}
+        missing = app_routes(self.urlconf) - budgeted - set(self.unbudgeted)
+        self.assertFalse(missing, f"Routes in {self.urlconf} without a budget: {sorted(missing)}")
@@ -0,0 +1,52 @@
+import csv
+import json
+
+from django.conf import settings
+
+# ✅ Formats accepted by the bulk import/export endpoints, keyed by file extension
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def request_lines(request):
+    """Iterate over a request body as text lines without loading it into memory."""
+    return (line.decode('utf-8-sig') for line in request.stream or ())
+
+
+def parse_import(fmt, lines):
+    """Yield ``(line number, row dict)`` from an iterable of text lines; the dict is ``None`` if unparsable."""
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield number, None
+            continue
+        yield number, row if isinstance(row, dict) else None
+
+
+class ImportResult:
+    """Counts and per-row errors (up to ``BULK_IMPORT_MAX_ERRORS``) for a bulk import."""
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, line, errors):
+        self.failed += 1
+        if len(self.errors) < settings.BULK_IMPORT_MAX_ERRORS:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def as_dict(self):
+        return {'created': self.created, 'updated': self.updated, 'failed': self.failed, 'errors': self.errors}
@@ -0,0 +1,259 @@
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from array import array
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+HEADER = struct.Struct('<QQ')  # layout checksum, slot count
+SLOT = struct.Struct('<d')
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+LOCK_WAIT_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1)
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms backed by one flat array of doubles per process.
+
+    Every metric gets fixed slots when it is declared, so all processes
+    running the same code share a layout. With ``METRICS_DIR`` set, each
+    process keeps its array in an mmap'd ``<pid>.metrics`` file there and
+    ``collect()`` adds up every file with a matching layout, so one gunicorn
+    worker can serve totals for all of them (and for management commands).
+    Files of exited processes keep counting, as counters must never go
+    down; empty the directory when the service is deployed. Without
+    ``METRICS_DIR`` the array lives in anonymous memory and only this
+    process is reported.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.slots = 0
+        self._storage = None
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._forget_storage)
+
+    def register(self, metric, slots):
+        if self._storage is not None:
+            raise RuntimeError(f"Metric {metric.name} was declared after the registry was written to.")
+        offset, self.slots = self.slots, self.slots + slots
+        self.metrics.append(metric)
+        return offset
+
+    @property
+    def checksum(self):
+        layout = ';'.join(f'{metric.name}:{metric.layout()}' for metric in self.metrics)
+        return zlib.crc32(layout.encode())
+
+    @property
+    def directory(self):
+        return Path(settings.METRICS_DIR) if settings.METRICS_DIR else None
+
+    def _forget_storage(self):
+        # A forked worker must not write into its parent's file
+        self._storage = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        size = HEADER.size + SLOT.size * self.slots
+        if self.directory is None:
+            storage = mmap.mmap(-1, size)
+        else:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.directory / f'{os.getpid()}.metrics', 'w+b') as f:
+                f.truncate(size)
+                storage = mmap.mmap(f.fileno(), size)
+        HEADER.pack_into(storage, 0, self.checksum, self.slots)
+        return storage
+
+    def add(self, slot, amount=1.0):
+        offset = HEADER.size + SLOT.size * slot
+        with self._lock:
+            if self._storage is None:
+                self._storage = self._open()
+            SLOT.pack_into(self._storage, offset, SLOT.unpack_from(self._storage, offset)[0] + amount)
+
+    def _read(self, data):
+        checksum, slots = HEADER.unpack_from(data, 0)
+        if checksum != self.checksum or slots != self.slots or len(data) < HEADER.size + SLOT.size * slots:
+            return None  # Written by another version of the code
+        values = array('d')
+        values.frombytes(bytes(data[HEADER.size:HEADER.size + SLOT.size * slots]))
+        return values
+
+    def collect(self):
+        """Slot values summed over every process sharing ``METRICS_DIR``."""
+        totals = array('d', bytes(SLOT.size * self.slots))
+        if self.directory is None:
+            sources = [self._storage] if self._storage is not None else []
+        else:
+            sources = []
+            for path in self.directory.glob('*.metrics'):
+                try:
+                    sources.append(path.read_bytes())
+                except FileNotFoundError:
+                    pass
+        for data in sources:
+            values = self._read(data) if len(data) >= HEADER.size else None
+            if values is not None:
+                for slot, value in enumerate(values):
+                    totals[slot] += value
+        return totals
+
+    def render(self):
+        """Everything in the Prometheus text exposition format."""
+        values = self.collect()
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(f'{name}{_labels(pairs)} {_format(value)}' for name, pairs, value in metric.samples(values))
+        return '\n'.join(lines) + '\n'
+
+    def get_sample_value(self, name, labels=None):
+        """Current value of a sample such as ``shoply_checkout_seconds_count``, or None if there is none."""
+        values = self.collect()
+        wanted = sorted((labels or {}).items())
+        for metric in self.metrics:
+            for sample, pairs, value in metric.samples(values):
+                if sample == name and sorted(pairs) == wanted:
+                    return value
+        return None
+
+
+def _format(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else f'{int(value)}'
+
+
+def _labels(pairs):
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}' if pairs else ''
+
+
+class Metric:
+    """A named metric with an optional label whose values are fixed up front."""
+    kind = None
+    width = 1  # slots per label value
+
+    def __init__(self, name, documentation, label=None, values=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.values = tuple(values) if label else (None,)
+        self.registry = registry or REGISTRY
+        self.offset = self.registry.register(self, self.width * len(self.values))
+
+    def layout(self):
+        return f'{self.kind}:{self.label}:{",".join(map(str, self.values))}'
+
+    def labels(self, value):
+        """The child for one label value, e.g. ``CATALOG_CACHE_REQUESTS.labels('hit')``."""
+        return type(self)._Child(self, self.offset + self.width * self.values.index(value))
+
+    def label_pairs(self, index):
+        return [(self.label, self.values[index])] if self.label else []
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    class _Child:
+        def __init__(self, metric, offset):
+            self.registry, self.offset = metric.registry, offset
+
+        def inc(self, amount=1):
+            self.registry.add(self.offset, amount)
+
+    def inc(self, amount=1):
+        self.registry.add(self.offset, amount)
+
+    def samples(self, values):
+        for index in range(len(self.values)):
+            yield f'{self.name}_total', self.label_pairs(index), values[self.offset + index]
+
+
+class Histogram(Metric):
+    """Observations counted into fixed ``buckets`` (upper bounds in seconds), plus their sum."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS, **kwargs):
+        self.buckets = tuple(buckets) + (math.inf,)
+        self.width = len(self.buckets) + 1  # one slot per bucket, then the sum
+        super().__init__(name, documentation, **kwargs)
+
+    def layout(self):
+        return f'{super().layout()}:{",".join(map(str, self.buckets))}'
+
+    class _Child:
+        def __init__(self, metric, offset):
+            self.metric, self.offset = metric, offset
+
+        def observe(self, value):
+            registry, buckets = self.metric.registry, self.metric.buckets
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    break
+            registry.add(self.offset + index)
+            registry.add(self.offset + len(buckets), value)
+
+        @contextmanager
+        def time(self):
+            started = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.observe(time.perf_counter() - started)
+
+    def observe(self, value):
+        self._Child(self, self.offset).observe(value)
+
+    def time(self):
+        """Observe how long the ``with`` block takes."""
+        return self._Child(self, self.offset).time()
+
+    def samples(self, values):
+        for index in range(len(self.values)):
+            base = self.offset + self.width * index
+            pairs = self.label_pairs(index)
+            count = 0
+            for slot, bound in enumerate(self.buckets):
+                count += values[base + slot]
+                yield f'{self.name}_bucket', pairs + [('le', _format(bound))], count
+            yield f'{self.name}_sum', pairs, values[base + len(self.buckets)]
+            yield f'{self.name}_count', pairs, count
+
+
+REGISTRY = MetricsRegistry()
+
+# ✅ Hot paths; declared here so every process lays out the same slots
+CHECKOUT_SECONDS = Histogram('shoply_checkout_seconds', "Order creation request latency.")
+STOCK_LOCK_WAIT_SECONDS = Histogram(
+    'shoply_stock_lock_wait_seconds', "Time spent acquiring product row locks to reserve stock.",
+    buckets=LOCK_WAIT_BUCKETS, label='source', values=('checkout', 'order_item'),
+)
+PAYMENT_SECONDS = Histogram(
+    'shoply_payment_seconds', "Payment processor charge latency.", label='result', values=('succeeded', 'failed'),
+)
+EMAIL_SEND_SECONDS = Histogram(
+    'shoply_email_send_seconds', "Outbound email send latency.", label='result', values=('sent', 'failed'),
+)
+CATALOG_CACHE_REQUESTS = Counter(
+    'shoply_catalog_cache_requests', "Catalog reads served from the cache (hit) or rebuilt (miss).",
+    label='result', values=('hit', 'miss'),
+)
+
+
+def metrics_view(request):
+    """Serve the registry to scrapers on ``METRICS_ALLOWED_IPS`` (everyone if it is empty)."""
+    if settings.METRICS_ALLOWED_IPS and request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
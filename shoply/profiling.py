@@ -0,0 +1,180 @@
+import gc
+import heapq
+import json
+import logging
+import random
+import re
+import sys
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_profile', default=None)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """Replace literals and placeholders with ``?`` so the same query groups together."""
+    sql = _STRING.sub('?', sql.replace('%s', '?'))
+    sql = _NUMBER.sub('?', sql)
+    return _SPACE.sub(' ', _IN_LIST.sub('(...)', sql)).strip()
+
+
+class RequestProfile:
+    """Timings gathered for one sampled request."""
+
+    def __init__(self, slow_queries):
+        self.query_count = 0
+        self.db_time = 0.0
+        self.slowest = []  # min-heap of (duration, order, sql)
+        self.slow_queries = slow_queries
+        self.external = {}
+
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.query_count += 1
+            self.db_time += duration
+            entry = (duration, self.query_count, sql)
+            if len(self.slowest) < self.slow_queries:
+                heapq.heappush(self.slowest, entry)
+            elif duration > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, entry)
+
+    def add_external(self, name, duration):
+        self.external[name] = self.external.get(name, 0.0) + duration
+
+
+@contextmanager
+def external_call(name):
+    """Count the block as time spent waiting on ``name`` (e.g. ``'stripe'``) in the request profile."""
+    profile = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if profile is not None:
+            profile.add_external(name, time.perf_counter() - started)
+
+
+def capture_queries(stack, profile):
+    """Record this thread's queries on every connection into ``profile`` until ``stack`` closes."""
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(profile.record_query))
+
+
+def _gc_collections():
+    return sum(stats['collections'] for stats in gc.get_stats())
+
+
+class RequestProfilingMiddleware:
+    """
+    Profile a ``PROFILE_SAMPLE_RATE`` fraction of requests.
+
+    A sampled request gets a ``Server-Timing`` header (db, external calls,
+    app and total milliseconds) and one JSON line on the ``shoply.profiling``
+    logger with the query count, DB time, the slowest queries as normalized
+    SQL, time spent in ``external_call()`` blocks, CPU time and allocation
+    counts. Unsampled requests only pay for one ``random()`` call.
+
+    Allocations are the change in live memory blocks and the number of
+    garbage collections during the request; both are process-wide, so
+    concurrent threads show up in them. Streaming responses are timed until
+    the view returns, not until the body has been sent. Under ASGI queries
+    are captured on the thread the request's ORM calls run on, and CPU time
+    is left out, since the event loop thread interleaves requests.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        rate = settings.PROFILE_SAMPLE_RATE
+        if rate <= 0 or random.random() >= rate:
+            return self.get_response(request)
+
+        profile = RequestProfile(settings.PROFILE_SLOW_QUERIES)
+        token = _current.set(profile)
+        blocks, collections = sys.getallocatedblocks(), _gc_collections()
+        cpu_started, started = time.thread_time(), time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                capture_queries(stack, profile)
+                response = self.get_response(request)
+        finally:
+            total = time.perf_counter() - started
+            cpu = time.thread_time() - cpu_started
+            _current.reset(token)
+        return self.report(request, response, profile, total, cpu, blocks, collections)
+
+    async def __acall__(self, request):
+        rate = settings.PROFILE_SAMPLE_RATE
+        if rate <= 0 or random.random() >= rate:
+            return await self.get_response(request)
+
+        profile = RequestProfile(settings.PROFILE_SLOW_QUERIES)
+        token = _current.set(profile)
+        blocks, collections = sys.getallocatedblocks(), _gc_collections()
+        stack = ExitStack()
+        started = time.perf_counter()
+        try:
+            await sync_to_async(capture_queries)(stack, profile)
+            response = await self.get_response(request)
+        finally:
+            total = time.perf_counter() - started
+            await sync_to_async(stack.close)()
+            _current.reset(token)
+        return self.report(request, response, profile, total, None, blocks, collections)
+
+    def report(self, request, response, profile, total, cpu, blocks, collections):
+        external = sum(profile.external.values())
+        app = max(total - profile.db_time - external, 0.0)
+        if settings.PROFILE_SERVER_TIMING:
+            metrics = [f'db;dur={profile.db_time * 1000:.1f};desc="{profile.query_count} queries"']
+            metrics += [f'{name};dur={duration * 1000:.1f}' for name, duration in profile.external.items()]
+            metrics += [f'app;dur={app * 1000:.1f}', f'total;dur={total * 1000:.1f}']
+            existing = response.get('Server-Timing')
+            response['Server-Timing'] = ', '.join(([existing] if existing else []) + metrics)
+
+        match = request.resolver_match
+        logger.info(json.dumps({
+            'time': round(time.time(), 3),
+            'method': request.method,
+            'path': request.path,
+            'route': match.route if match else None,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+            'cpu_ms': round(cpu * 1000, 2) if cpu is not None else None,
+            'app_ms': round(app * 1000, 2),
+            'db_ms': round(profile.db_time * 1000, 2),
+            'queries': profile.query_count,
+            'slow_queries': [
+                {'ms': round(duration * 1000, 2), 'sql': normalize_sql(sql)}
+                for duration, _, sql in sorted(profile.slowest, reverse=True)
+            ],
+            'external_ms': {name: round(duration * 1000, 2) for name, duration in profile.external.items()},
+            'allocated_blocks': sys.getallocatedblocks() - blocks,
+            'gc_collections': _gc_collections() - collections,
+        }))
+        return response
@@ -38,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     
     # Custom Apps
     'users',
@@ -51,6 +52,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'shoply.profiling.RequestProfilingMiddleware',  # Opt-in via PROFILE_SAMPLE_RATE
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # Enable CORS
@@ -83,6 +85,11 @@ TEMPLATES = [
 
 # WSGI Application
 WSGI_APPLICATION = 'shoply.wsgi.application'
+ASGI_APPLICATION = 'shoply.asgi.application'
+
+# ✅ Route payment, password reset, registration and catalog reads to their async
+# views; shoply/asgi.py turns this on, since under WSGI they'd only add overhead
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False') == 'True'
 
 
 # Database Configuration (PostgreSQL)
@@ -120,20 +127,74 @@ AUTH_PASSWORD_VALIDATORS = [
 # JWT Authentication (DRF)
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.ClaimsJWTAuthentication',  # ✅ request.user from token claims
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    # ✅ Sliding-window limits for the unauthenticated auth endpoints (users.throttling)
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': '30/min',
+        'login_username': '10/min',
+        'register_ip': '20/hour',
+        'register_email': '5/hour',
+        'password_reset_ip': '10/hour',
+        'password_reset_email': '3/hour',
+    },
+    # ✅ Reverse proxies in front of the app; throttles trust X-Forwarded-For only this far,
+    # so with none (the default) clients are keyed on REMOTE_ADDR whatever header they send
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 0)),
 }
 
+# Where throttle counters live: per process (LocalThrottleBackend, capped at
+# THROTTLE_LOCAL_MAX_KEYS keys) or shared through a cache (CacheThrottleBackend)
+THROTTLE_BACKEND = os.getenv('THROTTLE_BACKEND', 'users.throttling.LocalThrottleBackend')
+THROTTLE_CACHE_ALIAS = 'throttle'
+THROTTLE_LOCAL_MAX_KEYS = 100000
+
 # JWT Settings
 from datetime import timedelta
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=5),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'AUTH_HEADER_TYPES': ('Bearer',),
+    'TOKEN_OBTAIN_SERIALIZER': 'users.authentication.ClaimsTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'users.authentication.ClaimsTokenRefreshSerializer',
+}
+
+# ✅ How long (seconds) and for how many sessions each process remembers whether a
+# refresh token was blacklisted; a logout can take this long to reach other processes
+JWT_REVOCATION_CACHE_TTL = 30
+JWT_REVOCATION_CACHE_SIZE = 10000
+# Seconds between fetching newly blacklisted tokens into each process's in-memory
+# blacklist, and between full reloads of it (which drop expired tokens); each fetch
+# also re-reads rows stamped up to JWT_BLACKLIST_SYNC_OVERLAP seconds before the last
+# one, for rows that commit late and for clock skew between servers
+JWT_BLACKLIST_SYNC_INTERVAL = 30
+JWT_BLACKLIST_REBUILD_INTERVAL = 3600
+JWT_BLACKLIST_SYNC_OVERLAP = 60
+
+# ✅ Password hashing (users.hashers). PASSWORD_HASHER picks the algorithm for new hashes:
+# pbkdf2_sha256, scrypt or argon2 (needs argon2-cffi); the others still verify old hashes.
+# Hashes made with another algorithm or other parameters are upgraded on the next login.
+# `manage.py bench_hashers` prints hashes per second per core for each option.
+PASSWORD_HASHER = os.getenv('PASSWORD_HASHER', 'pbkdf2_sha256')
+PASSWORD_HASHER_PARAMS = {
+    'pbkdf2_sha256': {'iterations': int(os.getenv('PBKDF2_ITERATIONS', 870000))},
+    'scrypt': {'work_factor': 2 ** 14, 'block_size': 8, 'parallelism': 5},
+    'argon2': {'time_cost': 2, 'memory_cost': 102400, 'parallelism': 8},
+}
+_PASSWORD_HASHER_CLASSES = {
+    'pbkdf2_sha256': 'users.hashers.PBKDF2PasswordHasher',
+    'scrypt': 'users.hashers.ScryptPasswordHasher',
+    'argon2': 'users.hashers.Argon2PasswordHasher',
 }
+PASSWORD_HASHERS = [_PASSWORD_HASHER_CLASSES[PASSWORD_HASHER]] + [
+    path for name, path in _PASSWORD_HASHER_CLASSES.items() if name != PASSWORD_HASHER
+] + [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
 
 # Internationalization
 LANGUAGE_CODE = 'en-us'
@@ -150,21 +211,119 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# ✅ Derivatives generated for uploaded product and profile images (shoply.thumbnails):
+# bounding boxes, formats, encoder quality and worker processes (0 renders in the request)
+THUMBNAIL_SIZES = {'small': (160, 160), 'medium': (480, 480), 'large': (960, 960)}
+THUMBNAIL_FORMATS = ['webp', 'jpeg']
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_WORKERS = int(os.getenv('THUMBNAIL_WORKERS', 2))
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:8000",
     "http://127.0.0.1:8000",
 ]
 
+# ✅ Cache (use a shared backend such as Redis in production so catalog
+# invalidation reaches every worker process)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # ✅ Catalog responses get a cache of their own: every list/filter/page permutation
+    # takes an entry, so they must only ever evict each other
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # ✅ Counters for CacheThrottleBackend, which clear() empties; point it at a shared
+    # backend (e.g. Redis) in production so every worker counts against the same limits
+    'throttle': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'throttle',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    # ✅ Idempotency-Key records in a table every worker shares (created by orders migration
+    # 0009), sized so no live key is culled within IDEMPOTENCY_KEY_TTL
+    'idempotency': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'orders_idempotency_cache',
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {'MAX_ENTRIES': 1000000},
+    },
+}
+
+# Public catalog responses are cached per catalog version; stock changes made
+# by checkout don't bump the version, so they show up after this many seconds
+CATALOG_CACHE_ALIAS = 'catalog'
+CATALOG_CACHE_TIMEOUT = 60
+
+# ✅ Payment processor client (orders.payments.FakePaymentClient for local runs) and
+# the `capture_payments` worker: threads per batch and seconds before a stuck claim is retried
+PAYMENT_CLIENT = os.getenv('PAYMENT_CLIENT', 'orders.payments.StripeClient')
+PAYMENT_CAPTURE_WORKERS = 8
+PAYMENT_CLAIM_TIMEOUT = 300
+
+# ✅ Idempotency-Key responses for order creation and payments, kept for a day in a
+# cache shared by all workers so a retry can land on any of them
+IDEMPOTENCY_CACHE_ALIAS = 'idempotency'
+IDEMPOTENCY_KEY_TTL = 60 * 60 * 24
+IDEMPOTENCY_LOCK_TIMEOUT = 60
+
+# ✅ Admin bulk export/import: rows fetched per cursor round trip, rows per
+# bulk_create and how many row errors an import reports back
+ORDER_EXPORT_CHUNK_SIZE = 2000
+ORDER_IMPORT_BATCH_SIZE = 2000
+PRODUCT_IMPORT_BATCH_SIZE = 2000
+BULK_IMPORT_MAX_ERRORS = 100
+
+# ✅ Request profiling (shoply.profiling): fraction of requests sampled (0 turns it off),
+# slowest queries kept per request, whether to send Server-Timing, and the rotating JSON log
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_SLOW_QUERIES = 5
+PROFILE_SERVER_TIMING = True
+PROFILE_LOG_FILE = os.getenv('PROFILE_LOG_FILE', BASE_DIR / 'request_profile.log')
+
+# ✅ Metrics for /metrics (shoply.metrics): a directory shared by all worker processes on the
+# host, emptied on each deploy, so any worker can report totals; unset reports only itself
+METRICS_DIR = os.getenv('METRICS_DIR')
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'request_profile': {
+            'class': 'logging.handlers.RotatingFileHandler',
+            'filename': PROFILE_LOG_FILE,
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 5,
+            'delay': True,  # Only create the file once something is sampled
+        },
+    },
+    'loggers': {
+        'shoply.profiling': {'handlers': ['request_profile'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 # Default Auto Field
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # ✅ Cấu hình gửi email
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')  # Thay bằng email thật
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')  # Thay bằng mật khẩu email thật
 
+# ✅ Outbound email is queued in the database and sent by `manage.py send_queued_email`;
+# failed sends are retried after 1, 2, 4... minutes (capped at an hour), up to 5 tries, and
+# messages a dead worker left sending are picked up again after 5 minutes
+EMAIL_QUEUE_MAX_ATTEMPTS = 5
+EMAIL_QUEUE_RETRY_DELAY = 60
+EMAIL_QUEUE_MAX_RETRY_DELAY = 3600
+EMAIL_QUEUE_CLAIM_TIMEOUT = 300
+
 # ✅ URL frontend để người dùng truy cập đặt lại mật khẩu
 FRONTEND_URL = "http://localhost:3000"
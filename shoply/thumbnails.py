@@ -0,0 +1,169 @@
+import logging
+import multiprocessing
+import posixpath
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_save, pre_save
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def thumbnail_name(name, size, fmt):
+    """Storage name of one derivative: ``product_images/a.png`` -> ``thumbnails/product_images/a_small.webp``."""
+    stem = posixpath.splitext(name)[0]
+    return f'thumbnails/{stem}_{size}.{EXTENSIONS[fmt]}'
+
+
+def render_thumbnails(data, sizes, formats, quality):
+    """
+    Resize the image in ``data`` to every size and encode it in every format.
+
+    ``sizes`` maps names to ``(width, height)`` boxes; images keep their aspect
+    ratio and are never enlarged. Returns ``{(size name, format): bytes}``.
+    This is plain CPU work with no Django state, so it can run in a worker
+    process.
+    """
+    results = {}
+    with Image.open(BytesIO(data)) as image:
+        # ✅ Let the JPEG decoder scale down while decoding instead of inflating the full image
+        image.draft('RGB', max(sizes.values()))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+
+        # Largest box first, each size resized from the previous one
+        for name, box in sorted(sizes.items(), key=lambda item: item[1], reverse=True):
+            image = image.copy()
+            image.thumbnail(box, Image.Resampling.LANCZOS)
+            for fmt in formats:
+                frame = image
+                if fmt == 'jpeg' and image.mode == 'RGBA':
+                    frame = Image.new('RGB', image.size, 'white')
+                    frame.paste(image, mask=image.getchannel('A'))
+                out = BytesIO()
+                frame.save(out, fmt.upper(), quality=quality)
+                results[name, fmt] = out.getvalue()
+    return results
+
+
+def store_thumbnails(name, rendered, storage=None):
+    """Write rendered derivatives of ``name``, replacing any earlier ones."""
+    storage = storage or default_storage
+    for (size, fmt), data in rendered.items():
+        target = thumbnail_name(name, size, fmt)
+        if storage.exists(target):
+            storage.delete(target)
+        storage.save(target, ContentFile(data))
+
+
+def get_pool(replace=None):
+    """The shared worker pool, started on first use or when ``replace`` is the broken current one."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool is replace:
+            # spawn rather than fork: forking a threaded server process can deadlock the child
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS, mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pool
+
+
+def _store_result(name, storage, future):
+    try:
+        store_thumbnails(name, future.result(), storage)
+    except Exception:
+        logger.exception("Could not generate thumbnails for %s", name)
+
+
+def generate_thumbnails(name, storage=None):
+    """
+    Render and store the derivatives of the stored image ``name``.
+
+    Rendering runs in a pool of ``THUMBNAIL_WORKERS`` processes and the
+    results are written from the parent when they're ready; the returned
+    future completes when rendering does. With ``THUMBNAIL_WORKERS = 0``
+    everything runs in the calling thread and ``None`` is returned.
+    """
+    storage = storage or default_storage
+    with storage.open(name) as f:
+        data = f.read()
+    args = (data, settings.THUMBNAIL_SIZES, settings.THUMBNAIL_FORMATS, settings.THUMBNAIL_QUALITY)
+    if not settings.THUMBNAIL_WORKERS:
+        try:
+            store_thumbnails(name, render_thumbnails(*args), storage)
+        except Exception:
+            logger.exception("Could not generate thumbnails for %s", name)
+        return None
+    pool = get_pool()
+    try:
+        future = pool.submit(render_thumbnails, *args)
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); start a fresh pool rather than failing every upload
+        future = get_pool(replace=pool).submit(render_thumbnails, *args)
+    future.add_done_callback(partial(_store_result, name, storage))
+    return future
+
+
+def thumbnail_urls(file, request=None):
+    """``{size: {format: url}}`` for an image field's derivatives, or ``None`` without an image."""
+    if not file:
+        return None
+    urls = {}
+    for size in settings.THUMBNAIL_SIZES:
+        urls[size] = {}
+        for fmt in settings.THUMBNAIL_FORMATS:
+            url = file.storage.url(thumbnail_name(file.name, size, fmt))
+            urls[size][fmt] = request.build_absolute_uri(url) if request is not None else url
+    return urls
+
+
+class ThumbnailsField(serializers.Field):
+    """Read-only serializer field listing the derivative URLs of an image field."""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return thumbnail_urls(value, self.context.get('request'))
+
+
+def register_thumbnails(model, field_name):
+    """
+    Generate derivatives whenever a new file is uploaded to ``model.field_name``.
+
+    Uploads are spotted before the save commits the file, and rendering is
+    queued once the surrounding transaction commits.
+    """
+    uid = f'thumbnails:{model._meta.label}.{field_name}'
+
+    def mark_upload(sender, instance, raw=False, update_fields=None, **kwargs):
+        file = getattr(instance, field_name)
+        if raw or (update_fields is not None and field_name not in update_fields):
+            return
+        if file and not file._committed:
+            instance.__dict__.setdefault('_thumbnail_uploads', set()).add(field_name)
+
+    def queue_thumbnails(sender, instance, **kwargs):
+        uploads = instance.__dict__.get('_thumbnail_uploads', set())
+        if field_name in uploads:
+            uploads.discard(field_name)
+            name = getattr(instance, field_name).name
+            transaction.on_commit(lambda: generate_thumbnails(name))
+
+    pre_save.connect(mark_upload, sender=model, weak=False, dispatch_uid=uid)
+    post_save.connect(queue_thumbnails, sender=model, weak=False, dispatch_uid=uid)
@@ -2,6 +2,7 @@ from django.urls import path
 from users.views import RegisterView, login
 from django.contrib import admin
 from django.urls import path, include
+from shoply.metrics import metrics_view
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
@@ -10,4 +11,5 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/products/', include('products.urls')),
     path('api/orders/', include('orders.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -1,3 +1,9 @@
 from django.contrib import admin
+from .models import OutboundEmail
 
 # Register your models here.
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to', 'status', 'attempts', 'next_attempt_at', 'claimed_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('to', 'dedupe_key')
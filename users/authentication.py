@@ -0,0 +1,243 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+# ✅ Claims copied into every token, enough for most views to skip loading the user
+USER_CLAIMS = ('username', 'is_staff', 'is_verified')
+# The refresh token's jti, carried by the access tokens made from it so logout can revoke them
+SESSION_CLAIM = 'session'
+
+
+class BlacklistCache:
+    """
+    Per-process copy of the JTIs of blacklisted tokens that haven't expired.
+
+    Lookups are answered from memory. Every ``JWT_BLACKLIST_SYNC_INTERVAL``
+    seconds one query fetches rows blacklisted since the last sync, and every
+    ``JWT_BLACKLIST_REBUILD_INTERVAL`` seconds the set is reloaded, which
+    drops expired tokens. Each sync reaches ``JWT_BLACKLIST_SYNC_OVERLAP``
+    seconds back, so a row that commits a little after it was stamped (or on
+    a server whose clock is behind) is still picked up. A token blacklisted
+    by another process is therefore honoured here within the sync interval;
+    ``add()`` records this process's own blacklisting at once.
+    """
+
+    def __init__(self):
+        self._jtis = {}  # jti -> expires_at
+        self._since = None  # Wall-clock time the last sync started
+        self._synced_at = self._built_at = None
+        self._lock = threading.Lock()
+
+    def _sync(self):
+        now = time.monotonic()
+        if self._synced_at is not None and now - self._synced_at < settings.JWT_BLACKLIST_SYNC_INTERVAL:
+            return
+        rebuild = self._built_at is None or now - self._built_at >= settings.JWT_BLACKLIST_REBUILD_INTERVAL
+        started = timezone.now()
+        rows = BlacklistedToken.objects.filter(token__expires_at__gt=started)
+        if rebuild:
+            self._jtis, self._built_at = {}, now
+        else:
+            rows = rows.filter(blacklisted_at__gte=self._since - timedelta(seconds=settings.JWT_BLACKLIST_SYNC_OVERLAP))
+        self._jtis.update(rows.values_list('token__jti', 'token__expires_at'))
+        self._since, self._synced_at = started, now
+
+    def __contains__(self, jti):
+        with self._lock:
+            self._sync()
+            return jti in self._jtis
+
+    def add(self, jti, expires_at):
+        with self._lock:
+            self._jtis[jti] = expires_at
+
+    def clear(self):
+        with self._lock:
+            self._jtis, self._since = {}, None
+            self._synced_at = self._built_at = None
+
+
+blacklist_cache = BlacklistCache()
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """
+    Refresh token carrying ``USER_CLAIMS`` and a session id, both copied into its access tokens.
+
+    Its blacklist check reads ``blacklist_cache`` instead of querying the
+    blacklist table on every refresh and logout.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token.set_user_claims(user)
+        token[SESSION_CLAIM] = token['jti']
+        return token
+
+    def set_user_claims(self, user):
+        for claim in USER_CLAIMS:
+            self[claim] = getattr(user, claim)
+
+    def check_blacklist(self):
+        if self.payload[api_settings.JTI_CLAIM] in blacklist_cache:
+            raise TokenError("Token is blacklisted")
+
+    def blacklist(self):
+        result = super().blacklist()
+        blacklist_cache.add(self.payload[api_settings.JTI_CLAIM], datetime_from_epoch(self.payload['exp']))
+        # Reject the access tokens of this session in this process straight away
+        revocation_cache.set(self.payload.get(SESSION_CLAIM, self.payload[api_settings.JTI_CLAIM]), True)
+        return result
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = ClaimsRefreshToken
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    ``TokenRefreshSerializer`` that stamps ``USER_CLAIMS`` from the user row
+    as it is now, not as it was at login, so a demoted or renamed user's
+    next access token reflects it.
+    """
+    token_class = ClaimsRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+
+        user = get_user_model().objects.filter(
+            **{api_settings.USER_ID_FIELD: refresh.payload.get(api_settings.USER_ID_CLAIM)}
+        ).first()
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+        refresh.set_user_claims(user)
+
+        if not api_settings.ROTATE_REFRESH_TOKENS:
+            return {'access': str(refresh.access_token)}
+
+        if api_settings.BLACKLIST_AFTER_ROTATION:
+            refresh.blacklist()
+        refresh.set_jti()
+        # The old session may have just been blacklisted, so mint the access token from the new one
+        refresh[SESSION_CLAIM] = refresh[api_settings.JTI_CLAIM]
+        refresh.set_exp()
+        refresh.set_iat()
+        refresh.outstand()
+        return {'access': str(refresh.access_token), 'refresh': str(refresh)}
+
+
+class ClaimsUser(TokenUser):
+    """
+    ``request.user`` built from token claims, without a database query.
+
+    ``id``, ``username``, ``is_staff`` and ``is_verified`` come from the token.
+    Any other attribute (``email``, ``check_password``...) loads the real
+    user once and is read from it; ``get_full_user()`` returns that model
+    instance for code that saves it or assigns it to a foreign key.
+    """
+
+    @property
+    def is_verified(self):
+        return self.token.get('is_verified', False)
+
+    def get_full_user(self):
+        if '_full_user' not in self.__dict__:
+            try:
+                self._full_user = get_user_model().objects.get(pk=self.pk)
+            except get_user_model().DoesNotExist:
+                raise AuthenticationFailed("User not found", code='user_not_found')
+        return self._full_user
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        if attr in self.token:
+            return self.token[attr]
+        return getattr(self.get_full_user(), attr)
+
+
+def get_full_user(user):
+    """The user model instance behind ``request.user``, loading it if it was built from claims."""
+    return user.get_full_user() if isinstance(user, ClaimsUser) else user
+
+
+class RevocationCache:
+    """
+    Thread-safe LRU of ``session -> revoked`` answers, each kept for
+    ``JWT_REVOCATION_CACHE_TTL`` seconds, at most ``JWT_REVOCATION_CACHE_SIZE``.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached answer, or ``None`` if there isn't a fresh one."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            revoked, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return revoked
+
+    def set(self, key, revoked):
+        with self._lock:
+            self._entries[key] = (revoked, time.monotonic() + settings.JWT_REVOCATION_CACHE_TTL)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.JWT_REVOCATION_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+revocation_cache = RevocationCache()
+
+
+def is_session_revoked(session):
+    """Whether the refresh token ``session`` was blacklisted, answered from the caches."""
+    revoked = revocation_cache.get(session)
+    if revoked is None:
+        revoked = session in blacklist_cache
+        revocation_cache.set(session, revoked)
+    return revoked
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    ``JWTAuthentication`` that returns a ``ClaimsUser`` instead of querying the user table.
+
+    Access tokens from a blacklisted refresh token (logout) are rejected; that
+    check is cached per process for ``JWT_REVOCATION_CACHE_TTL`` seconds, so
+    another process may keep accepting such a token for that long. Tokens
+    issued without the claims fall back to the usual database lookup.
+    """
+
+    def get_user(self, validated_token):
+        session = validated_token.get(SESSION_CLAIM)
+        required = (api_settings.USER_ID_CLAIM,) + USER_CLAIMS
+        if session is None or any(claim not in validated_token for claim in required):
+            return super().get_user(validated_token)
+        if is_session_revoked(session):
+            raise AuthenticationFailed("Token has been revoked", code='token_revoked')
+        return ClaimsUser(validated_token)
@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+def hasher_param(algorithm, name, default):
+    """One cost parameter from ``settings.PASSWORD_HASHER_PARAMS``, falling back to Django's default."""
+    return settings.PASSWORD_HASHER_PARAMS.get(algorithm, {}).get(name, default)
+
+
+# ✅ Same algorithm names as Django's hashers, so existing hashes keep verifying; a hash made
+# with other parameters reports must_update() and is rehashed by check_password() on login
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """PBKDF2-SHA256 with ``iterations`` from settings."""
+
+    @property
+    def iterations(self):
+        return hasher_param(self.algorithm, 'iterations', hashers.PBKDF2PasswordHasher.iterations)
+
+
+class ScryptPasswordHasher(hashers.ScryptPasswordHasher):
+    """scrypt with ``work_factor``, ``block_size`` and ``parallelism`` from settings."""
+
+    @property
+    def work_factor(self):
+        return hasher_param(self.algorithm, 'work_factor', hashers.ScryptPasswordHasher.work_factor)
+
+    @property
+    def block_size(self):
+        return hasher_param(self.algorithm, 'block_size', hashers.ScryptPasswordHasher.block_size)
+
+    @property
+    def parallelism(self):
+        return hasher_param(self.algorithm, 'parallelism', hashers.ScryptPasswordHasher.parallelism)
+
+    @property
+    def maxmem(self):
+        # scrypt needs 128 * n * r bytes; leave room above that instead of OpenSSL's 32 MiB cap
+        return 2 * self.memory_bytes
+
+    @property
+    def memory_bytes(self):
+        return 128 * self.work_factor * self.block_size
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    """Argon2id with ``time_cost``, ``memory_cost`` (KiB) and ``parallelism`` from settings; needs argon2-cffi."""
+
+    @property
+    def time_cost(self):
+        return hasher_param(self.algorithm, 'time_cost', hashers.Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return hasher_param(self.algorithm, 'memory_cost', hashers.Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return hasher_param(self.algorithm, 'parallelism', hashers.Argon2PasswordHasher.parallelism)
+
+    @property
+    def memory_bytes(self):
+        return self.memory_cost * 1024
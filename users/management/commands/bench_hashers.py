@@ -0,0 +1,55 @@
+import os
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Measure password hashes per second per core for each configured hasher."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--algorithm', action='append', choices=list(settings.PASSWORD_HASHER_PARAMS),
+                            help="Hasher to measure (repeatable); all configured ones by default.")
+        parser.add_argument('--seconds', type=float, default=2, help="How long to hash with each one.")
+        parser.add_argument('--cores', type=int, default=os.cpu_count(),
+                            help="Cores to size login capacity for.")
+
+    def handle(self, *args, **options):
+        rows = []
+        for algorithm in options['algorithm'] or settings.PASSWORD_HASHER_PARAMS:
+            hasher = get_hasher(algorithm)
+            try:
+                hasher.encode('warm-up', hasher.salt())
+            except ValueError as e:
+                # Library not installed (argon2-cffi)
+                self.stdout.write(self.style.WARNING(f"Skipping {algorithm}: {e}"))
+                continue
+
+            # ✅ One thread hashing flat out measures what a single core can do
+            count, started = 0, time.perf_counter()
+            deadline = started + options['seconds']
+            while time.perf_counter() < deadline or not count:
+                hasher.encode('correct horse battery staple', hasher.salt())
+                count += 1
+            rate = count / (time.perf_counter() - started)
+
+            params = ', '.join(f'{name}={value}' for name, value in settings.PASSWORD_HASHER_PARAMS[algorithm].items())
+            memory = getattr(hasher, 'memory_bytes', 0)
+            rows.append([
+                algorithm + (' *' if algorithm == settings.PASSWORD_HASHER else ''),
+                params,
+                f'{memory / 2 ** 20:.0f} MiB' if memory else '-',
+                f'{1000 / rate:.1f}',
+                f'{rate:.1f}',
+                f"{rate * options['cores']:.0f}",
+            ])
+
+        headers = ['hasher', 'parameters', 'memory', 'ms/hash', 'hashes/s/core', f"logins/s on {options['cores']} cores"]
+        widths = [max(len(str(row[i])) for row in [headers] + rows) for i in range(len(headers))]
+        for n, row in enumerate([headers] + rows):
+            self.stdout.write('  '.join(str(value).ljust(width) for value, width in zip(row, widths)).rstrip())
+            if n == 0:
+                self.stdout.write('  '.join('-' * width for width in widths))
+        self.stdout.write("* hashes new passwords (PASSWORD_HASHER)")
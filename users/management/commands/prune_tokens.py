@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+
+class Command(BaseCommand):
+    help = "Delete expired outstanding and blacklisted JWT refresh tokens in small batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Tokens deleted per transaction.")
+        parser.add_argument('--sleep', type=float, default=0, help="Seconds to pause between batches.")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        expired = OutstandingToken.objects.filter(expires_at__lte=now).order_by('pk')
+        outstanding = blacklisted = 0
+        while True:
+            # ✅ Each batch is its own short transaction, so no lock is held across the whole table
+            ids = list(expired.values_list('pk', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            # Blacklist entries go with their outstanding token (on_delete=CASCADE)
+            _, counts = OutstandingToken.objects.filter(pk__in=ids).delete()
+            outstanding += counts.get(OutstandingToken._meta.label, 0)
+            blacklisted += counts.get(BlacklistedToken._meta.label, 0)
+            if len(ids) < options['batch_size']:
+                break
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {outstanding} expired outstanding token(s) and {blacklisted} blacklisted token(s)."
+        ))
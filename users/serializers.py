@@ -2,6 +2,7 @@ from django.contrib.auth import get_user_model
 from rest_framework import serializers
 from django.contrib.auth.hashers import make_password
 from rest_framework_simplejwt.tokens import RefreshToken
+from shoply.thumbnails import ThumbnailsField
 
 User = get_user_model()
 
@@ -31,9 +32,11 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'email']
 
 class UserProfileSerializer(serializers.ModelSerializer):
+    thumbnails = ThumbnailsField(source='profile_image')
+
     class Meta:
         model = User
-        fields = ['id', 'username', 'email', 'profile_image']
+        fields = ['id', 'username', 'email', 'profile_image', 'thumbnails']
         read_only_fields = ['id', 'username']
 
 class PasswordResetRequestSerializer(serializers.Serializer):
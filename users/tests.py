@@ -1,4 +1,22 @@
 # users/tests.py
+import os
+import tempfile
+import time
+from datetime import timedelta
+from io import BytesIO
+from io import StringIO
+from smtplib import SMTPException
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.conf import settings
+from django.test import AsyncRequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from django.urls import reverse
 from rest_framework import status
 from django.contrib.auth import get_user_model
@@ -7,14 +25,24 @@ from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.template.loader import render_to_string
 from django.contrib.auth.tokens import default_token_generator
 from rest_framework.test import APITestCase, APIClient
-from .models import User  # Import đúng model
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from .authentication import ClaimsRefreshToken, ClaimsUser, blacklist_cache, get_full_user, revocation_cache
+from .models import OutboundEmail, User  # Import đúng model
+from .throttling import LocalThrottleBackend, get_throttle_backend, sliding_estimate
+from .utils import queue_email, send_verification_email
+from .views import AsyncPasswordResetRequestView, AsyncRegisterView
 from django.utils.encoding import force_bytes
+from PIL import Image
+from shoply.budgets import Budget, EndpointBudgetMixin
 
 User = get_user_model()
 
 class UserProfileTests(APITestCase):
 
     def setUp(self):
+        get_throttle_backend().clear()
         self.user = User.objects.create_user(
             username="testuser",
             email="testuser@example.com",
@@ -55,6 +83,22 @@ class UserProfileTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['email'], "updatedemail@example.com")
 
+    # ✅ Test a new profile image gets thumbnails listed in the profile
+    def test_profile_image_thumbnails(self):
+        image = BytesIO()
+        Image.new('RGB', (600, 600), 'navy').save(image, 'PNG')
+        upload = SimpleUploadedFile('me.png', image.getvalue(), content_type='image/png')
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media, THUMBNAIL_WORKERS=0):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.put(reverse('user-profile'), {
+                    "email": "testuser@example.com", "profile_image": upload,
+                }, format='multipart')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            small = response.data['thumbnails']['small']['webp']
+            self.assertIn('/media/thumbnails/profile_images/', small)
+            with Image.open(os.path.join(media, small.split('/media/', 1)[1])) as thumb:
+                self.assertEqual(thumb.size, (160, 160))
+
     # ✅ Test unauthorized access
     def test_unauthorized_access(self):
         self.client.credentials()  # Make sure to clear credentials for the unauthorized test
@@ -94,9 +138,333 @@ class UserProfileTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(response.data['error'], "Incorrect old password")
 
+class ClaimsAuthenticationTests(APITestCase):
+
+    def setUp(self):
+        get_throttle_backend().clear()
+        self.user = User.objects.create_user(
+            username="claimsuser", email="claims@example.com", password="testpassword",
+            is_verified=True, is_staff=True,
+        )
+        revocation_cache.clear()
+        blacklist_cache.clear()
+        response = self.client.post(reverse('login'), {"username": "claimsuser", "password": "testpassword"})
+        self.tokens = response.data
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}")
+
+    # ✅ Test an authenticated read doesn't query the user table
+    def test_request_user_comes_from_claims(self):
+        self.client.get(reverse('order-list'))  # warm the revocation cache
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('order-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([q for q in ctx.captured_queries if 'users_user' in q['sql']])
+
+        request = response.wsgi_request
+        self.assertIsInstance(request.user, ClaimsUser)
+        self.assertEqual((request.user.pk, request.user.username, request.user.is_staff, request.user.is_verified),
+                         (self.user.pk, "claimsuser", True, True))
+        # Anything else loads the real user
+        self.assertEqual(request.user.email, "claims@example.com")
+        self.assertEqual(get_full_user(request.user), self.user)
+
+    def test_token_endpoint_issues_claims(self):
+        response = self.client.post(reverse('token_obtain_pair'), {"username": "claimsuser", "password": "testpassword"})
+        refreshed = self.client.post(reverse('token_refresh'), {"refresh": response.data['refresh']})
+        token = AccessToken(refreshed.data['access'])
+        self.assertEqual((token['username'], token['is_staff']), ("claimsuser", True))
+        self.assertEqual(token['session'], RefreshToken(response.data['refresh'])['jti'])
+
+    # ✅ Test a refresh takes the claims from the user as they are now, not as they were at login
+    def test_refresh_restamps_claims_after_demotion(self):
+        export_url = reverse('order-export', kwargs={'resource': 'orders', 'fmt': 'csv'})
+        self.assertEqual(self.client.get(export_url).status_code, status.HTTP_200_OK)
+
+        User.objects.filter(pk=self.user.pk).update(is_staff=False, username="demoted")
+        refreshed = self.client.post(reverse('token_refresh'), {"refresh": self.tokens['refresh']})
+        token = AccessToken(refreshed.data['access'])
+        self.assertEqual((token['username'], token['is_staff']), ("demoted", False))
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refreshed.data['access']}")
+        self.assertEqual(self.client.get(export_url).status_code, status.HTTP_403_FORBIDDEN)
+
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.client.post(reverse('token_refresh'), {"refresh": self.tokens['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    # ✅ Test a rotated refresh token starts a session its access tokens aren't revoked with
+    def test_rotated_refresh_starts_a_new_session(self):
+        with mock.patch.multiple(jwt_settings, ROTATE_REFRESH_TOKENS=True, BLACKLIST_AFTER_ROTATION=True):
+            refreshed = self.client.post(reverse('token_refresh'), {"refresh": self.tokens['refresh']})
+        self.assertEqual(refreshed.status_code, status.HTTP_200_OK)
+        rotated = RefreshToken(refreshed.data['refresh'])
+        self.assertEqual(rotated['session'], rotated['jti'])
+        self.assertEqual(AccessToken(refreshed.data['access'])['session'], rotated['jti'])
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refreshed.data['access']}")
+        self.assertEqual(self.client.get(reverse('order-list')).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.post(reverse('token_refresh'), {"refresh": self.tokens['refresh']}).status_code,
+                         status.HTTP_401_UNAUTHORIZED)
+
+    def test_tokens_without_claims_fall_back_to_database(self):
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        response = self.client.get(reverse('user-profile'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsInstance(response.wsgi_request.user, User)
+
+    # ✅ Test logout revokes the access token here at once and elsewhere after the cache TTL
+    def test_logout_revokes_access_token(self):
+        self.assertEqual(self.client.get(reverse('order-list')).status_code, status.HTTP_200_OK)
+        response = self.client.post(reverse('logout'), {"refresh": self.tokens['refresh']})
+        self.assertEqual(response.status_code, status.HTTP_205_RESET_CONTENT)
+        self.assertEqual(self.client.get(reverse('order-list')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        # Another process still has "not revoked" cached until the entry expires
+        self.client.credentials()
+        login = self.client.post(reverse('login'), {"username": "claimsuser", "password": "testpassword"})
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {login.data['access']}")
+        self.assertEqual(self.client.get(reverse('order-list')).status_code, status.HTTP_200_OK)
+        RefreshToken(login.data['refresh']).blacklist()
+        self.assertEqual(self.client.get(reverse('order-list')).status_code, status.HTTP_200_OK)
+        revocation_cache.clear()
+        blacklist_cache.clear()
+        self.assertEqual(self.client.get(reverse('order-list')).status_code, status.HTTP_401_UNAUTHORIZED)
+
+class TokenBlacklistTests(APITestCase):
+
+    def setUp(self):
+        get_throttle_backend().clear()
+        self.user = User.objects.create_user(
+            username="tokenuser", email="token@example.com", password="testpassword", is_verified=True,
+        )
+        revocation_cache.clear()
+        blacklist_cache.clear()
+
+    def login(self):
+        return self.client.post(reverse('login'), {"username": "tokenuser", "password": "testpassword"}).data
+
+    # ✅ Test refreshes are checked against the in-memory blacklist, not the table
+    def test_refresh_skips_blacklist_query(self):
+        refresh = self.login()['refresh']
+        self.client.post(reverse('token_refresh'), {"refresh": refresh})  # first sync
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('token_refresh'), {"refresh": refresh})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([q for q in ctx.captured_queries if 'token_blacklist_blacklistedtoken' in q['sql']])
+
+    def test_logged_out_token_cannot_refresh(self):
+        tokens = self.login()
+        refresh = tokens['refresh']
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        self.assertEqual(self.client.post(reverse('logout'), {"refresh": refresh}).status_code,
+                         status.HTTP_205_RESET_CONTENT)
+        self.client.credentials()
+        response = self.client.post(reverse('token_refresh'), {"refresh": refresh})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.post(reverse('logout'), {"refresh": refresh}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+    def test_blacklisting_elsewhere_is_seen_after_sync(self):
+        refresh = self.login()['refresh']
+        self.client.post(reverse('token_refresh'), {"refresh": refresh})
+        RefreshToken(refresh).blacklist()  # as another process would
+        self.assertEqual(self.client.post(reverse('token_refresh'), {"refresh": refresh}).status_code,
+                         status.HTTP_200_OK)
+        with override_settings(JWT_BLACKLIST_SYNC_INTERVAL=0):
+            self.assertEqual(self.client.post(reverse('token_refresh'), {"refresh": refresh}).status_code,
+                             status.HTTP_401_UNAUTHORIZED)
+
+    # ✅ Test a blacklist row committed after a later one, out of pk order, is still picked up
+    @override_settings(JWT_BLACKLIST_SYNC_INTERVAL=0)
+    def test_blacklist_rows_committed_out_of_order_are_synced(self):
+        first, late, last = (RefreshToken(self.login()['refresh']) for _ in range(3))
+        first.blacklist()
+        BlacklistedToken.objects.create(pk=BlacklistedToken.objects.get().pk + 10,
+                                        token=OutstandingToken.objects.get(jti=last['jti']))
+        self.assertIn(last['jti'], blacklist_cache)
+
+        # Stamped before the last sync ran, committed after it
+        entry = BlacklistedToken.objects.create(pk=BlacklistedToken.objects.get(token__jti=first['jti']).pk + 1,
+                                                token=OutstandingToken.objects.get(jti=late['jti']))
+        BlacklistedToken.objects.filter(pk=entry.pk).update(blacklisted_at=timezone.now() - timedelta(seconds=5))
+        self.assertIn(late['jti'], blacklist_cache)
+
+    def test_prune_tokens_deletes_expired_in_batches(self):
+        live = RefreshToken(self.login()['refresh'])
+        live.blacklist()
+        expired = []
+        for _ in range(3):
+            token = RefreshToken(self.login()['refresh'])
+            token.blacklist()
+            expired.append(token['jti'])
+        OutstandingToken.objects.filter(jti__in=expired).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        out = StringIO()
+        with CaptureQueriesContext(connection) as ctx:
+            call_command('prune_tokens', '--batch-size', '2', stdout=out)
+        self.assertIn("Deleted 3 expired outstanding token(s) and 3 blacklisted", out.getvalue())
+        self.assertEqual(len([q for q in ctx.captured_queries
+                              if q['sql'].startswith('DELETE FROM "token_blacklist_outstandingtoken"')]), 2)
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), [live['jti']])
+        self.assertEqual(BlacklistedToken.objects.count(), 1)
+
+FAST_HASHERS = {
+    'pbkdf2_sha256': {'iterations': 1000},
+    'scrypt': {'work_factor': 2 ** 4, 'block_size': 8, 'parallelism': 1},
+}
+
+@override_settings(PASSWORD_HASHER_PARAMS=FAST_HASHERS)
+class PasswordHasherTests(APITestCase):
+
+    def setUp(self):
+        get_throttle_backend().clear()
+        self.user = User.objects.create_user(
+            username="hashuser", email="hash@example.com", password="testpassword", is_verified=True,
+        )
+
+    def login(self):
+        response = self.client.post(reverse('login'), {"username": "hashuser", "password": "testpassword"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        return self.user.password
+
+    def test_new_hashes_use_configured_parameters(self):
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$1000$'))
+
+    # ✅ Test login rehashes with new parameters, and with a new algorithm
+    def test_login_upgrades_stored_hash(self):
+        with override_settings(PASSWORD_HASHER_PARAMS={**FAST_HASHERS, 'pbkdf2_sha256': {'iterations': 2000}}):
+            self.assertTrue(self.login().startswith('pbkdf2_sha256$2000$'))
+
+        hashers = list(settings.PASSWORD_HASHERS)
+        hashers.insert(0, hashers.pop(hashers.index('users.hashers.ScryptPasswordHasher')))
+        with override_settings(PASSWORD_HASHERS=hashers):
+            self.assertTrue(self.login().startswith('scrypt$16$'))
+            self.assertEqual(self.login(), self.user.password)  # already current, left alone
+
+    def test_bench_hashers_command(self):
+        out = StringIO()
+        call_command('bench_hashers', '--algorithm', 'scrypt', '--seconds', '0.01', '--cores', '4', stdout=out)
+        self.assertIn('work_factor=16', out.getvalue())
+        self.assertIn('logins/s on 4 cores', out.getvalue())
+
+THROTTLE_RATES = {
+    'login_ip': '5/min', 'login_username': '3/min',
+    'register_ip': '2/hour', 'register_email': '1/hour',
+    'password_reset_ip': '5/hour', 'password_reset_email': '1/hour',
+}
+
+class AuthThrottleTests(APITestCase):
+
+    def setUp(self):
+        get_throttle_backend().clear()
+        override = override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': THROTTLE_RATES})
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create_user(
+            username="throttled", email="throttled@example.com", password="testpassword", is_verified=True,
+        )
+
+    def login(self, username, ip='10.0.0.1', url='login'):
+        return self.client.post(reverse(url), {"username": username, "password": "wrong"}, REMOTE_ADDR=ip)
+
+    # ✅ Test a throttled login is refused before any password is hashed
+    def test_login_throttled_by_username_before_authenticate(self):
+        for n in range(3):
+            self.assertEqual(self.login("throttled", ip=f'10.0.1.{n}').status_code, status.HTTP_400_BAD_REQUEST)
+        with mock.patch('users.views.authenticate') as authenticate:
+            response = self.login("THROTTLED ", ip='10.0.2.1')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+        authenticate.assert_not_called()
+        # Other accounts are unaffected
+        self.assertEqual(self.login("someone-else", ip='10.0.2.1').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_login_and_token_endpoints_share_ip_limit(self):
+        for n in range(5):
+            url = 'login' if n % 2 else 'token_obtain_pair'
+            self.assertNotEqual(self.login(f"user{n}", url=url).status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(self.login("user9", url='token_obtain_pair').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertNotEqual(self.login("user9", ip='10.0.0.2').status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    # ✅ Test a client can't dodge the IP limit by rotating X-Forwarded-For
+    def test_forwarded_for_header_is_not_trusted_without_proxies(self):
+        for n in range(5):
+            response = self.client.post(reverse('login'), {"username": f"user{n}", "password": "wrong"},
+                                        REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR=f'203.0.113.{n}')
+            self.assertNotEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        response = self.client.post(reverse('login'), {"username": "user9", "password": "wrong"},
+                                    REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='203.0.113.99')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        # Behind one proxy the address it appended is the client's
+        with override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': THROTTLE_RATES,
+                                               'NUM_PROXIES': 1}):
+            response = self.client.post(reverse('login'), {"username": "user9", "password": "wrong"},
+                                        REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='spoofed, 203.0.113.99')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_register_and_password_reset_throttled_by_email(self):
+        data = {"username": "newbie", "email": "newbie@example.com", "password": "Secret123!"}
+        self.assertEqual(self.client.post(reverse('register'), data).status_code, status.HTTP_201_CREATED)
+        response = self.client.post(reverse('register'), {**data, "username": "newbie2"}, REMOTE_ADDR='10.0.0.9')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        reset = {"email": "throttled@example.com"}
+        self.client.force_authenticate(user=self.user)  # the view keeps the default IsAuthenticated
+        self.assertEqual(self.client.post(reverse('password_reset'), reset).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.post(reverse('password_reset'), reset).status_code,
+                         status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(OutboundEmail.objects.filter(dedupe_key__startswith='password-reset:').count(), 1)
+
+    @override_settings(THROTTLE_BACKEND='users.throttling.CacheThrottleBackend')
+    def test_cache_backend(self):
+        get_throttle_backend().clear()
+        for _ in range(3):
+            self.login("throttled")
+        self.assertEqual(self.login("throttled").status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        # Clearing the counters leaves every other cache alone
+        caches['default'].set('unrelated', 1)
+        get_throttle_backend().clear()
+        self.assertEqual(caches['default'].get('unrelated'), 1)
+        self.assertNotEqual(self.login("throttled").status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_sliding_window_weights_previous_window(self):
+        self.assertEqual(sliding_estimate(10, 2, 60, now=6015), 2 + 10 * 0.75)
+        backend = LocalThrottleBackend()
+        with mock.patch('users.throttling.time.time', return_value=6000.0):
+            for _ in range(4):
+                backend.hit('key', 60)
+        with mock.patch('users.throttling.time.time', return_value=6090.0):
+            self.assertEqual(backend.hit('key', 60), 1 + 4 * 0.5)
+        with mock.patch('users.throttling.time.time', return_value=6200.0):
+            self.assertEqual(backend.hit('key', 60), 1)
+
+    # ✅ Test a flood of distinct keys keeps the counters capped without slowing each hit down
+    @override_settings(THROTTLE_LOCAL_MAX_KEYS=20000)
+    def test_local_backend_evicts_in_constant_time(self):
+        backend = LocalThrottleBackend()
+        with mock.patch('users.throttling.time.time', return_value=6000.0):
+            backend.hit('stale', 60)
+        with mock.patch('users.throttling.time.time', return_value=6130.0):
+            backend.hit('key', 60)
+            self.assertNotIn('stale', backend._counters)
+
+            started = time.perf_counter()
+            for n in range(60000):
+                backend.hit(f'spray:{n}', 60)
+            per_hit = (time.perf_counter() - started) / 60000
+            self.assertEqual(len(backend._counters), 20000)
+            # Rebuilding the dict on every hit past the cap took milliseconds each
+            self.assertLess(per_hit, 0.0001)
+            self.assertNotIn('key', backend._counters)
+            self.assertEqual(backend.hit('spray:59999', 60), 2)
+
 class PasswordResetTests(APITestCase):
 
     def setUp(self):
+        get_throttle_backend().clear()
         # Create test user
         self.user = User.objects.create_user(
             username='testuser',
@@ -135,6 +503,7 @@ class PasswordResetTests(APITestCase):
         response = self.client.post(self.password_reset_url, data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn("Email đặt lại mật khẩu đã được gửi.", str(response.data))
+        self.assertTrue(OutboundEmail.objects.filter(to="testuser@example.com", dedupe_key=f"password-reset:{self.user.pk}").exists())
 
     # ✅ Test sending password reset request with invalid email
     def test_request_password_reset_invalid_email(self):
@@ -185,6 +554,7 @@ class PasswordResetTests(APITestCase):
 class EmailVerificationTests(APITestCase):
 
     def setUp(self):
+        get_throttle_backend().clear()
         self.email = 'testuser@example.com'
         self.username = 'testuser'
         self.password = 'testpassword123!'
@@ -209,6 +579,10 @@ class EmailVerificationTests(APITestCase):
             "password": self.password
         })
         
+        # Email được xếp hàng, worker mới gửi đi
+        self.assertEqual(len(mail.outbox), 0)
+        call_command('send_queued_email', stdout=StringIO())
+
         # Kiểm tra đã gửi đúng 1 email
         self.assertEqual(len(mail.outbox), 1)
         verification_email = mail.outbox[0]
@@ -263,3 +637,192 @@ class EmailVerificationTests(APITestCase):
         # Gửi yêu cầu GET
         response = self.client.get(verify_url)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, response.content)
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise SMTPException("Mail server unavailable")
+
+class RecordingEmailBackend(BaseEmailBackend):
+    """Records the open transactions and the stored status of each message as it is sent."""
+    sends = []
+
+    def send_messages(self, email_messages):
+        for message in email_messages:
+            stored = OutboundEmail.objects.get(to=message.to[0])
+            self.sends.append((len(connection.atomic_blocks), stored.status))
+        return len(email_messages)
+
+class OutboundEmailQueueTests(APITestCase):
+
+    def setUp(self):
+        get_throttle_backend().clear()
+        self.user = User.objects.create_user(username='queued', email='queued@example.com', password='Password123!')
+
+    def send_queued(self):
+        call_command('send_queued_email', stdout=StringIO())
+
+    # ✅ Test registering queues one verification email with a working link
+    def test_register_queues_single_verification_email(self):
+        response = self.client.post(reverse('register'), {
+            "username": "newuser",
+            "email": "newuser@example.com",
+            "password": "Password123!"
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, response.data)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboundEmail.objects.filter(to="newuser@example.com").count(), 1)
+
+        self.send_queued()
+        sent = [message for message in mail.outbox if message.to == ["newuser@example.com"]]
+        self.assertEqual(len(sent), 1)
+        self.assertIn('/api/users/verify-email/', sent[0].body)
+        self.assertEqual(OutboundEmail.objects.get(to="newuser@example.com").status, OutboundEmail.SENT)
+
+    # ✅ Test queueing the same message twice while pending keeps one copy
+    def test_pending_duplicates_are_collapsed(self):
+        first = OutboundEmail.objects.get(to=self.user.email)
+        self.assertEqual(send_verification_email(self.user).pk, first.pk)
+        self.assertEqual(OutboundEmail.objects.count(), 1)
+
+        self.send_queued()
+        self.assertNotEqual(send_verification_email(self.user).pk, first.pk)
+
+    # ✅ Test a message being sent still collapses duplicates, and one sent meanwhile is returned
+    def test_duplicates_of_claimed_and_just_sent_messages(self):
+        first = OutboundEmail.objects.get(to=self.user.email)
+        OutboundEmail.objects.filter(pk=first.pk).update(status=OutboundEmail.SENDING)
+        self.assertEqual(send_verification_email(self.user).pk, first.pk)
+
+        OutboundEmail.objects.filter(pk=first.pk).update(status=OutboundEmail.SENT)
+        with mock.patch.object(OutboundEmail.objects, 'create', side_effect=IntegrityError):
+            self.assertEqual(queue_email('Subject', 'Body', self.user.email, dedupe_key=first.dedupe_key).pk, first.pk)
+
+    # ✅ Test messages are sent after the claim has committed, outside any transaction
+    @override_settings(EMAIL_BACKEND='users.tests.RecordingEmailBackend')
+    def test_sends_outside_the_claim_transaction(self):
+        RecordingEmailBackend.sends = []
+        depth = len(connection.atomic_blocks)
+        self.send_queued()
+        self.assertEqual(RecordingEmailBackend.sends, [(depth, OutboundEmail.SENDING)])
+        email = OutboundEmail.objects.get(to=self.user.email)
+        self.assertEqual(email.status, OutboundEmail.SENT)
+        self.assertIsNotNone(email.claimed_at)
+
+    # ✅ Test messages left sending by a dead worker are claimed again after the timeout
+    def test_stale_claims_are_retried(self):
+        email = OutboundEmail.objects.get(to=self.user.email)
+        OutboundEmail.objects.filter(pk=email.pk).update(status=OutboundEmail.SENDING, claimed_at=timezone.now())
+        self.send_queued()
+        self.assertEqual(len(mail.outbox), 0)
+
+        OutboundEmail.objects.filter(pk=email.pk).update(
+            claimed_at=timezone.now() - timedelta(seconds=settings.EMAIL_QUEUE_CLAIM_TIMEOUT + 1),
+        )
+        self.send_queued()
+        self.assertEqual(len(mail.outbox), 1)
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboundEmail.SENT)
+
+    # ✅ Test failed sends are retried with growing delays, then given up on
+    @override_settings(EMAIL_BACKEND='users.tests.FailingEmailBackend', EMAIL_QUEUE_MAX_ATTEMPTS=3)
+    def test_failed_send_backs_off(self):
+        email = OutboundEmail.objects.get(to=self.user.email)
+        delays = []
+        for _ in range(3):
+            before = timezone.now()
+            self.send_queued()
+            email.refresh_from_db()
+            delays.append(email.next_attempt_at - before)
+            OutboundEmail.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+
+        email.refresh_from_db()
+        self.assertEqual(email.attempts, 3)
+        self.assertEqual(email.status, OutboundEmail.FAILED)
+        self.assertIn("Mail server unavailable", email.last_error)
+        self.assertGreater(delays[0], timedelta(seconds=59))
+        self.assertGreater(delays[1], timedelta(seconds=119))
+        self.assertEqual(len(mail.outbox), 0)
+
+
+# ✅ Query and latency budgets for every users endpoint (see shoply.budgets)
+@override_settings(PASSWORD_HASHER_PARAMS=FAST_HASHERS)
+class UserEndpointBudgetTests(EndpointBudgetMixin, APITestCase):
+    urlconf = 'users.urls'
+    snapshot_file = os.path.join(os.path.dirname(__file__), 'query_budgets.json')
+    budgets = [
+        Budget('register', 'post', queries=6, ms=200, status=201,
+               data={'username': 'budgetnew', 'email': 'budgetnew@example.com', 'password': 'Budget#Pass1'}),
+        Budget('login', 'post', queries=2, ms=200, data={'username': 'budgetuser', 'password': 'Budget#Pass1'}),
+        Budget('logout', 'post', queries=6, ms=100, status=205, user='user', data=lambda t: {'refresh': t.refresh}),
+        Budget('token_obtain_pair', 'post', queries=2, ms=200,
+               data={'username': 'budgetuser', 'password': 'Budget#Pass1'}),
+        Budget('token_refresh', 'post', queries=1, ms=100, data=lambda t: {'refresh': t.refresh}),
+        Budget('user-profile', queries=1, ms=100, user='user'),
+        Budget('user-profile', 'patch', queries=3, ms=200, user='user', data={'email': 'budget-renamed@example.com'}),
+        Budget('user-change-password', 'put', queries=2, ms=200, user='user',
+               data={'old_password': 'Budget#Pass1', 'new_password': 'Budget#Pass2'}),
+        Budget('password_reset', 'post', queries=5, ms=100, user='user', data={'email': 'budgetuser@example.com'}),
+        Budget('password_reset_confirm', 'post', queries=2, ms=200, user='user',
+               kwargs=lambda t: {'token': default_token_generator.make_token(t.user)},
+               data={'email': 'budgetuser@example.com', 'new_password': 'Budget#Pass2'}),
+        Budget('verify_email', queries=2, ms=100, kwargs=lambda t: {
+            'uidb64': urlsafe_base64_encode(force_bytes(t.unverified.pk)),
+            'token': default_token_generator.make_token(t.unverified),
+        }),
+    ]
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='budgetuser', email='budgetuser@example.com',
+                                             password='Budget#Pass1', is_verified=True, is_active=True)
+        self.unverified = User.objects.create_user(username='budgetpending', email='budgetpending@example.com',
+                                                   password='Budget#Pass1')
+        self.refresh = str(ClaimsRefreshToken.for_user(self.user))
+
+
+# ✅ The async registration and password reset views served under ASGI (settings.ASYNC_VIEWS)
+@override_settings(PASSWORD_HASHER_PARAMS=FAST_HASHERS)
+class AsyncUserViewTests(APITestCase):
+
+    def setUp(self):
+        get_throttle_backend().clear()
+        self.user = User.objects.create_user(username='asyncuser', email='asyncuser@example.com',
+                                             password='Async#Pass1', is_verified=True, is_active=True)
+        self.token = str(ClaimsRefreshToken.for_user(self.user).access_token)
+
+    async def post(self, view, url, data, authenticated=False):
+        headers = {'Authorization': f'Bearer {self.token}'} if authenticated else {}
+        request = AsyncRequestFactory().post(url, data, content_type='application/json', headers=headers)
+        return await view.as_view()(request)
+
+    async def test_register(self):
+        data = {'username': 'asyncnew', 'email': 'asyncnew@example.com', 'password': 'Async#Pass1'}
+        response = await self.post(AsyncRegisterView, reverse('register'), data)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        user = await User.objects.aget(username='asyncnew')
+        self.assertTrue(await sync_to_async(user.check_password)('Async#Pass1'))
+        self.assertTrue(await OutboundEmail.objects.filter(to='asyncnew@example.com').aexists())
+
+        response = await self.post(AsyncRegisterView, reverse('register'), data)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('username', response.data)
+
+    async def test_password_reset(self):
+        response = await self.post(AsyncPasswordResetRequestView, reverse('password_reset'),
+                                   {'email': 'asyncuser@example.com'}, authenticated=True)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(await OutboundEmail.objects.filter(dedupe_key=f'password-reset:{self.user.pk}').aexists())
+
+        response = await self.post(AsyncPasswordResetRequestView, reverse('password_reset'),
+                                   {'email': 'nobody@example.com'}, authenticated=True)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("Email không tồn tại trong hệ thống.", str(response.data))
+
+    # ✅ Test throttles still apply before the async handler runs
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {
+        **settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'], 'register_ip': '1/hour'}})
+    async def test_register_is_throttled(self):
+        data = {'username': 'asyncthrottled', 'email': 'asyncthrottled@example.com', 'password': 'Async#Pass1'}
+        self.assertEqual((await self.post(AsyncRegisterView, reverse('register'), data)).status_code, status.HTTP_201_CREATED)
+        response = await self.post(AsyncRegisterView, reverse('register'), {**data, 'username': 'asyncthrottled2'})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
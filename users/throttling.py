@@ -0,0 +1,165 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """``'10/min'`` -> ``(10, 60)``, like DRF's ``SimpleRateThrottle``."""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+def sliding_estimate(previous, current, window, now):
+    """Weighted count over the last ``window`` seconds from two fixed-window counters."""
+    elapsed = (now % window) / window
+    return previous * (1 - elapsed) + current
+
+
+class LocalThrottleBackend:
+    """
+    Sliding-window counters held in this process.
+
+    Each key keeps only the counts of its current and previous fixed window,
+    and keys are kept in the order they were last hit. Every hit drops the
+    stale keys at the old end, and the oldest live ones once there are more
+    than ``THROTTLE_LOCAL_MAX_KEYS``, so each hit costs the same however many
+    keys there are. Limits apply per process; use ``CacheThrottleBackend`` to
+    share them between processes.
+    """
+
+    def __init__(self):
+        self._counters = OrderedDict()  # key -> (window, window index, previous count, current count)
+        self._lock = threading.Lock()
+
+    def hit(self, key, window):
+        now = time.time()
+        index = int(now // window)
+        with self._lock:
+            _, start, previous, current = self._counters.get(key, (window, index, 0, 0))
+            if start != index:
+                previous, current = (current if start == index - 1 else 0), 0
+            current += 1
+            self._counters[key] = (window, index, previous, current)
+            self._counters.move_to_end(key)
+            self._evict(now)
+        return sliding_estimate(previous, current, window, now)
+
+    def _evict(self, now):
+        # Each key is popped at most once after being hit, so this is constant time per hit on average
+        while self._counters:
+            oldest_window, oldest_index = next(iter(self._counters.values()))[:2]
+            # Keys untouched for two windows count nothing any more
+            stale = oldest_index < int(now // oldest_window) - 1
+            if not stale and len(self._counters) <= settings.THROTTLE_LOCAL_MAX_KEYS:
+                break
+            self._counters.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+
+
+class CacheThrottleBackend:
+    """Sliding-window counters in the ``THROTTLE_CACHE_ALIAS`` cache, shared by every process using it."""
+
+    def hit(self, key, window):
+        cache = caches[settings.THROTTLE_CACHE_ALIAS]
+        now = time.time()
+        index = int(now // window)
+        current_key = f'{key}:{index}'
+        # add() + incr() is atomic on Redis and memcached
+        cache.add(current_key, 0, timeout=window * 2)
+        try:
+            current = cache.incr(current_key)
+        except ValueError:  # expired between add() and incr()
+            cache.set(current_key, 1, timeout=window * 2)
+            current = 1
+        previous = cache.get(f'{key}:{index - 1}', 0)
+        return sliding_estimate(previous, current, window, now)
+
+    def clear(self):
+        # THROTTLE_CACHE_ALIAS holds nothing but these counters
+        caches[settings.THROTTLE_CACHE_ALIAS].clear()
+
+
+_backend = None
+
+
+def get_throttle_backend():
+    """The backend named by ``settings.THROTTLE_BACKEND``, created once per process."""
+    global _backend
+    path = settings.THROTTLE_BACKEND
+    if _backend is None or _backend.path != path:
+        _backend = import_string(path)()
+        _backend.path = path
+    return _backend
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """
+    Throttle by client IP, or by a request field when ``identity_field`` is set.
+
+    The limit for ``scope`` comes from ``DEFAULT_THROTTLE_RATES`` as for DRF's
+    own throttles. Every attempt counts, rejected ones included, so a client
+    that keeps hammering stays blocked. DRF checks throttles before the view
+    runs, so a throttled login never reaches ``authenticate()``.
+    """
+    scope = None
+    identity_field = None
+
+    def get_identity(self, request):
+        if self.identity_field is None:
+            return self.get_ident(request)
+        value = request.data.get(self.identity_field) if hasattr(request.data, 'get') else None
+        if not value:
+            return None
+        # Hash so any submitted value makes a short, safe cache key
+        return hashlib.sha256(str(value).strip().lower().encode()).hexdigest()
+
+    def allow_request(self, request, view):
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+        identity = self.get_identity(request)
+        if rate is None or identity is None:
+            return True
+        limit, self.window = parse_rate(rate)
+        count = get_throttle_backend().hit(f'throttle:{self.scope}:{identity}', self.window)
+        return count <= limit
+
+    def wait(self):
+        # The estimate only drops as the current window ages, so retry once it ends
+        return self.window - time.time() % self.window
+
+
+class LoginIPThrottle(SlidingWindowThrottle):
+    scope = 'login_ip'
+
+class LoginUsernameThrottle(SlidingWindowThrottle):
+    scope = 'login_username'
+    identity_field = 'username'
+
+class RegisterIPThrottle(SlidingWindowThrottle):
+    scope = 'register_ip'
+
+class RegisterEmailThrottle(SlidingWindowThrottle):
+    scope = 'register_email'
+    identity_field = 'email'
+
+class PasswordResetIPThrottle(SlidingWindowThrottle):
+    scope = 'password_reset_ip'
+
+class PasswordResetEmailThrottle(SlidingWindowThrottle):
+    scope = 'password_reset_email'
+    identity_field = 'email'
+
+LOGIN_THROTTLES = [LoginIPThrottle, LoginUsernameThrottle]
+REGISTER_THROTTLES = [RegisterIPThrottle, RegisterEmailThrottle]
+PASSWORD_RESET_THROTTLES = [PasswordResetIPThrottle, PasswordResetEmailThrottle]
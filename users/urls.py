@@ -1,18 +1,25 @@
 # users/urls.py
+from django.conf import settings
 from django.urls import path
 from .views import RegisterView, login_view, logout, UserProfileView, \
-     ChangePasswordView, PasswordResetRequestView, PasswordResetConfirmView, VerifyEmailView
+     ChangePasswordView, PasswordResetRequestView, PasswordResetConfirmView, VerifyEmailView, \
+     AsyncRegisterView, AsyncPasswordResetRequestView
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from .throttling import LOGIN_THROTTLES
+
+# ✅ Async variants when served over ASGI (settings.ASYNC_VIEWS)
+register_view = (AsyncRegisterView if settings.ASYNC_VIEWS else RegisterView).as_view()
+password_reset_view = (AsyncPasswordResetRequestView if settings.ASYNC_VIEWS else PasswordResetRequestView).as_view()
 
 urlpatterns = [
-    path('register/', RegisterView.as_view(), name='register'),
+    path('register/', register_view, name='register'),
     path('login/', login_view, name='login'),
     path('logout/', logout, name='logout'),
-    path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('token/', TokenObtainPairView.as_view(throttle_classes=LOGIN_THROTTLES), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('profile/', UserProfileView.as_view(), name='user-profile'),
     path('change-password/', ChangePasswordView.as_view(), name='user-change-password'),
-    path('password-reset/', PasswordResetRequestView.as_view(), name='password_reset'),
+    path('password-reset/', password_reset_view, name='password_reset'),
     path('password-reset/confirm/<str:token>/', PasswordResetConfirmView.as_view(), name='password_reset_confirm'),
     path('verify-email/<str:uidb64>/<str:token>/', VerifyEmailView.as_view(), name='verify_email'),
 ]
@@ -1,13 +1,135 @@
 # users/utils.py
-from django.core.mail import send_mail  # Add this import
+import time
+from datetime import timedelta
 from django.conf import settings
+from django.contrib.auth.tokens import default_token_generator
+from django.core.mail import EmailMessage, get_connection
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from shoply.metrics import EMAIL_SEND_SECONDS
+from .models import OutboundEmail
+
+def queue_email(subject, body, to, from_email=None, dedupe_key=None):
+    """
+    Store an email for the ``send_queued_email`` worker instead of sending it now.
+
+    While a message with the same ``dedupe_key`` is still waiting to be sent,
+    queueing it again returns that one, so a message triggered from two
+    places goes out once.
+    """
+    try:
+        with transaction.atomic():
+            return OutboundEmail.objects.create(
+                subject=subject,
+                body=body,
+                to=to,
+                from_email=from_email or '',
+                dedupe_key=dedupe_key,
+            )
+    except IntegrityError:
+        if dedupe_key is None:
+            raise
+        # The worker may have sent it since the insert failed, so don't filter on status
+        return OutboundEmail.objects.filter(dedupe_key=dedupe_key).latest('pk')
 
 def send_verification_email(user):
-    # Send the verification email
-    send_mail(
+    # Queue the verification email
+    uid = urlsafe_base64_encode(force_bytes(user.pk))
+    token = default_token_generator.make_token(user)
+    verification_link = f"{settings.FRONTEND_URL}{reverse('verify_email', kwargs={'uidb64': uid, 'token': token})}"
+    return queue_email(
         'Verify your email address',
-        'Click the link below to verify your email address.',
-        settings.DEFAULT_FROM_EMAIL,
-        [user.email],
-        fail_silently=False,
-    )
\ No newline at end of file
+        f'Click the link below to verify your email address.\n\n{verification_link}',
+        user.email,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        dedupe_key=f'verify:{user.pk}',
+    )
+
+def retry_delay(attempts):
+    """Seconds to wait before retrying a message that has failed ``attempts`` times."""
+    return min(settings.EMAIL_QUEUE_RETRY_DELAY * 2 ** (attempts - 1), settings.EMAIL_QUEUE_MAX_RETRY_DELAY)
+
+def claim_queued_emails(batch_size):
+    """
+    Mark up to ``batch_size`` due emails as sending and return them.
+
+    Rows are claimed with ``SKIP LOCKED`` in a short transaction of their
+    own, so several workers can run side by side without holding locks while
+    they talk to the mail server. Messages left sending for longer than
+    ``EMAIL_QUEUE_CLAIM_TIMEOUT`` seconds (a worker died mid-batch) are
+    claimed again.
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.EMAIL_QUEUE_CLAIM_TIMEOUT)
+    with transaction.atomic():
+        batch = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(Q(status=OutboundEmail.PENDING, next_attempt_at__lte=now)
+                    | Q(status=OutboundEmail.SENDING, claimed_at__lt=stale))
+            .order_by('next_attempt_at', 'pk')[:batch_size]
+        )
+        OutboundEmail.objects.filter(pk__in=[email.pk for email in batch]).update(
+            status=OutboundEmail.SENDING, claimed_at=now,
+        )
+    return batch
+
+def send_queued_emails(batch_size=100):
+    """
+    Send one batch of due emails over a single backend connection.
+
+    The batch is claimed by ``claim_queued_emails`` and each message's
+    outcome is saved as soon as it has been handed to the backend. A failed
+    message is retried with exponential backoff until it has been tried
+    ``EMAIL_QUEUE_MAX_ATTEMPTS`` times. Returns ``(sent, failed)`` counts for
+    the batch.
+    """
+    batch = claim_queued_emails(batch_size)
+    if not batch:
+        return 0, 0
+
+    sent = failed = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        opened, error = False, e
+    else:
+        opened, error = True, None
+
+    try:
+        for email in batch:
+            if opened:
+                started = time.perf_counter()
+                try:
+                    EmailMessage(
+                        email.subject, email.body, email.from_email or None, [email.to], connection=connection,
+                    ).send()
+                    error = None
+                except Exception as e:
+                    error = e
+                EMAIL_SEND_SECONDS.labels('sent' if error is None else 'failed').observe(time.perf_counter() - started)
+
+            now = timezone.now()
+            email.attempts += 1
+            if error is None:
+                email.status = OutboundEmail.SENT
+                email.sent_at = now
+                email.last_error = ''
+                sent += 1
+            else:
+                email.last_error = f'{type(error).__name__}: {error}'
+                if email.attempts >= settings.EMAIL_QUEUE_MAX_ATTEMPTS:
+                    email.status = OutboundEmail.FAILED
+                else:
+                    email.status = OutboundEmail.PENDING
+                    email.next_attempt_at = now + timedelta(seconds=retry_delay(email.attempts))
+                failed += 1
+            email.save(update_fields=['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'])
+    finally:
+        if opened:
+            connection.close()
+    return sent, failed
\ No newline at end of file
@@ -1,20 +1,21 @@
+from asgiref.sync import sync_to_async
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from django.contrib.auth import get_user_model, authenticate, login
 from django.contrib.auth.hashers import make_password
-from django.core.mail import send_mail
 from django.conf import settings
-from rest_framework_simplejwt.tokens import RefreshToken
+from shoply.async_views import AsyncAPIViewMixin
+from .authentication import ClaimsRefreshToken, get_full_user
 from django.contrib.auth.tokens import default_token_generator
 from django.core.exceptions import ValidationError
-from django.contrib.sites.shortcuts import get_current_site
-from django.utils.encoding import force_bytes, force_str
-from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
-from django.urls import reverse
+from django.utils.encoding import force_str
+from django.utils.http import urlsafe_base64_decode
 from .serializers import RegisterSerializer, UserProfileSerializer,\
      PasswordResetRequestSerializer, PasswordResetConfirmSerializer
+from .throttling import LOGIN_THROTTLES, PASSWORD_RESET_THROTTLES, REGISTER_THROTTLES
+from .utils import queue_email
 from rest_framework.views import APIView
 import re
 from django.views.decorators.csrf import csrf_exempt
@@ -27,7 +28,7 @@ class ChangePasswordView(APIView):
     permission_classes = [IsAuthenticated]
     
     def put(self, request):
-        user = request.user
+        user = get_full_user(request.user)
         old_password = request.data.get('old_password')
         new_password = request.data.get('new_password')
 
@@ -38,24 +39,6 @@ class ChangePasswordView(APIView):
         user.save()
         return Response({"message": "Password changed successfully."}, status=status.HTTP_200_OK)
 
-# Helper function for sending email verification
-def send_verification_email(request, user):
-    token = default_token_generator.make_token(user)
-    uid = urlsafe_base64_encode(force_bytes(user.pk))
-    verification_url = reverse('verify_email', kwargs={'uidb64': uid, 'token': token})
-
-    # Construct full URL
-    current_site = get_current_site(request)
-    verification_link = f"{settings.FRONTEND_URL}{verification_url}"
-
-    # Send email
-    send_mail(
-        'Verify Your Email Address',
-        f'Please click the following link to verify your email: {verification_link}',
-        'noreply@example.com',  # Your email
-        [user.email],
-    )
-
 # Helper function to validate password strength
 def validate_password_strength(password):
     if len(password) < 8:
@@ -72,25 +55,32 @@ class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = RegisterSerializer
     permission_classes = [AllowAny]
+    throttle_classes = REGISTER_THROTTLES
 
     def perform_create(self, serializer):
         password = serializer.validated_data.get('password')
         validate_password_strength(password)  # Validate password strength
-        user = serializer.save()
-        
-        # Send verification email after registration
-        send_verification_email(self.request, user)
+        # ✅ The post_save signal queues the verification email
+        serializer.save()
+
+# ✅ RegisterView for ASGI. Hashing is CPU-bound and the unique checks and inserts
+# are sync ORM, so they run together on the request's thread, off the event loop
+class AsyncRegisterView(AsyncAPIViewMixin, RegisterView):
+    async def post(self, request, *args, **kwargs):
+        return await sync_to_async(self.create)(request, *args, **kwargs)
 
 # Login View
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes(LOGIN_THROTTLES)  # ✅ Checked before authenticate() spends CPU on the hash
 def login_view(request):
     username = request.data.get('username')
     password = request.data.get('password')
     user = authenticate(request, username=username, password=password)
 
     if user is not None and user.is_verified and user.is_active:
-        refresh = RefreshToken.for_user(user)
+        # ✅ Tokens carry the claims ClaimsJWTAuthentication needs to skip the user query
+        refresh = ClaimsRefreshToken.for_user(user)
         return Response({
             "refresh": str(refresh),
             "access": str(refresh.access_token),
@@ -107,13 +97,13 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_object(self):
-        return self.request.user  # Get the currently logged-in user
+        return get_full_user(self.request.user)  # Get the currently logged-in user
 
 # Change Password View
 @api_view(['PUT'])
 @permission_classes([permissions.IsAuthenticated])
 def change_password(request):
-    user = request.user
+    user = get_full_user(request.user)
     old_password = request.data.get('old_password')
     new_password = request.data.get('new_password')
 
@@ -136,9 +126,11 @@ def send_password_reset_email(user, token):
     reset_link = f"{settings.FRONTEND_URL}/password-reset-confirm/?token={token}"
     subject = "Đặt lại mật khẩu của bạn"
     message = f"Nhấp vào liên kết sau để đặt lại mật khẩu của bạn: {reset_link}"
-    send_mail(subject, message, settings.EMAIL_HOST_USER, [user.email])
+    queue_email(subject, message, user.email, from_email=settings.EMAIL_HOST_USER, dedupe_key=f'password-reset:{user.pk}')
 
 class PasswordResetRequestView(APIView):
+    throttle_classes = PASSWORD_RESET_THROTTLES
+
     def post(self, request):
         serializer = PasswordResetRequestSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -154,6 +146,23 @@ class PasswordResetRequestView(APIView):
 
         return Response({"message": "Email đặt lại mật khẩu đã được gửi."}, status=status.HTTP_200_OK)
 
+# ✅ PasswordResetRequestView for ASGI
+class AsyncPasswordResetRequestView(AsyncAPIViewMixin, PasswordResetRequestView):
+    async def post(self, request):
+        serializer = PasswordResetRequestSerializer(data=request.data)
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        email = serializer.validated_data['email']
+
+        try:
+            user = await User.objects.aget(email=email)
+        except User.DoesNotExist:
+            return Response({"error": "Email không tồn tại trong hệ thống."}, status=status.HTTP_400_BAD_REQUEST)
+
+        token = generate_password_reset_token(user)
+        await sync_to_async(send_password_reset_email)(user, token)
+
+        return Response({"message": "Email đặt lại mật khẩu đã được gửi."}, status=status.HTTP_200_OK)
+
 class PasswordResetConfirmView(APIView):
     def post(self, request, token):
         email = request.data.get('email')
@@ -206,8 +215,8 @@ def logout(request):
         if not refresh_token:
             return Response({"error": "Refresh token is required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        token = RefreshToken(refresh_token)
-        token.blacklist()  # Blacklist the refresh token
+        token = ClaimsRefreshToken(refresh_token)
+        token.blacklist()  # Blacklist the refresh token (and its access tokens)
         return Response({"message": "Successfully logged out"}, status=status.HTTP_205_RESET_CONTENT)
 
     except Exception as e: